@@ -0,0 +1,6 @@
+"""
+Runs the benchmark suite (see: benchmark.suite)
+"""
+from .suite import main
+
+main()
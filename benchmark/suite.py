@@ -0,0 +1,251 @@
+"""
+Module, defining a benchmark suite timing each stage of generating a mold's
+parts, over synthetic models & parts descriptions of increasing size
+
+Each stage (loading the Mesh, the first get_corner, make_part,
+generateParts, parts_to_string & save) is timed separately, so a change in
+one stage's scaling shows up on its own. Results are saved as JSON, which
+can be compared against a previous run's.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import time
+
+import numpy
+
+from calculator.Mesh import Mesh
+from calculator.calculator import Calculator
+from . import synthetic
+
+DEFAULT_VERTEX_COUNTS = (10**3, 10**4, 10**5)
+DEFAULT_PART_COUNTS = (10, 100, 1000)
+""" model sizes benchmarked by default (a few minutes in all) """
+
+FULL_VERTEX_COUNTS = (10**3, 10**4, 10**5, 10**6, 10**7)
+FULL_PART_COUNTS = (10, 100, 1000, 10**4)
+""" model sizes benchmarked with --full """
+
+MAKE_PART_SAMPLES = len(synthetic.PART_TEMPLATES)
+""" number of parts make_part is timed on, in each case """
+
+STAGES = ('Mesh.__init__', 'Mesh.__init__ (read-only)', 'get_corner', 'make_part'
+          ,'generateParts', 'parts_to_string', 'save')
+""" names of the timed stages, in the order they are run """
+
+def time_call(function, setup=None, repeat=3):
+    """
+    Returns dict of the min & mean seconds of repeat calls of function
+
+    setup -- (optional) function called before each timed call (untimed);
+      its return value is passed to function
+
+    >>> timing = time_call(lambda value: sum(range(value)), lambda: 1000, repeat=2)
+    >>> sorted(timing), timing['repeat'], timing['min_s'] <= timing['mean_s']
+    (['mean_s', 'min_s', 'repeat'], 2, True)
+    """
+    seconds = []
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        function(*args)
+        seconds.append(time.perf_counter() - start)
+    return {'min_s': min(seconds), 'mean_s': statistics.mean(seconds), 'repeat': repeat}
+
+def cases(vertex_counts, part_counts):
+    """
+    Returns list of (vertex count, part count) tuples to benchmark: every
+    vertex count with the fewest parts, & every part count with the fewest
+    vertices (so each sweep varies one size only)
+
+    >>> cases([10, 100], [1, 5])
+    [(10, 1), (100, 1), (10, 5)]
+    """
+    vertex_counts, part_counts = sorted(vertex_counts), sorted(part_counts)
+    pairs = [(vertex_count, part_counts[0]) for vertex_count in vertex_counts]
+    pairs += [(vertex_counts[0], part_count) for part_count in part_counts[1:]]
+    return pairs
+
+def run_case(directory, vertex_count, part_count, repeat=3, seed=0):
+    """
+    Returns dict of the timings of each of STAGES, for a synthetic model of
+    vertex_count vertices & part_count parts (saved in directory)
+
+    >>> with TemporaryDirectory() as directory:
+    ...    timings = run_case(directory, 100, 2, repeat=1)
+    >>> list(timings) == list(STAGES)
+    True
+    """
+    name = os.path.join(directory, 'box-{}-{}'.format(vertex_count, part_count))
+    mesh_path = name + '.dae'
+    synthetic.write_mesh(mesh_path, vertex_count, seed)
+    synthetic.write_directions(name + '.py', part_count)
+    timings = {}
+    timings['Mesh.__init__'] = time_call(lambda: Mesh(mesh_path), repeat=repeat)
+    timings['Mesh.__init__ (read-only)'] = time_call(
+        lambda: Mesh(mesh_path, writable=False), repeat=repeat)
+    calculator = Calculator(mesh_path)
+    def cold_bounds():
+        calculator.invalidate_bounds()
+        return calculator
+    timings['get_corner'] = time_call(lambda mesh: mesh.get_corner([1, 1, 1])
+                                      ,cold_bounds, repeat)
+    samples = [arguments for name, arguments in calculator.directions[:MAKE_PART_SAMPLES]]
+    timing = time_call(lambda: [calculator.make_part(**arguments) for arguments in samples]
+                       ,repeat=repeat)
+    # (per make_part call)
+    timings['make_part'] = dict(timing, min_s=timing['min_s']/len(samples)
+                                ,mean_s=timing['mean_s']/len(samples))
+    def no_parts():
+        calculator.forget_parts()
+        return calculator
+    timings['generateParts'] = time_call(lambda mesh: mesh.generateParts(), no_parts, repeat)
+    timings['parts_to_string'] = time_call(lambda mesh: mesh.parts_to_string()
+                                           ,lambda: calculator, repeat)
+    def fresh_calculator():
+        # (save modifies the loaded model, so each save needs a fresh one)
+        fresh = Calculator(mesh_path)
+        fresh.generateParts()
+        return fresh
+    def save(mesh):
+        with redirect_stdout(io.StringIO()):
+            mesh.save(name + '.out.dae')
+    timings['save'] = time_call(save, fresh_calculator, repeat)
+    return timings
+
+def run(vertex_counts=DEFAULT_VERTEX_COUNTS, part_counts=DEFAULT_PART_COUNTS, repeat=3
+        ,directory=None, progress=None):
+    """
+    Returns dict of benchmark results, ready to be saved as JSON: the
+    environment, & the timings of each of the cases (see: cases, run_case)
+
+    directory -- (optional) directory to keep the synthetic models in
+      (default: a temporary directory, removed afterwards)
+    progress -- (optional) function called with each case's result, as it
+      completes
+
+    >>> results = run([100], [2], repeat=1)
+    >>> [(case['vertices'], case['parts']) for case in results['cases']]
+    [(100, 2)]
+    """
+    results = {'created': datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+               ,'python': platform.python_version()
+               ,'numpy': numpy.__version__
+               ,'platform': platform.platform()
+               ,'repeat': repeat
+               ,'cases': []}
+    with TemporaryDirectory() as temporary_directory:
+        if directory is None:
+            directory = temporary_directory
+        os.makedirs(directory, exist_ok=True)
+        for vertex_count, part_count in cases(vertex_counts, part_counts):
+            case = {'vertices': vertex_count, 'parts': part_count
+                    ,'timings': run_case(directory, vertex_count, part_count, repeat)}
+            results['cases'].append(case)
+            if progress is not None:
+                progress(case)
+    return results
+
+def case_lines(case):
+    """
+    Yields lines of a human-readable summary of one case's timings
+
+    >>> case = {'vertices': 1000, 'parts': 10
+    ...         ,'timings': {'save': {'min_s': 0.25, 'mean_s': 0.5, 'repeat': 3}}}
+    >>> print('\\n'.join(case_lines(case)))
+    ## 1000 vertices, 10 parts
+     * save: 250.000 ms (mean 500.000 ms)
+    """
+    yield '## {} vertices, {} parts'.format(case['vertices'], case['parts'])
+    for stage, timing in case['timings'].items():
+        yield ' * {}: {:.3f} ms (mean {:.3f} ms)'.format(
+            stage, 1000*timing['min_s'], 1000*timing['mean_s'])
+
+def comparison_lines(baseline, results):
+    """
+    Yields lines comparing the min timings of results with those of the
+    same cases & stages in baseline (a previous run's results)
+
+    >>> def results(seconds):
+    ...    return {'cases': [{'vertices': 1000, 'parts': 10
+    ...                       ,'timings': {'save': {'min_s': seconds}}}]}
+    >>> print('\\n'.join(comparison_lines(results(0.5), results(0.25))))
+    # Comparison with baseline
+     * 1000 vertices, 10 parts, save: 500.000 ms -> 250.000 ms (x0.50)
+    """
+    yield '# Comparison with baseline'
+    baseline_cases = {(case['vertices'], case['parts']): case['timings']
+                      for case in baseline['cases']}
+    for case in results['cases']:
+        baseline_timings = baseline_cases.get((case['vertices'], case['parts']), {})
+        for stage, timing in case['timings'].items():
+            if stage not in baseline_timings:
+                continue
+            before_s, after_s = baseline_timings[stage]['min_s'], timing['min_s']
+            yield ' * {} vertices, {} parts, {}: {:.3f} ms -> {:.3f} ms (x{:.2f})'.format(
+                case['vertices'], case['parts'], stage, 1000*before_s, 1000*after_s
+                ,after_s / before_s if before_s else float('inf'))
+
+def counts(text):
+    """
+    Returns list of ints, from comma-separated text (e.g. "1e3,10000")
+
+    >>> counts('1e3,10000')
+    [1000, 10000]
+    """
+    return [int(float(value)) for value in text.split(',')]
+
+def main(argv=None):
+    """ runs the benchmark suite, from command line arguments argv """
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description=
+        "Times each stage of generating parts, for synthetic models of \
+        increasing size.")
+    parser.add_argument("--vertices", help="(optional) comma-separated \
+        vertex counts of the models, e.g. 1e3,1e5", type=counts)
+    parser.add_argument("--parts", help="(optional) comma-separated part \
+        counts of the parts descriptions, e.g. 10,1000", type=counts)
+    parser.add_argument("--full", help="(optional) benchmark models of up \
+        to 10^7 vertices & 10^4 parts (slow)", action='store_true')
+    parser.add_argument("--repeat", help="(optional) number of times each \
+        stage is timed (default: 3)", type=int, default=3)
+    parser.add_argument("--out", help="(optional) file path to save the \
+        results to, as JSON", default='benchmark.json')
+    parser.add_argument("--baseline", help="(optional) results of a previous \
+        run (JSON) to compare the timings with")
+    parser.add_argument("--models-dir", help="(optional) directory to keep \
+        the generated models in (default: removed after the run)")
+    args = parser.parse_args(argv)
+    vertex_counts = args.vertices or (FULL_VERTEX_COUNTS if args.full else DEFAULT_VERTEX_COUNTS)
+    part_counts = args.parts or (FULL_PART_COUNTS if args.full else DEFAULT_PART_COUNTS)
+    print('# Benchmark')
+    results = run(vertex_counts, part_counts, args.repeat, args.models_dir
+                  ,progress=lambda case: print('\n'.join(case_lines(case)), flush=True))
+    with open(args.out, 'w') as out:
+        json.dump(results, out, indent=2)
+    print('Saved: {}'.format(args.out))
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            print('\n'.join(comparison_lines(json.load(baseline_file), results)))
@@ -0,0 +1,188 @@
+"""
+Module, defining generators of synthetic COLLADA models & parts descriptions
+of any size, for benchmarking
+
+Every model is a box the size of test/cube_flipped.dae (in mm), filled with
+as many random vertices as asked for, so the parts description templates
+of that model fit it. Files are written incrementally, so models larger
+than memory can be generated.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from pprint import pformat
+
+import numpy
+
+from calculator.vertexstore import iter_chunks
+
+BOX_MM = (577.0, 271.6, 112.1)
+""" x,y,z size of the generated models, in mm (their COLLADA unit) """
+
+CHUNK_ROWS = 64 * 1024
+""" number of vertices generated & written at once """
+
+HEADER = '''<?xml version="1.0" encoding="utf-8"?>
+<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">
+  <asset>
+    <unit meter="0.001" name="millimeter"/>
+    <up_axis>Z_UP</up_axis>
+  </asset>
+  <library_geometries>
+    <geometry id="geometry0" name="box">
+      <mesh>
+        <source id="box-positions">
+          <float_array id="box-positions-array" count="{float_count}">'''
+
+SOURCE_END = '''</float_array>
+          <technique_common>
+            <accessor source="#box-positions-array" count="{vertex_count}" stride="3">
+              <param name="X" type="float"/>
+              <param name="Y" type="float"/>
+              <param name="Z" type="float"/>
+            </accessor>
+          </technique_common>
+        </source>
+        <vertices id="box-vertices">
+          <input semantic="POSITION" source="#box-positions"/>
+        </vertices>
+        <triangles count="{triangle_count}">
+          <input offset="0" semantic="VERTEX" source="#box-vertices"/>
+          <p>'''
+
+FOOTER = '''</p>
+        </triangles>
+      </mesh>
+    </geometry>
+  </library_geometries>
+  <library_visual_scenes>
+    <visual_scene id="scene0">
+      <node id="model" name="model">
+        <node id="box" name="box">
+          <matrix>1 0 0 0 0 1 0 0 0 0 1 0 0 0 0 1</matrix>
+          <instance_geometry url="#geometry0"/>
+        </node>
+      </node>
+    </visual_scene>
+  </library_visual_scenes>
+  <scene>
+    <instance_visual_scene url="#scene0"/>
+  </scene>
+</COLLADA>
+'''
+
+PART_TEMPLATES = [
+    ("Bottom", { "start_edge": ([-1,1,1],[-1,1,-1])
+                ,"end_edge": ([-1,-1,1],[-1,-1,-1])
+                ,"part_plane": (1,2)
+                ,"shrink_edges": {"left": 'joint-default', "right": 'joint-default'
+                                  ,"bottom": 'joint-default'}
+                ,"shrink_axis": 1
+                ,"thickness_direction_negative": False})
+    ,("Top", { "start_edge": ([1,1,1],[1,1,-1])
+              ,"end_edge": ([1,-1,1],[1,-1,-1])
+              ,"part_plane": (1,2)
+              ,"shrink_edges": {"left": 148.9, "right": 134.1}
+              ,"shrink_axis": 1})
+    ,("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+               ,"end_edge": ([1,1,1],[1,1,-1])
+               ,"part_plane": (0,2)
+               ,"shrink_edges": {"bottom": 'joint-default'}
+               ,"shrink_axis": 0})
+    ,("Right", { "start_edge": ([-1,-1,1],[-1,-1,-1])
+                ,"end_edge": ([1,-1,1],[1,-1,-1])
+                ,"part_plane": (0,2)
+                ,"shrink_edges": {'left': 106.3, 'right': 129.4}
+                ,"shrink_axis": 0
+                ,"thickness_direction_negative": False})
+    ,("Back", { "start_edge": ([1,-1,-1],[-1,-1,-1])
+               ,"end_edge": ([1,1,-1],[-1,1,-1])
+               ,"part_plane": (0,1)
+               ,"shrink_edges": {"right": 252.9}
+               ,"shrink_axis": 1
+               ,"subtract_parts": [{ "start_edge": ([1,-1,-1],[-1,-1,-1])
+                                    ,"end_edge": ([1,1,-1],[-1,1,-1])
+                                    ,"part_plane": (0,1)
+                                    ,"shrink_edges": { "right": 378.7
+                                                      ,"top": 129.4
+                                                      ,"bottom": 106.3}
+                                    ,"shrink_axis": 1
+                                    ,"thickness_direction_negative": False}]
+               ,"thickness_direction_negative": False})
+]
+""" (name, make_part arguments) of parts that fit the generated box """
+
+def write_mesh(file_path, vertex_count, seed=0):
+    """
+    Saves a COLLADA model of a box, with vertex_count vertices (at least 8)
+
+    The box corners are the first 8 vertices; the rest are random points
+    inside it. Consecutive triples of vertices make up the triangles.
+
+    >>> from tempfile import TemporaryDirectory
+    >>> from calculator.Mesh import Mesh
+    >>> with TemporaryDirectory() as directory:
+    ...    write_mesh(directory + '/box.dae', 1000)
+    ...    mesh = Mesh(directory + '/box.dae')
+    >>> mesh.bounds().tolist(), mesh.ratio_mm_per_unit()
+    ([[0.0, 0.0, 0.0], [577.0, 271.6000061035156, 112.0999984741211]], 1.0)
+    """
+    vertex_count = max(8, int(vertex_count))
+    box = numpy.array(BOX_MM)
+    random = numpy.random.default_rng(seed)
+    triangle_count = vertex_count // 3
+    with open(file_path, 'w', encoding='utf-8') as out:
+        out.write(HEADER.format(float_count=3*vertex_count))
+        corners = numpy.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)]) * box
+        out.write(' '.join(map(repr, corners.ravel().tolist())))
+        for chunk in iter_chunks(range(vertex_count - 8), CHUNK_ROWS):
+            points = random.random((len(chunk), 3)) * box
+            out.write(' ' + ' '.join(map(repr, points.round(3).ravel().tolist())))
+        out.write(SOURCE_END.format(vertex_count=vertex_count, triangle_count=triangle_count))
+        for chunk in iter_chunks(range(3*triangle_count), 3*CHUNK_ROWS):
+            out.write((' ' if chunk.start else '') + ' '.join(map(str, chunk)))
+        out.write(FOOTER)
+
+def directions(part_count):
+    """
+    Returns list of part_count (name, make_part arguments) tuples, cycling
+    through PART_TEMPLATES
+
+    >>> [name for name, arguments in directions(6)]
+    ['Bottom-1', 'Top-2', 'Left-3', 'Right-4', 'Back-5', 'Bottom-6']
+    """
+    return [('{}-{}'.format(name, index+1), arguments)
+            for index, (name, arguments)
+            in enumerate(PART_TEMPLATES[index % len(PART_TEMPLATES)]
+                         for index in range(int(part_count)))]
+
+def write_directions(file_path, part_count):
+    """
+    Saves a parts description (.py) file of part_count parts (see: directions)
+
+    >>> from tempfile import TemporaryDirectory
+    >>> from ast import literal_eval
+    >>> with TemporaryDirectory() as directory:
+    ...    write_directions(directory + '/box.py', 3)
+    ...    with open(directory + '/box.py') as parts_file:
+    ...        len(literal_eval(parts_file.read()))
+    3
+    """
+    with open(file_path, 'w', encoding='utf-8') as out:
+        out.write('# Simple Python module defining an anonymous list of mold parts\n\n')
+        out.write(pformat(directions(part_count)))
+        out.write('\n')
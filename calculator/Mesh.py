@@ -17,6 +17,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+from collections import namedtuple
 from collada import Collada
 from collada.lineset import LineSet
 from collada.source import InputList
@@ -24,6 +25,12 @@ from collada.source import FloatSource
 import numpy
 import uuid
 import math
+import os
+
+from . import loader
+from . import overlay
+from . import profiling
+from . import vertexstore
 
 from collada import material
 from collada.geometry import Geometry
@@ -32,10 +39,98 @@ from collada.scene import GeometryNode
 from collada.scene import Node
 from collada.scene import Scene, MatrixTransform
 
+Component = namedtuple('Component', ['geometry_id', 'matrix', 'bounds'])
+Component.__doc__ = """
+one placement of a <geometry/> in the COLLADA scene, as indexed by Mesh
+
+geometry_id -- id of the <geometry/>
+matrix -- 4x4 numpy array transforming the geometry's vertex coordinates into
+  model coordinates (those relative to the first scene transform, see:
+  Mesh.transform_matrix), or None if they are model coordinates already
+bounds -- 2x3 numpy array, the minimum & maximum model x,y,z coordinates of
+  the placed geometry (see: Mesh.bounds)
+"""
+
 class Mesh:
-    def __init__(self, file_path):
-        self.mesh = Collada( file_path)
+    def __init__(self, file_path, writable=True, cache=None):
+        """
+        Load a COLLADA mesh
+
+        Keyword arguments:
+        writable -- if False, only the geometry data needed for measuring the
+          model is loaded (by the faster calculator.loader) instead of the
+          full pycollada document, which then cannot be modified or saved.
+          Its vertices are memory-mapped, rather than read into memory (see:
+          calculator.loader.load).
+        cache -- (optional) calculator.cache.MeshCache, to read that geometry
+          data from (if the file is unchanged since it was cached) instead of
+          parsing the file. Only used when not writable.
+
+        >>> t = Mesh('test/cube_flipped.dae', writable=False)
+        >>> t.mesh is None, t.ratio_mm_per_unit()
+        (True, 25.4)
+        >>> bool((t.bounds() == Mesh('test/cube_flipped.dae').bounds()).all())
+        True
+        >>> from tempfile import TemporaryDirectory
+        >>> from calculator.cache import MeshCache
+        >>> with TemporaryDirectory() as directory:
+        ...    t = Mesh('test/cube_flipped.dae', writable=False, cache=MeshCache(directory))
+        ...    t = Mesh('test/cube_flipped.dae', writable=False, cache=MeshCache(directory))
+        >>> [round(float(c), 3) for c in t.get_corner([1,-1,1])]
+        [0.0, -10.694, 4.413]
+        """
+        self.mesh = None
+        # pycollada document (None, when not writable)
+        self.mesh_data = None
+        # calculator.loader.MeshData (None, when writable)
+        if writable:
+            with profiling.span('mesh.parse'):
+                self.mesh = Collada( file_path)
+        elif cache is not None:
+            with profiling.span('mesh.cache_load'):
+                self.mesh_data = cache.load(file_path)
+        else:
+            with profiling.span('mesh.load'):
+                self.mesh_data = loader.load(file_path)
+        self._components = None
+        # list of Components, indexing each geometry placed in the scene
+        # (computed on first use, see: components)
+        self._bounds = None
+        # 2x3 numpy array of the minimum & maximum x,y,z vertex coordinates
+        # (computed on first use, see: bounds)
+        self._transform_matrix = None
+        # 4x4 numpy array of the first scene transform (see: transform_matrix)
+        self._ratio_mm_per_unit = None
+        self._model_transforms = None
+        # scene transforms create_lines emptied (restored by remove_lines)
+        self._line_geometries = []
+        # Geometries create_lines added (not part of the model, see: components)
         
+    def __getstate__(self):
+        """ returns the state to pickle, e.g. for sending to a worker process
+
+        Only the cached bounds index, transform & unit ratio of the model are kept,
+        not the pycollada document, so an unpickled Mesh can answer corner &
+        distance lookups but cannot be modified or saved.
+
+        >>> import pickle
+        >>> t = pickle.loads(pickle.dumps(Mesh('test/cube_flipped.dae')))
+        >>> t.mesh is None, t.ratio_mm_per_unit()
+        (True, 25.4)
+        >>> [round(float(c), 3) for c in t.get_corner([1,-1,1])]
+        [0.0, -10.694, 4.413]
+        """
+        self.components()
+        self.bounds()
+        self.transform_matrix()
+        self.ratio_mm_per_unit()
+        state = self.__dict__.copy()
+        state['mesh'] = None
+        state['mesh_data'] = None
+        state['_model_transforms'] = None
+        state['_line_geometries'] = []
+        return state
+
     def geometry(self):
         """ returns data contained in the COLLADA <geometry/> tag 
         per:
@@ -61,9 +156,44 @@ class Mesh:
         >>> t.ratio_mm_per_unit()
         25.4
         """
-        mm_per_meter = 1000
-        meter_per_unit= self.mesh.assetInfo.unitmeter#SI meter per COLLADA unit
-        return meter_per_unit * mm_per_meter
+        if self._ratio_mm_per_unit is None:
+            mm_per_meter = 1000
+            meter_per_unit = self.unitmeter()
+            self._ratio_mm_per_unit = meter_per_unit * mm_per_meter
+        return self._ratio_mm_per_unit
+
+    def unitmeter(self):
+        """ returns SI meters per COLLADA unit, in this Mesh """
+        if self.mesh is None:
+            return self.mesh_data.unitmeter
+        return self.mesh.assetInfo.unitmeter
+
+    def up_axis(self):
+        """ returns the COLLADA <up_axis/> of this Mesh
+
+        >>> Mesh('test/cube.dae').up_axis()
+        'Z_UP'
+        """
+        if self.mesh is None:
+            return self.mesh_data.up_axis
+        return self.mesh.assetInfo.upaxis
+
+    def reference_nodes(self):
+        """ returns list of (node id, 4x4 numpy array) tuples: the scene nodes
+        another COLLADA file can instance, to show this whole model (see:
+        calculator.loader.scene_reference_nodes)
+
+        >>> [node_id for node_id, matrix in Mesh('test/cube_flipped.dae').reference_nodes()]
+        ['ID2']
+        """
+        if self.mesh is None:
+            return self.mesh_data.reference_nodes
+        if self.mesh.scene is None:
+            return []
+        return loader.scene_reference_nodes(
+            [(node.id, node.matrix, [(child.id, None, None) for child in node.children
+                                     if isinstance(child, Node)])
+             for node in self.mesh.scene.nodes])
 
     def getFirstTransformOfFirstScene(self):
         """ returns 4x4 numpy array,representing transform of first scene
@@ -84,12 +214,31 @@ class Mesh:
                [ 0.000000e+00,  0.000000e+00,  0.000000e+00,  1.000000e+00]],
               dtype=float32)
         """
+        if self.mesh is None:
+            return MatrixTransform(numpy.ravel(self.mesh_data.transform_matrix))
         geometry_node_of_scene = self.visual_scene().nodes[0].children[0]
         if isinstance(geometry_node_of_scene, Node):
             return geometry_node_of_scene.transforms[0]
         #else, no transform: generate an Identity MatrixTransform
         matrix_4x4 = numpy.identity(4)
         return MatrixTransform(numpy.ravel( matrix_4x4))
+
+    def transform_matrix(self):
+        """ returns 4x4 numpy array, the matrix of getFirstTransformOfFirstScene
+
+        The matrix is looked up once & then reused. (create_lines empties the
+        scene transforms of the document being written, but coordinates of the
+        loaded model remain relative to this original transform)
+
+        >>> t = Mesh('test/cube.dae')
+        >>> t.transform_matrix().tolist() == numpy.identity(4).tolist()
+        True
+        >>> t.transform_matrix() is t.transform_matrix()
+        True
+        """
+        if self._transform_matrix is None:
+            self._transform_matrix = self.getFirstTransformOfFirstScene().matrix
+        return self._transform_matrix
         
     def primitives(self):
         """ returns a list of primitive sets specified in the <geometry/>
@@ -160,10 +309,17 @@ class Mesh:
         
     def create_lines(self, list_vert_floats):
         """ adds a new Node representing the geometry of a line to the COLLADA 
-        scene """
+        scene
+
+        list_vert_floats -- (M,3) array-like of line segment endpoint coords
+          (a float64 numpy array is used as-is, without copying)
+
+        Returns the new Node (see: remove_lines)
+        """
         node_uuid = uuid.uuid1()
-        vert_src = FloatSource("cubeverts-array", numpy.array(list_vert_floats)
-                                                , ('X', 'Y', 'Z'))
+        vert_src = FloatSource("cubeverts-array"
+                               ,numpy.asarray(list_vert_floats, dtype=numpy.float64)
+                               ,('X', 'Y', 'Z'))
         geom = Geometry(self.mesh, "geometry0", "line", [vert_src])
         # InputList will consist of one item, a set of vertices
         input_list = InputList()
@@ -177,8 +333,12 @@ class Mesh:
         lineset = geom.createLineSet( indices, input_list, "materialref")
         geom.primitives.append( lineset)
         self.mesh.geometries.append(geom)
+        self._line_geometries.append(geom)
         # Add lines to COLLADA scene as a transformed Node /w geometry
+        # (the bounds index stays valid: it leaves out these lines)
         existing_scene_transforms = self.mesh.scene.nodes[0].children[0].transforms
+        if existing_scene_transforms:
+            self._model_transforms = existing_scene_transforms
         self.mesh.scene.nodes[0].children[0].transforms = []
         # build + add no
         mat_list = []
@@ -186,9 +346,191 @@ class Mesh:
         node = Node("node0", children=[geomnode])
         #node.transforms.append(existing_scene_transforms[0])
         self.mesh.scene.nodes.append( node)
-        pass
+        return node
+
+    def remove_lines(self, node):
+        """ removes a Node added by create_lines, & its geometry, from the
+        COLLADA scene
+
+        (the scene transforms create_lines emptied are restored, so corners
+        are found in the model as loaded again)
+
+        >>> from tempfile import TemporaryDirectory
+        >>> t = Mesh('test/cube_flipped.dae')
+        >>> counts = len(t.mesh.geometries), len(t.mesh.scene.nodes)
+        >>> corner = [round(float(c), 3) for c in t.get_corner([1,-1,1])]
+        >>> with TemporaryDirectory() as directory:
+        ...    t.save_lines(directory + '/out.dae', [[0,0,0], [1,0,0]], keep_lines=False)
+        >>> (len(t.mesh.geometries), len(t.mesh.scene.nodes)) == counts
+        True
+        >>> [round(float(c), 3) for c in t.get_corner([1,-1,1])] == corner
+        True
+        """
+        self.mesh.scene.nodes.remove(node)
+        for geometry_node in node.children:
+            # (by position: pycollada's IndexedList.remove fails on objects)
+            index = [geometry is geometry_node.geometry
+                     for geometry in self.mesh.geometries].index(True)
+            self.mesh.geometries.pop(index)
+            self._line_geometries = [geometry for geometry in self._line_geometries
+                                     if geometry is not geometry_node.geometry]
+        if self._model_transforms is not None:
+            model_node = self.mesh.scene.nodes[0].children[0]
+            model_node.transforms = self._model_transforms
+            model_node.save() # (recomputes its matrix)
+
+    def bounds(self, component=None):
+        """ returns a 2x3 numpy array, the minimum (row 0) & maximum (row 1)
+        x,y,z coordinates found among the vertices of every geometry placed in
+        the scene (see: components).
+
+        component -- (optional) geometry id: return the bounds of only the
+          placements of that <geometry/>
+
+        Bounds are computed once & then reused, until invalidate_bounds is
+        called. (Vertices are read in chunks, so memory-mapped vertex arrays
+        are never loaded into memory whole, see: calculator.vertexstore)
+
+        >>> t = Mesh('test/cube.dae')
+        >>> t.bounds().astype(float).round(3).tolist()
+        [[-22.715, -10.694, 0.0], [0.0, 0.0, 4.413]]
+        >>> t.bounds() is t.bounds()
+        True
+        >>> t = Mesh('test/cube_flipped.dae') # cube, + a geometry per edge
+        >>> t.bounds('ID12').astype(float).round(3).tolist()
+        [[-22.715, -10.694, 0.0], [-22.715, 0.0, 0.0]]
+        >>> t.bounds('ID0')
+        Traceback (most recent call last):
+           ...
+        KeyError: 'No geometry ID0 placed in the scene!'
+        """
+        if component is not None:
+            component_bounds = [c.bounds for c in self.components()
+                                if c.geometry_id == component]
+            if not component_bounds:
+                raise KeyError('No geometry {} placed in the scene!'.format(component))
+            return numpy.array([numpy.min([b[0] for b in component_bounds], axis=0)
+                               ,numpy.max([b[1] for b in component_bounds], axis=0)])
+        if self._bounds is None:
+            component_bounds = [c.bounds for c in self.components()]
+            if not component_bounds:
+                raise Exception("No vertices found in the mesh geometry!")
+            self._bounds = numpy.array([numpy.min([b[0] for b in component_bounds], axis=0)
+                                       ,numpy.max([b[1] for b in component_bounds], axis=0)])
+        return self._bounds
+
+    def components(self):
+        """ returns list of Components: the bounds index of every geometry
+        placed in the scene, in model coordinates.
+
+        Each geometry's vertices are only read once, however many times it is
+        placed: placements whose transform only scales, flips or swaps axes
+        reuse the geometry's bounds, any other placement is transformed vertex
+        by vertex. The index is then reused, until invalidate_bounds is called.
+
+        Lines added by create_lines are left out, & placements are indexed
+        with the scene transforms of the model as loaded (see:
+        geometry_instances), so saving lines doesn't change the index.
+
+        >>> [(c.geometry_id, c.matrix) for c in Mesh('test/cube.dae').components()]
+        [('ID2', None)]
+        >>> components = Mesh('test/cube_flipped.dae').components()
+        >>> len(components), components[1].geometry_id
+        (13, 'ID12')
+        >>> from tempfile import TemporaryDirectory
+        >>> t = Mesh('test/cube_flipped.dae')
+        >>> bounds = t.bounds().tolist()
+        >>> with TemporaryDirectory() as directory:
+        ...    t.save_lines(directory + '/out.dae', [[0,0,0], [1,0,0]])
+        >>> t.invalidate_bounds()
+        >>> len(t.components()), t.bounds().tolist() == bounds
+        (13, True)
+        """
+        if self._components is None:
+            with profiling.span('mesh.bounds_index'):
+                model_matrix = numpy.asarray(self.transform_matrix(), dtype=numpy.float64)
+                geometry_bounds = {} # bounds of vertex coordinates, by geometry id
+                self._components = []
+                for geometry_id, vertex_arrays, world_matrix in self.geometry_instances():
+                    if geometry_id not in geometry_bounds:
+                        geometry_bounds[geometry_id] = vertexstore.array_bounds(vertex_arrays)
+                    local_bounds = geometry_bounds[geometry_id]
+                    if local_bounds is None:
+                        continue # no vertices
+                    if numpy.array_equal(world_matrix, model_matrix):
+                        matrix, bounds = None, local_bounds # (the usual case)
+                    else:
+                        matrix = numpy.linalg.solve(model_matrix, world_matrix)
+                        if is_axis_aligned(matrix):
+                            bounds = vertexstore.transform_bounds(local_bounds, matrix)
+                        else:
+                            bounds = vertexstore.array_bounds(vertex_arrays, matrix=matrix)
+                    self._components.append(Component(geometry_id, matrix, bounds))
+        return self._components
+
+    def geometry_instances(self):
+        """ returns list of (geometry id, vertex arrays, world matrix) tuples
+        for each placement of a <geometry/> in the scene: the (N,3) numpy
+        vertex coordinates of each of its primitive sets & the 4x4 numpy array
+        transforming them into scene coordinates.
+
+        (vertex arrays may be memory-mapped, when the mesh was loaded from a
+        cache. If the scene places no geometry, every geometry is used as-is.
+        Geometries create_lines added are left out, & the scene transforms it
+        emptied are used)
 
-    def get_corner(self, list_directional):
+        >>> [(geometry_id, len(vertex_arrays)) for geometry_id, vertex_arrays, matrix
+        ...  in Mesh('test/cube.dae').geometry_instances()]
+        [('ID2', 2)]
+        """
+        if self.mesh is None:
+            vertex_arrays = {geometry_id: [positions for positions, indices in primitives]
+                             for geometry_id, primitives in self.mesh_data.geometries}
+            instances = [(geometry_id, vertex_arrays[geometry_id], matrix)
+                         for geometry_id, matrix in self.mesh_data.instances
+                         if geometry_id in vertex_arrays]
+        elif self.mesh.scene is not None:
+            model_node = self.mesh.scene.nodes[0].children[0]
+            emptied = self._model_transforms is not None and not model_node.transforms
+            if emptied: # (by create_lines: place the model as loaded, meanwhile)
+                model_node.transforms = self._model_transforms
+                model_node.save()
+            try:
+                instances = [(bound.original.id
+                             ,[primitive.vertex for primitive in bound.original.primitives]
+                             ,bound.matrix)
+                             for bound in self.mesh.scene.objects('geometry')
+                             if not self.is_line_geometry(bound.original)]
+            finally:
+                if emptied:
+                    model_node.transforms = []
+                    model_node.save()
+        else:
+            instances = []
+        if instances:
+            return instances
+        if self.mesh is None:
+            return [(geometry_id, vertex_arrays[geometry_id], numpy.identity(4))
+                    for geometry_id, primitives in self.mesh_data.geometries]
+        return [(geometry.id, [primitive.vertex for primitive in geometry.primitives]
+                 ,numpy.identity(4)) for geometry in self.mesh.geometries
+                if not self.is_line_geometry(geometry)]
+
+    def is_line_geometry(self, geometry):
+        """ returns True if pycollada Geometry geometry was added by
+        create_lines (rather than loaded with the model) """
+        return any(geometry is line_geometry for line_geometry in self._line_geometries)
+
+    def invalidate_bounds(self):
+        """ discards the cached bounds & bounds index, so they are recomputed
+        on next use.
+
+        (must be called, whenever the mesh geometry is modified)
+        """
+        self._components = None
+        self._bounds = None
+
+    def get_corner(self, list_directional, component=None):
         """ returns one of the six vertices of a rectangular poly that encloses
          the imported model. Which vertex is determined by parameter 
         list_directional
@@ -196,47 +538,92 @@ class Mesh:
             directional vector extending from the origin. (eg: [-1,-1, ] 
             indicates the top-most, vertex in the south-west quadrant should be
             returned.
+        component -- (optional) geometry id: return a corner of the poly that
+            encloses only the placements of that <geometry/> (see: bounds)
+
+        >>> t = Mesh('test/cube.dae')
+        >>> [round(float(c), 3) for c in t.get_corner([1,-1,1])]
+        [0.0, -10.694, 4.413]
+        >>> [round(float(c), 3) for c in t.get_corner([-1,1,-1])]
+        [-22.715, 0.0, 0.0]
         """
-        tri_set = self.primitives()[0]
-        np_array  = tri_set.vertex
-        x = []
-        y = []
-        z = []
-        #Sort all vertex values
-        # TODO: can numpy array be turned sideways? to eliminate need to
-        for three_tuple in np_array:
-            x.append( three_tuple[0])
-            y.append( three_tuple[1])
-            z.append( three_tuple[2])
-        x.sort() 
-        y.sort()
-        z.sort()
+        return list(self.get_corners([list_directional], component)[0])
+
+    @profiling.profiled('mesh.get_corners')
+    def get_corners(self, directions, component=None):
+        """ returns an (N,3) numpy array of the corners, of the rectangular poly
+        enclosing the imported model, indicated by each of N directions.
+
+        directions an (N,3) array-like of 3D coordinate tuples, each like the
+            list_directional parameter of get_corner
+        component -- (optional) geometry id (see: get_corner)
+
+        >>> t = Mesh('test/cube.dae')
+        >>> t.get_corners([[1,-1,1],[-1,1,-1]]).astype(float).round(3).tolist()
+        [[0.0, -10.694, 4.413], [-22.715, 0.0, 0.0]]
+        >>> t.get_corners(numpy.empty((0,3))).shape
+        (0, 3)
+        >>> t = Mesh('test/cube_flipped.dae')
+        >>> t.get_corners([[1,1,1]], component='ID12').astype(float).round(3).tolist()
+        [[-22.715, 0.0, 0.0]]
+        """
+        minimum, maximum = self.bounds(component)
+        directions = numpy.reshape(directions, (-1, 3))
+        profiling.count('corner_lookups', len(directions))
         # determine vertex coordinates of a rectangular poly that encloses the 
-        # imported model
-        direction_x = list_directional[0]
-        direction_y = list_directional[1]
-        direction_z = list_directional[2]
-        if direction_x > 0:
-            # the smallest x coordinate value is not wanted,
-            # reverse the list, so the largest vertex x-value is returned
-            x.reverse()
-        if direction_y > 0:
-            # the smallest y coordinate value is not wanted,
-            # reverse the list, so the largest vertex y-value is returned
-            y.reverse()
-        if direction_z > 0:
-            # the smallest z coordinate value is not wanted,
-            # reverse the list, so the largest vertex z-value is returned
-            z.reverse()
-        return [ x[0], y[0], z[0]]
-        #inspect = ret
-        #print( type( inspect))
-        #print( inspect)
-        #print( dir( inspect))    
-        
-    def save_lines(self, file_path, list_vert_floats):
+        # imported model: largest coordinate value for positive directions,
+        # otherwise the smallest
+        return numpy.where(directions > 0, maximum, minimum)
+
+    def save_overlay(self, file_path, list_vert_floats, reference_url=None):
+        """ saves only a line_set, as a new COLLADA file to overlay on the
+        current model (without modifying or re-saving the model).
+
+        The lines are placed at the model's first scene transform, so they
+        line up with the model when both are shown.
+
+        reference_url -- (optional) URL of this model's file, relative to
+          file_path: to instance the model in the new file too
+
+        >>> from tempfile import TemporaryDirectory
+        >>> t = Mesh('test/cube_flipped.dae', writable=False)
+        >>> with TemporaryDirectory() as directory:
+        ...    t.save_overlay(directory + '/lines.dae', [[0,0,0], [1,0,0]]
+        ...                   ,reference_url='model.dae')
+        ...    overlay_data = loader.load(directory + '/lines.dae')
+        >>> [(geometry_id, bool((matrix == t.transform_matrix()).all()))
+        ...  for geometry_id, matrix in overlay_data.instances]
+        [('geometry0', True)]
+        >>> [url for url, matrix in overlay_data.reference_nodes]
+        ['node0', 'reference0']
+        """
+        overlay.write_overlay(file_path, list_vert_floats, self.unitmeter()
+                              ,self.up_axis(), self.transform_matrix()
+                              ,reference_url, self.reference_nodes())
+
+    def save_lines(self, file_path, list_vert_floats, keep_lines=True):
         """ Adds a line_set to the current model & saves the resulting COLLADA
         scene as a new file.
+
+        keep_lines -- if False, the line_set is removed from the model again
+          once saved (e.g. to save other lines with the same model next)
         """
-        line_set = self.create_lines( list_vert_floats)
-        self.mesh.write(file_path)
+        if self.mesh is None:
+            raise Exception("Mesh was not loaded as writable, cannot save it!")
+        line_node = self.create_lines( list_vert_floats)
+        with profiling.span('mesh.write'):
+            self.mesh.write(file_path)
+        if not keep_lines:
+            self.remove_lines(line_node)
+        profiling.count('bytes_written', os.path.getsize(file_path))
+
+def is_axis_aligned(matrix):
+    """ returns True if the 4x4 numpy array matrix only scales, flips or swaps
+    x,y,z axes (& translates): so it maps an axis-aligned box onto another one.
+
+    >>> is_axis_aligned(numpy.diag([2, -1, 1, 1]))
+    True
+    >>> is_axis_aligned(numpy.array([[1,1,0,0], [0,1,0,0], [0,0,1,0], [0,0,0,1]]))
+    False
+    """
+    return bool((numpy.count_nonzero(matrix[:3, :3], axis=1) <= 1).all())
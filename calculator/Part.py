@@ -17,6 +17,12 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+from collections.abc import Sequence
+
+import numpy
+
+from calculator import profiling
+from calculator.PartSection import PartSection, segment_endpoint_index
 
 class Part:
     """
@@ -39,9 +45,8 @@ class Part:
         0
         """
         self.sections = []
-        """list of vertex coodinates of the form [ x1, y1,z1, x2, y2, z2
-        , ...] representing a set of line segments, defining the geometry of
-        the plaster molding blank's bottom section.
+        """sequence of the PartSections composing the Part: a list, or
+        StackedSections (see: setStackedSections) until a section is inserted
         """
         self.material = material_dict
         self.voids = []
@@ -63,8 +68,66 @@ class Part:
         >>> p.sections
         [[0, 1, 1], [0, 0, 1]]
         """
+        if not isinstance(self.sections, list):
+            self.sections = list(self.sections) # materialize stacked sections
         self.sections.insert(0, part_section)
 
+    def setStackedSections( self, base_section, layer_count, layer_offset):
+        """
+        replace the Part sections with layer_count stacked copies of one section
+
+        Sections are stored as the base PartSection plus the layer count & XYZ
+        offset vector between layers. Individual PartSections are only built
+        when indexed (see: StackedSections): the profiling counter
+        'sections_built' counts base_section & each layer built.
+
+        >>> from calculator.PartSection import PartSection
+        >>> p = Part()
+        >>> p.setStackedSections(PartSection([[0,0,0],[0,1,0]], (1,0)), 3, (0,0,.5))
+        >>> len(p.sections), p.countLineSegmentEndpoints()
+        (3, 12)
+        >>> [section.outline[0].tolist() for section in p]
+        [[0.0, 0.0, 1.0], [0.0, 0.0, 0.5], [0.0, 0.0, 0.0]]
+        >>> p[0] is p[0]
+        True
+        >>> p.insertFrontSection(PartSection([[0,0,1.5]], (0,0)))
+        >>> len(p.sections), p[1].outline[0].tolist()
+        (4, [0.0, 0.0, 1.0])
+        >>> profiling.reset(); profiling.enable()
+        >>> p.setStackedSections(PartSection([[0,0,0]], (1,0)), 3, (0,0,.5))
+        >>> labels = p.getSectionLabels()
+        >>> profiling.report()['counters']
+        {'sections_built': 1}
+        >>> sections = [section for section in p] + [section for section in p]
+        >>> profiling.report()['counters']
+        {'sections_built': 4}
+        >>> profiling.disable(); profiling.reset()
+        """
+        self.sections = StackedSections(base_section, layer_count, layer_offset)
+        profiling.count('sections_built')
+
+    def getSectionLabels( self):
+        """
+        returns list of the str of each PartSection, in order (stacked
+        layers are not built for it, see: StackedSections.getLabels)
+
+        >>> p = Part()
+        >>> p.setStackedSections(PartSection([[0,0,0],[0,1,0]], (1,0)), 2, (0,0,.5))
+        >>> p.getSectionLabels(), p.getFirstVertex().tolist()
+        (['(1.0 mm, 0.0 mm)', '(1.0 mm, 0.0 mm)'], [0.0, 0.0, 0.5])
+        >>> p.sections._built
+        [None, None]
+        """
+        if isinstance(self.sections, StackedSections):
+            return self.sections.getLabels()
+        return [str(section) for section in self.sections]
+
+    def getFirstVertex( self):
+        """ returns XYZ coords of the first vertex of the 0th PartSection """
+        if isinstance(self.sections, StackedSections):
+            return self.sections.getFirstVertex()
+        return self.sections[0].outline[0]
+
     def insertSubtractPart(self, subtract_part):
         """
         insert new Part into the 0th index of the voids list
@@ -79,9 +142,35 @@ class Part:
         """
         self.voids.insert(0, subtract_part)
 
-    def getAsLineSegments( self):
+    def countLineSegmentEndpoints( self):
+        """
+        returns the number of XYZ coords getAsLineSegments returns
+
+        >>> p = Part()
+        >>> from calculator.PartSection import PartSection
+        >>> p.insertFrontSection(PartSection([[0,0,0],[0,0,1],[0,1,1]],(1,1)))
+        >>> v = Part() # Void
+        >>> v.insertFrontSection(PartSection([[0,.2,.2],[0,.2,.4]],(1,0)))
+        >>> p.insertSubtractPart(v)
+        >>> p.countLineSegmentEndpoints()
+        10
+        """
+        if isinstance(self.sections, StackedSections):
+            count = self.sections.countLineSegmentEndpoints()
+        else:
+            count = sum(2*len(section.outline) for section in self.sections)
+        return count + sum(v.countLineSegmentEndpoints() for v in self.voids)
+
+    def getAsLineSegments( self, out=None):
         """
-        returns a list of XYZ coord pairs, representing the part.
+        returns an (M,3) numpy array of XYZ coord pairs, representing the part.
+
+        Sections of the Part come first, then the sections of each void (each
+        void section is included once).
+
+        Keyword arguments:
+        out -- (optional) preallocated (M,3) float64 numpy array, to fill with
+          the coord pairs & return (see: countLineSegmentEndpoints)
 
         >>> p = Part()
         >>> from calculator.PartSection import PartSection
@@ -89,24 +178,157 @@ class Part:
         >>> l2 = [[0,4,0],[0,4,1]]
         >>> p.insertFrontSection(PartSection(l1,(1,0)))
         >>> p.insertFrontSection(PartSection(l2,(1,0)))
-        >>> p.getAsLineSegments()
-        [[0, 4, 0], [0, 4, 1], [0, 4, 1], [0, 4, 0], [0, 0, 0], [0, 0, 1], [0, 0, 1], [0, 0, 0]]
+        >>> p.getAsLineSegments().tolist()
+        [[0.0, 4.0, 0.0], [0.0, 4.0, 1.0], [0.0, 4.0, 1.0], [0.0, 4.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, 1.0], [0.0, 0.0, 0.0]]
         >>> v = Part() # Void
         >>> l3 = [[0, 1, 0.2], [0, 1, 0.4]]
         >>> l4 = [[0, 2, 0.2], [0, 2, 0.4]]
         >>> v.insertFrontSection(PartSection(l3,(1,0)))
         >>> v.insertFrontSection(PartSection(l4,(1,0)))
         >>> p.insertSubtractPart(v)
-        >>> p.getAsLineSegments()
-        [[0, 4, 0], [0, 4, 1], [0, 4, 1], [0, 4, 0], [0, 0, 0], [0, 0, 1], [0, 0, 1], [0, 0, 0], [0, 2, 0.2], [0, 2, 0.4], [0, 2, 0.4], [0, 2, 0.2], [0, 1, 0.2], [0, 1, 0.4], [0, 1, 0.4], [0, 1, 0.2]]
-        """
-        listReturn = list()
-        for section in self.sections:
-            listReturn.extend( section.vertici[:])
-            for v in self.voids:  # add segments for any voids
-                for void_section in v.sections:
-                    listReturn.extend(void_section.vertici[:])
-        return listReturn
+        >>> p.getAsLineSegments().tolist()
+        [[0.0, 4.0, 0.0], [0.0, 4.0, 1.0], [0.0, 4.0, 1.0], [0.0, 4.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, 1.0], [0.0, 0.0, 0.0], [0.0, 2.0, 0.2], [0.0, 2.0, 0.4], [0.0, 2.0, 0.4], [0.0, 2.0, 0.2], [0.0, 1.0, 0.2], [0.0, 1.0, 0.4], [0.0, 1.0, 0.4], [0.0, 1.0, 0.2]]
+        >>> buffer = numpy.zeros((20, 3))
+        >>> p.getAsLineSegments(out=buffer[2:18]) is not None, buffer[1:3].tolist()
+        (True, [[0.0, 0.0, 0.0], [0.0, 4.0, 0.0]])
+        """
+        if out is None:
+            out = numpy.empty((self.countLineSegmentEndpoints(), 3))
+        offset = 0
+        if isinstance(self.sections, StackedSections):
+            offset = self.sections.countLineSegmentEndpoints()
+            self.sections.getAsLineSegments(out=out[:offset])
+        else:
+            for section in self.sections:
+                count = 2*len(section.outline)
+                numpy.take(section.outline, segment_endpoint_index(len(section.outline))
+                           ,axis=0, out=out[offset:offset+count])
+                offset += count
+        for v in self.voids:  # add segments for any voids
+            count = v.countLineSegmentEndpoints()
+            v.getAsLineSegments(out=out[offset:offset+count])
+            offset += count
+        return out
+
+class StackedSections(Sequence):
+    """
+    read-only sequence of PartSections, stacked in layers along one axis.
+
+    Stores one base PartSection, the number of layers & the XYZ offset vector
+    between layers. As built by insertFrontSection, the last item is the base
+    section and the first item is shifted furthest, (layer_count-1) offsets
+    from the base.
+
+    Each PartSection is built when first indexed, then kept: indexing again
+    returns the same object, so changes made to it are kept too (& are
+    included by getAsLineSegments). getLabels, getFirstVertex & the line segment methods don't
+    build any layer.
+    """
+
+    def __init__( self, base_section, layer_count, layer_offset):
+        """
+        >>> from calculator.PartSection import PartSection
+        >>> s = StackedSections(PartSection([[0,0,0],[0,1,0]], (1,0)), 2, (1,0,0))
+        >>> len(s), s[0].outline.tolist(), s[-1].outline.tolist()
+        (2, [[1.0, 0.0, 0.0], [1.0, 1.0, 0.0]], [[0.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        >>> s[2]
+        Traceback (most recent call last):
+           ...
+        IndexError: stacked section index out of range
+        >>> s[0].outline[:, 2] = 5
+        >>> s[0].outline.tolist(), s.getAsLineSegments(numpy.empty((8, 3)))[0].tolist()
+        ([[1.0, 0.0, 5.0], [1.0, 1.0, 5.0]], [1.0, 0.0, 5.0])
+        >>> columns = numpy.zeros((8, 4))
+        >>> s.getAsLineSegments(columns[:, :3])[4:6].tolist() # (not contiguous)
+        [[0.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+        >>> bool((columns[:, :3] == s.getAsLineSegments(numpy.empty((8, 3)))).all())
+        True
+        """
+        self.base_section = base_section
+        self.layer_count = layer_count
+        self.layer_offset = numpy.asarray(layer_offset, dtype=numpy.float64)
+        self._built = [None] * layer_count
+        # PartSections built so far, by index (None: not indexed yet)
+
+    def __len__( self):
+        return self.layer_count
+
+    def __getitem__( self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.layer_count))]
+        if index < 0:
+            index += self.layer_count
+        if not 0 <= index < self.layer_count:
+            raise IndexError('stacked section index out of range')
+        section = self._built[index]
+        if section is None:
+            shift = (self.layer_count-1-index) * self.layer_offset
+            section = PartSection(self.base_section.outline + shift
+                                  ,self.base_section.dimensions_mm
+                                  ,self.base_section.material)
+            self._built[index] = section
+            profiling.count('sections_built')
+        return section
+
+    def getLabels( self):
+        """
+        returns list of the str of each layer's PartSection (see:
+        PartSection.__str__), without building layers
+
+        >>> from calculator.PartSection import PartSection
+        >>> s = StackedSections(PartSection([[0,0,0],[0,1,0]], (1,2)), 2, (1,0,0))
+        >>> s.getLabels(), s._built
+        (['(1.0 mm, 2.0 mm)', '(1.0 mm, 2.0 mm)'], [None, None])
+        """
+        return [str(self.base_section if section is None else section)
+                for section in self._built]
+
+    def getFirstVertex( self):
+        """ returns XYZ coords of the first vertex of the 0th layer's outline
+            (without building the layer) """
+        if self._built[0] is not None:
+            return self._built[0].outline[0]
+        return self.base_section.outline[0] + (self.layer_count-1) * self.layer_offset
+
+    def countLineSegmentEndpoints( self):
+        """ returns the number of XYZ coords, of all the layers' line segments """
+        base_count = 2*len(self.base_section.outline)
+        return sum(base_count if section is None else 2*len(section.outline)
+                   for section in self._built)
+
+    def getAsLineSegments( self, out):
+        """
+        fill (M,3) numpy array out, with line segment endpoints of all layers
+
+        (in sequence order, see: countLineSegmentEndpoints. Layers are
+        computed from the base section at once, except indexed ones, which
+        may have been changed)
+        """
+        vertex_count = len(self.base_section.outline)
+        if any(section is not None and len(section.outline) != vertex_count
+               for section in self._built):
+            offset = 0
+            for section in self:
+                count = 2*len(section.outline)
+                numpy.take(section.outline, segment_endpoint_index(len(section.outline))
+                           ,axis=0, out=out[offset:offset+count])
+                offset += count
+            return out
+        steps = numpy.arange(self.layer_count-1, -1, -1, dtype=numpy.float64)
+        shifts = steps[:, None, None] * self.layer_offset
+        contiguous = out.flags.c_contiguous # (else reshape would copy out)
+        if contiguous:
+            layers_out = out.reshape(self.layer_count, -1, 3) # view, not a copy
+        else:
+            layers_out = numpy.empty((self.layer_count, 2*vertex_count, 3))
+        numpy.add(self.base_section.vertici, shifts, out=layers_out)
+        if not contiguous:
+            out[...] = layers_out.reshape(-1, 3)
+        for index, section in enumerate(self._built):
+            if section is not None:
+                numpy.take(section.outline, segment_endpoint_index(vertex_count)
+                           ,axis=0, out=out[index*2*vertex_count:(index+1)*2*vertex_count])
+        return out
 
 if __name__ == "__main__":
     import doctest
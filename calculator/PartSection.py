@@ -17,13 +17,16 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-from calculator.Part import Part
+from functools import lru_cache
+
+import numpy
 
 class PartSection:
     """
     object representing an individual cut piece for use in mold construction.
 
     """
+    __slots__ = ('outline', 'dimensions_mm', 'material')
 
     def __init__( self, list_vertex, set_dimension_mm_tuple, material_dict=None):
         """
@@ -40,38 +43,38 @@ class PartSection:
         True
         >>> len(p.vertici)
         8
+        >>> p.outline.shape
+        (4, 3)
+        >>> hasattr(p, '__dict__')
+        False
         >>> l = [[0,0,1]]
         >>> p = PartSection( l, ())
-        >>> p.vertici
-        [[0, 0, 1], [0, 0, 1]]
+        >>> p.vertici.tolist()
+        [[0.0, 0.0, 1.0], [0.0, 0.0, 1.0]]
         >>> l = [[0,0,1],[0,0,3]]
         >>> p = PartSection( l, ())
-        >>> p.vertici
-        [[0, 0, 1], [0, 0, 3], [0, 0, 3], [0, 0, 1]]
+        >>> p.vertici.tolist()
+        [[0.0, 0.0, 1.0], [0.0, 0.0, 3.0], [0.0, 0.0, 3.0], [0.0, 0.0, 1.0]]
         """
-        self.vertici = []
+        self.outline = numpy.asarray(list_vertex, dtype=numpy.float64).reshape(-1, 3)
         """
-        endpoint YXZ coords, of all line segments which compose the PartSection
-
-        (A PartSection is represented by a collection of line segments which
-        together form the outline of the 2d section. All pairs of YXZ coord
-        endpoints are concatenated together in this attribute.
+        (N,3) numpy array of the XYZ coords of the polygon outlining the
+        PartSection. (Arrays of float64 coords are kept as-is, not copied)
         """
-
         self.material = material_dict
         self.dimensions_mm = set_dimension_mm_tuple
-        # convert the list of poly vertici, into pairs of vertici representing
-        # line segments
-        for i, coord in enumerate(list_vertex):
-            list_next_coord = None
-            #line segment termintates at the next coord (unless end
-            # has been reached, then next coord is the first one provided )
-            if i >= len(list_vertex)-1:
-                list_next_coord = list_vertex[0]
-            else:
-                list_next_coord = list_vertex[i+1]
-            self.vertici.append(coord[:])
-            self.vertici.append(list_next_coord[:])
+
+    @property
+    def vertici(self):
+        """
+        endpoint XYZ coords, of all line segments which compose the PartSection
+
+        (A PartSection is represented by a collection of line segments which
+        together form the outline of the 2d section. All pairs of XYZ coord
+        endpoints are concatenated together into this (2N,3) numpy array, which
+        is derived from outline on each access.)
+        """
+        return self.outline[segment_endpoint_index(len(self.outline))]
 
     def __str__( self):
         """ returns a simple human-readable representation of this PartSection.
@@ -86,6 +89,22 @@ class PartSection:
         """
         return '({0:.1f} mm, {1:.1f} mm)'.format(self.dimensions_mm[0], self.dimensions_mm[1])
 
+@lru_cache(maxsize=None)
+def segment_endpoint_index(vertex_count):
+    """
+    Returns array of indices, pairing each polygon vertex with the next one
+
+    Each line segment terminates at the next vertex (unless the end has been
+    reached, then the segment terminates at the first vertex).
+
+    >>> segment_endpoint_index(3).tolist()
+    [0, 1, 1, 2, 2, 0]
+    """
+    start = numpy.arange(vertex_count)
+    index = numpy.column_stack((start, numpy.roll(start, -1))).ravel()
+    index.flags.writeable = False # shared between all callers
+    return index
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -0,0 +1,265 @@
+"""
+Module, defining an on-disk cache of COLLADA geometry data (see: loader), so
+an unchanged model is only parsed once
+
+Cached data is keyed by a hash of the model file contents & the loader
+version. Each entry is a compact .npz file, plus a raw vertex file (see:
+calculator.vertexstore) that is memory-mapped when the entry is read. Once the
+cache directory grows past its size limit, the least recently used entries
+are removed.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy
+
+from . import loader
+from .vertexstore import VertexStore
+
+DEFAULT_SIZE_LIMIT_BYTES = 512 * 1024**2
+""" default maximum total size of the files in a cache directory """
+
+VERTEX_SUFFIX = '.f64'
+""" file extension of a cache entry's vertex file (beside its .npz file) """
+
+def default_cache_dir():
+    """ returns the per-user directory for cached geometry data """
+    cache_home = os.environ.get('XDG_CACHE_HOME'
+                                ,os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'pymoldmaker')
+
+def file_hash(file_path, chunk_size=1024**2):
+    """
+    Returns hex SHA-256 digest of the contents of file_path
+
+    >>> file_hash('test/cube.dae')[:16]
+    '95f7ec28ec239773'
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as model_file:
+        for chunk in iter(lambda: model_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class MeshCache:
+    """
+    object representing a directory of cached COLLADA geometry data
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as directory:
+    ...    cache = MeshCache(directory)
+    ...    data = cache.load('test/cube_flipped.dae') # parsed, then saved
+    ...    cached_data = cache.load('test/cube_flipped.dae') # read from cache
+    ...    sorted(os.path.splitext(name)[1] for name in os.listdir(directory))
+    ['.f64', '.npz']
+    >>> [geometry_id for geometry_id, primitives in cached_data.geometries][:3]
+    ['ID4', 'ID12', 'ID18']
+    >>> cached_data.unitmeter, cached_data.transform_matrix.dtype
+    (0.0254, dtype('float32'))
+    >>> positions, indices = cached_data.geometries[0][1][0]
+    >>> bool((positions == data.geometries[0][1][0][0]).all())
+    True
+    >>> isinstance(positions, numpy.memmap), positions.dtype
+    (True, dtype('float64'))
+    >>> [geometry_id for geometry_id, matrix in cached_data.instances] == [
+    ...     geometry_id for geometry_id, matrix in data.instances]
+    True
+    >>> cached_data.up_axis, [node_id for node_id, matrix in cached_data.reference_nodes]
+    ('Z_UP', ['ID2'])
+    """
+
+    def __init__(self, directory=None, size_limit_bytes=DEFAULT_SIZE_LIMIT_BYTES):
+        """
+        Keyword arguments:
+        directory -- path to store cached data in (default: default_cache_dir)
+        size_limit_bytes -- total size of cache files to keep, after adding one
+        """
+        if directory is None:
+            directory = default_cache_dir()
+        self.directory = directory
+        self.size_limit_bytes = size_limit_bytes
+
+    def get_path(self, file_path):
+        """ returns path of the cache .npz file, for the COLLADA file at
+        file_path (its vertex file has the same name, with VERTEX_SUFFIX)"""
+        key = '{}-v{}.npz'.format(file_hash(file_path), loader.LOADER_VERSION)
+        return os.path.join(self.directory, key)
+
+    def load(self, file_path):
+        """
+        Returns calculator.loader.MeshData for the COLLADA file at file_path
+
+        Data is read from the cache if present, otherwise the file is parsed
+        & the data is added to the cache. If the cache can't be written (e.g.
+        a full or read-only directory), the parsed data is returned as-is.
+
+        >>> data = MeshCache('test/cube.dae').load('test/cube_flipped.dae')
+        >>> [geometry_id for geometry_id, primitives in data.geometries][:3]
+        ['ID4', 'ID12', 'ID18']
+        """
+        cache_path = self.get_path(file_path)
+        try:
+            mesh_data = self.read(cache_path)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            mesh_data = None # missing or unreadable: (re)build it
+        if mesh_data is not None:
+            try:
+                os.utime(cache_path) # mark as recently used
+            except OSError:
+                pass # (e.g. just evicted by another process: data is read)
+            return mesh_data
+        mesh_data = loader.load(file_path)
+        try:
+            self.write(cache_path, mesh_data)
+            self.evict(keep=cache_path)
+            return self.read(cache_path) # (vertices memory-mapped, not in memory)
+        except OSError:
+            return mesh_data # (not cached)
+
+    def read(self, cache_path):
+        """ returns MeshData, read from the .npz file at cache_path
+
+        Vertex positions are views into the memory-mapped vertex file."""
+        vertices = VertexStore(vertex_path(cache_path))
+        with numpy.load(cache_path, allow_pickle=False) as arrays:
+            geometries = []
+            primitive_counts = arrays['primitive_counts']
+            vertex_ranges = iter(arrays['vertex_ranges'].tolist())
+            for geometry_index, geometry_id in enumerate(arrays['geometry_ids']):
+                primitives = []
+                for primitive_index in range(primitive_counts[geometry_index]):
+                    name = '{}_{}'.format(geometry_index, primitive_index)
+                    start, stop = next(vertex_ranges)
+                    primitives.append((vertices[start:stop]
+                                      ,arrays['indices_' + name]))
+                geometries.append((str(geometry_id), primitives))
+            instances = list(zip(arrays['instance_geometry_ids'].tolist()
+                                 ,arrays['instance_matrices']))
+            reference_nodes = list(zip(arrays['reference_node_ids'].tolist()
+                                       ,arrays['reference_matrices']))
+            return loader.MeshData(geometries, float(arrays['unitmeter'])
+                                   ,arrays['transform_matrix'], instances
+                                   ,str(arrays['up_axis']), reference_nodes)
+
+    def write(self, cache_path, mesh_data):
+        """ saves MeshData to cache_path & its vertex file (each atomically,
+        via a temporary file. The vertex file is written first, so any .npz
+        file is complete)"""
+        os.makedirs(self.directory, exist_ok=True)
+        positions = [positions for geometry_id, primitives in mesh_data.geometries
+                     for positions, indices in primitives]
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(file_descriptor)
+        try:
+            vertex_ranges = VertexStore.write(temp_path, positions)
+            os.replace(temp_path, vertex_path(cache_path))
+        finally:
+            remove_file(temp_path) # (if not replaced, e.g. the disk is full)
+        arrays = {'unitmeter': mesh_data.unitmeter
+                  ,'transform_matrix': mesh_data.transform_matrix
+                  ,'geometry_ids': [geometry_id for geometry_id, primitives
+                                    in mesh_data.geometries]
+                  ,'primitive_counts': [len(primitives) for geometry_id, primitives
+                                        in mesh_data.geometries]
+                  ,'vertex_ranges': numpy.reshape(vertex_ranges, (-1, 2))
+                  ,'instance_geometry_ids': numpy.array(
+                      [geometry_id for geometry_id, matrix in mesh_data.instances], dtype=str)
+                  ,'instance_matrices': numpy.reshape(
+                      [matrix for geometry_id, matrix in mesh_data.instances], (-1, 4, 4))
+                  ,'up_axis': mesh_data.up_axis
+                  ,'reference_node_ids': numpy.array(
+                      [node_id for node_id, matrix in mesh_data.reference_nodes], dtype=str)
+                  ,'reference_matrices': numpy.reshape(
+                      [matrix for node_id, matrix in mesh_data.reference_nodes], (-1, 4, 4))}
+        for geometry_index, (geometry_id, primitives) in enumerate(mesh_data.geometries):
+            for primitive_index, (positions, indices) in enumerate(primitives):
+                name = '{}_{}'.format(geometry_index, primitive_index)
+                arrays['indices_' + name] = indices
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp'
+                                         ,delete=False) as temp_file:
+            try:
+                numpy.savez(temp_file, **arrays)
+            except OSError:
+                remove_file(temp_file.name)
+                raise
+        os.replace(temp_file.name, cache_path)
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used cache entries, until under the size limit
+
+        keep -- (optional) path of a cache .npz file never to remove
+
+        (Entries another process removes meanwhile are skipped.)
+
+        >>> from tempfile import TemporaryDirectory
+        >>> with TemporaryDirectory() as directory:
+        ...    cache = MeshCache(directory, size_limit_bytes=0)
+        ...    data = cache.load('test/cube.dae')
+        ...    data = cache.load('test/cube_flipped.dae') # evicts cube.dae data
+        ...    kept = os.path.basename(cache.get_path('test/cube_flipped.dae'))
+        ...    sorted(os.listdir(directory)) == [kept[:-4] + VERTEX_SUFFIX, kept]
+        True
+        """
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith('.npz'):
+                continue
+            paths = [path, vertex_path(path)]
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            size = sum(file_size(entry_path) for entry_path in paths)
+            total_bytes += size
+            if path != keep:
+                entries.append((mtime, size, paths))
+        for mtime, size, paths in sorted(entries): # oldest first
+            if total_bytes <= self.size_limit_bytes:
+                break
+            for path in paths:
+                remove_file(path)
+            total_bytes -= size
+
+def file_size(file_path):
+    """ returns size in bytes of the file at file_path (0 if there is none) """
+    try:
+        return os.path.getsize(file_path)
+    except FileNotFoundError:
+        return 0
+
+def remove_file(file_path):
+    """ removes the file at file_path, if there is one """
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+def vertex_path(cache_path):
+    """ returns path of the vertex file, of the cache .npz file at cache_path
+
+    >>> vertex_path('a/0123-v1.npz')
+    'a/0123-v1.f64'
+    """
+    return os.path.splitext(cache_path)[0] + VERTEX_SUFFIX
@@ -18,16 +18,23 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 from collections import OrderedDict
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 import math
-from ast import literal_eval
+import os
+import sys
 
 import numpy
 
 from calculator.Mesh import Mesh
 from calculator.Part import Part
 from calculator.PartSection import PartSection
+from . import cutorder
+from . import directions
+from . import export
 from . import kerf
+from . import nesting
+from . import profiling
 
 class Calculator(Mesh):
     # object representing COLLADA mesh of a positive for mold-making, 
@@ -48,22 +55,77 @@ class Calculator(Mesh):
     """ depth in mm of the 45deg corner cuts that bisect the XY plane of the 
         flat positive being molded"""
 
-    def __init__(self, mesh_path):
+    workers = 1
+    """ number of worker processes generateParts spreads make_part calls
+        across (1: build every part in this process)"""
+
+    worker_context = None
+    """ multiprocessing context worker processes are started with (None: the
+        platform default, see: concurrent.futures.ProcessPoolExecutor)"""
+
+    def __init__(self, mesh_path, writable=True, cache=None):
         """
         Construct Calculator for COLLADA mesh & part description files
+
+        (writable, cache: see Mesh.__init__. The cache also keeps the
+        compiled directions, see: reload_directions)
         """
-        Mesh.__init__(self, mesh_path)
+        Mesh.__init__(self, mesh_path, writable, cache)
+        self.cache = cache
+        # calculator.cache.MeshCache (or None)
+        self._mm_per_unit_matrix = None
+        # 3x3 numpy array, converting coordinate deltas into mm (see: get_mm_dists)
+        self._parts_cache = None
+        # (inputs, Parts) tuple of the last generateParts result
+        self._built_parts = {}
+        # Parts (by name & part_fingerprint) & voids (by part_fingerprint)
+        # of the current generation
+        self._previous_parts = {}
+        # Parts (& voids) of the last generation, reused while generating
+        self.rebuilt_part_names = []
+        # names of the Parts the last generation built (not reused)
 
         #fetch mold part descriptions
         # assume COLLADA mesh file has .dae extension
         extension_length = 4 # ".dae", ".DAE", etc.
         # .. and assume part descriptions .py file is in same directory
-        directions_path = mesh_path[:-1*extension_length] + ".py"
+        self.directions_path = mesh_path[:-1*extension_length] + ".py"
         # fetch the Python 'parts' list from directions file
-        try:
-            self.directions = self.get_directions_from_module_file(directions_path)
-        except FileNotFoundError:
+        self.reload_directions()
+
+    def reload_directions(self):
+        """ reads directions again from the directions_path file (e.g. after
+            it was edited), or sets no directions if there is no such file
+
+        The directions are compiled into a validated DirectionsPlan, read
+        from the cache if the file is unchanged (see: calculator.directions)
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> vect.directions_path = 'test/missing.py'
+        >>> vect.reload_directions()
+        >>> vect.directions
+        []
+        """
+        if not os.path.exists(self.directions_path):
             self.directions = [] #default: no directions
+            return
+        self.directions = directions.load_plan(self.directions_path, self.cache)
+
+    def __getstate__(self):
+        """ returns the state to pickle, e.g. for sending to a worker process
+
+        (see: Mesh.__getstate__. The material is pickled as a copy, since it
+        may be a shared class attribute that a worker process would not see
+        modifications of)
+        """
+        state = Mesh.__getstate__(self)
+        state['material'] = dict(self.material)
+        state['depth_xy_corner_cut'] = self.depth_xy_corner_cut
+        state['_parts_cache'] = None
+        state['_built_parts'] = {}
+        state['_previous_parts'] = {}
+        state.pop('worker_context', None)
+        return state
 
     def get_directions_from_module_file(self, directions_path):
         """
@@ -91,30 +153,235 @@ class Calculator(Mesh):
            ...
         SyntaxError: invalid syntax
         """
-        with open(directions_path) as parts_file:
-            return literal_eval(parts_file.read())
+        return directions.read_directions_file(directions_path)
 
-    def save(self, file_path):
+    def save(self, file_path, overlay=False, reference_url=None, keep_lines=True
+             ,stream=None):
         """ save mesh and supplemental PartSections out to a COLLADA file.
+
+        overlay -- if True, save only the PartSection outlines (without the
+          mesh) to a small COLLADA file, see: Mesh.save_overlay
+        reference_url -- (optional, overlay only) URL of the mesh file
+          relative to file_path, for the outlines file to instance the mesh
+        keep_lines -- if False, the outlines are removed from the mesh again
+          once saved (see: Mesh.save_lines)
+        stream -- (optional) text file-like object to write the cutlist to
+          (default: standard output, see: write_cutlist)
+
+        >>> from tempfile import TemporaryDirectory
+        >>> from contextlib import redirect_stdout
+        >>> import io, os
+        >>> with TemporaryDirectory() as directory, redirect_stdout(io.StringIO()):
+        ...    Calculator('test/cube_flipped.dae', writable=False).save(
+        ...        directory + '/out.dae', overlay=True)
+        ...    saved_files = os.listdir(directory)
+        >>> saved_files
+        ['out.dae']
+
+        Parts generated after a save are the same as from a fresh Calculator
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> with TemporaryDirectory() as directory, redirect_stdout(io.StringIO()):
+        ...    vect.save(directory + '/out.dae')
+        >>> vect.invalidate_bounds()
+        >>> vect.material = dict(vect.material, thickness_mm=3)
+        >>> fresh = Calculator('test/cube_flipped.dae')
+        >>> fresh.directions, fresh.material = vect.directions, vect.material
+        >>> vect.parts_to_string() == fresh.parts_to_string()
+        True
         """
-        print(self.parts_to_string()) #print human-readable output to console
+        self.write_cutlist(stream) #print human-readable output to console
 
-        #TODO: eliminate below code duplicated in 'parts_to_string'
-        # get Parts (... and their component PartSections)
+        # get Parts (... and their component PartSections, already generated
+        # for the cutlist above)
         parts = self.generateParts()
 
-        # convert mold-making PartSections into list of 3d-coord pairs("lines")
-        list_line_segment_endpoints_xyz = list()
-        for keyPartName in parts.keys():
-            part = parts[keyPartName] #get part
-            #collect the line segment endpoints, for this Part's sections
-            list_line_segment_endpoints_xyz.extend(part.getAsLineSegments())
+        # convert mold-making PartSections into array of 3d-coord pairs("lines")
+        line_segment_endpoints_xyz = self.parts_to_line_segments(parts)
 
+        if overlay:
+            self.save_overlay(file_path, line_segment_endpoints_xyz, reference_url)
+            return
         # overlay a visualization of this part, onto original COLLADA model,and
         # save original mesh+ these lines to the specified file
-        self.save_lines( file_path, list_line_segment_endpoints_xyz)
+        self.save_lines( file_path, line_segment_endpoints_xyz, keep_lines)
         return
 
+    def parts_to_line_segments(self, parts):
+        """
+        Returns one (M,3) numpy array of line segment endpoints, for all Parts
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> vect.parts_to_line_segments(vect.generateParts()).shape
+        (16, 3)
+        """
+        endpoint_counts = [part.countLineSegmentEndpoints() for part in parts.values()]
+        line_segment_endpoints_xyz = numpy.empty((sum(endpoint_counts), 3))
+        offset = 0
+        for part, count in zip(parts.values(), endpoint_counts):
+            #collect the line segment endpoints, for this Part's sections
+            part.getAsLineSegments(out=line_segment_endpoints_xyz[offset:offset+count])
+            offset += count
+        return line_segment_endpoints_xyz
+
+    def save_drawings(self, directory, extensions=('.svg',)):
+        """
+        Saves a 2d vector drawing of each Part's PartSections, in mm, to
+        directory. (see: calculator.export)
+
+        Each Part is saved as one file per extension (.svg, .dxf or .eps),
+        named after the Part, with its paths in cutting order (see:
+        calculator.cutorder). Returns list of the saved file paths.
+
+        >>> from tempfile import TemporaryDirectory
+        >>> vect = Calculator('test/cube_flipped.dae', writable=False)
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> with TemporaryDirectory() as directory:
+        ...    paths = vect.save_drawings(directory, ('.svg', '.dxf'))
+        ...    [os.path.basename(path) for path in paths]
+        ['Left.svg', 'Left.dxf']
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, part in self.generateParts().items():
+            drawing = export.layout_pieces(self.get_part_pieces_mm(part))
+            drawing = cutorder.optimize_drawing(drawing)[0]
+            for extension in extensions:
+                path = os.path.join(directory, export.file_name(name) + extension)
+                export.write_drawing(path, drawing)
+                paths.append(path)
+        return paths
+
+    def nest_sections(self, sheet_sizes, margin_mm=0.0, allow_rotation=True):
+        """
+        Returns (labels, pieces, sizes, Nesting) tuple: every PartSection of
+        every Part, packed onto stock sheets (see: calculator.nesting.nest)
+
+        Sections are spaced apart by the material's kerf_mm. labels, pieces &
+        sizes are lists of: each piece's "<Part> section <n>" name, its paths
+        (see: get_part_pieces_mm) & its (width mm, height mm).
+
+        >>> vect = Calculator('test/cube_flipped.dae', writable=False)
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> labels, pieces, sizes, sheets = vect.nest_sections([(1220, 610)])
+        >>> labels, sheets.sheets
+        (['Left section 1', 'Left section 2'], [(1220, 610)])
+        >>> [placement.sheet for placement in sheets.placements]
+        [0, 0]
+        """
+        labels, pieces = [], []
+        for name, part in self.generateParts().items():
+            for index, piece in enumerate(self.get_part_pieces_mm(part)):
+                labels.append('{} section {}'.format(name, index+1))
+                pieces.append(piece)
+        sizes = [nesting.piece_size(piece) for piece in pieces]
+        sheets = nesting.nest(sizes, sheet_sizes, spacing_mm=self.material['kerf_mm']
+                              ,margin_mm=margin_mm, allow_rotation=allow_rotation)
+        return labels, pieces, sizes, sheets
+
+    def save_sheet_drawings(self, directory, sheet_sizes, extensions=('.svg',)
+                            ,margin_mm=0.0, allow_rotation=True):
+        """
+        Saves a 2d vector drawing of each stock sheet, with the PartSections
+        nested on it (see: nest_sections), to directory & prints a summary
+
+        Each sheet is saved as one file per extension, named sheet-<n>, with
+        its paths in cutting order (see: calculator.cutorder). The summary
+        includes the travel between cuts, before & after ordering them.
+        Returns list of the saved file paths.
+
+        >>> from tempfile import TemporaryDirectory
+        >>> from contextlib import redirect_stdout
+        >>> import io
+        >>> vect = Calculator('test/cube_flipped.dae', writable=False)
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> summary = io.StringIO()
+        >>> with TemporaryDirectory() as directory, redirect_stdout(summary):
+        ...    paths = vect.save_sheet_drawings(directory, [(610, 305)], ('.dxf',))
+        >>> [os.path.basename(path) for path in paths]
+        ['sheet-1.dxf']
+        >>> print(summary.getvalue(), end='')
+        # Nesting
+        ## Sheet 1 (610 x 305 mm, 70% used)
+         * Left section 1 at (0.0 mm, 0.0 mm)
+         * Left section 2 at (0.0 mm, 112.9 mm)
+        # Cut order
+         * Sheet 1: 225.4 mm of travel between cuts (was 225.4 mm)
+        """
+        labels, pieces, sizes, sheets = self.nest_sections(sheet_sizes, margin_mm
+                                                           ,allow_rotation)
+        print('# Nesting')
+        for line in nesting.nesting_lines(labels, sizes, sheets):
+            print(line)
+        print('# Cut order')
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for index, drawing in enumerate(nesting.sheet_drawings(pieces, sheets)):
+            drawing, before_mm, after_mm = cutorder.optimize_drawing(drawing)
+            print(' * Sheet {}: {:.1f} mm of travel between cuts (was {:.1f} mm)'.format(
+                index+1, after_mm, before_mm))
+            for extension in extensions:
+                path = os.path.join(directory, 'sheet-{}{}'.format(index+1, extension))
+                export.write_drawing(path, drawing)
+                paths.append(path)
+        return paths
+
+    def get_part_pieces_mm(self, part):
+        """
+        Returns list of the pieces to cut for Part part, one per PartSection
+
+        Each piece is a list of (layer, (N,2) numpy array) paths (see:
+        calculator.export.Drawing): the PartSection's outline, & the outline
+        of the same layer of each void, in mm along the part_plane axes.
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> part = vect.make_part(([-1,1,1],[-1,1,-1]), ([1,1,1],[1,1,-1]), (0,2))
+        >>> pieces = vect.get_part_pieces_mm(part)
+        >>> len(pieces), [layer for layer, path in pieces[0]]
+        (2, ['OUTLINE'])
+        >>> size = numpy.ptp(pieces[0][0][1], axis=0)
+        >>> sorted(round(float(x), 1) for x in size)
+        [112.5, 577.4]
+        """
+        part_plane = part.make_args.get('part_plane', (0, 1))
+        pieces = []
+        for index, section in enumerate(part.sections):
+            piece = [(export.OUTLINE, self.get_mm_outline(section.outline, part_plane))]
+            for void in iter_voids(part):
+                if index < len(void.sections): # (void cuts through this layer)
+                    piece.append((export.HOLE, self.get_mm_outline(
+                        void.sections[index].outline, part_plane)))
+            pieces.append(piece)
+        return pieces
+
+    def get_mm_outline(self, outline, part_plane):
+        """
+        Returns (N,2) numpy array, the mm coords of an (N,3) outline along
+        the pair of axes part_plane
+
+        (coordinates along each axis are scaled to mm as get_mm_dists does)
+
+        >>> vect = Calculator('test/cube.dae')
+        >>> vect.get_mm_outline([[1, 2, 3], [0, 0, 1]], (0, 2)).round(4).tolist()
+        [[25.4, 76.2], [0.0, 25.4]]
+        """
+        linear = numpy.asarray(self.transform_matrix(), dtype=numpy.float64)[:3, :3]
+        axes = list(part_plane)
+        mm_per_unit = numpy.linalg.norm(linear[:, axes], axis=0) * self.ratio_mm_per_unit()
+        return numpy.asarray(outline, dtype=numpy.float64)[:, axes] * mm_per_unit
+
     def parts_to_string(self):
         """
         Returns String, representing a human-readable cutlist for parts
@@ -229,45 +496,296 @@ class Calculator(Mesh):
          ' * (112.5 mm, 526.7 mm) section\\n'
          ' * (112.5 mm, 526.7 mm) section')
         """
+        return '\n'.join(self.cutlist_lines())
+
+    def cutlist_lines(self):
+        """
+        Yields lines of a human-readable cutlist for parts, as Parts are made
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> lines = vect.cutlist_lines()
+        >>> next(lines), next(lines), next(lines)
+        ('# Cutlist', '## Left Part', ' * (112.5 mm, 577.4 mm) section')
+
+        A later entry with the same name replaces the earlier one (as in the
+        dict generateParts returns)
+
+        >>> vect.directions.append(("Left", dict(vect.directions[0][1], shrink_edges={'left'})))
+        >>> streamed = list(vect.cutlist_lines())
+        >>> streamed[1:3], streamed == list(vect.cutlist_lines())
+        (['## Left Part', ' * (112.5 mm, 565.4 mm) section'], True)
+        """
+        yield "# Cutlist"
         # get Parts (... and their component PartSections)
-        dictParts = self.generateParts()
-
-        # convert mold-making PartSections into list of 3d-coord pairs("lines")
-        list_line_segment_endpoints_xyz = list()
-        # ..and while we convert, also print human-readable cutlist
-        output = "# Cutlist"
-        for keyPartName in dictParts.keys():
-            part = dictParts[keyPartName] #get part, print its name
-            output += '\n' + "## {} Part".format(keyPartName)
-            for partSection in part: #print its component PartSections
-                output += '\n' + " * {} section".format(partSection)
+        for keyPartName, part in self.iterParts():
+            yield "## {} Part".format(keyPartName) #print part name
+            for label in part.getSectionLabels(): #print its component PartSections
+                yield " * {} section".format(label)
             if len(part.voids):
-                output += '\n' + " ### Cutouts (Offset from start corner)"
+                yield " ### Cutouts (Offset from start corner)"
             for count,void in enumerate(part.voids):
                 mm_tuple = self.get_hole_offset_mm_tuple(part, void)
                 offset = '({0:.1f} mm, {1:.1f} mm)'.format(*mm_tuple)
-                output += '\n' + "  #### Hole {} {}".format(count+1, offset)
-                for partSection in void: #print void's component PartSections
-                    output += '\n' + "   ** {} section".format(partSection)
-        return output
+                yield "  #### Hole {} {}".format(count+1, offset)
+                for label in void.getSectionLabels(): #print void's component PartSections
+                    yield "   ** {} section".format(label)
+
+    @profiling.profiled('write_cutlist')
+    def write_cutlist(self, stream=None):
+        """
+        Writes human-readable cutlist to a file-like object, line by line
+
+        stream -- (optional) text file-like object to write to. Default:
+          standard output
+
+        >>> import io
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> cutlist = io.StringIO()
+        >>> vect.write_cutlist(cutlist)
+        >>> cutlist.getvalue() == vect.parts_to_string() + '\\n'
+        True
+        """
+        if stream is None:
+            stream = sys.stdout
+        for line in self.cutlist_lines():
+            stream.write(line)
+            stream.write('\n')
 
-    def generateParts(self):
+    def generateParts(self, workers=None):
         """
         generates the inventory of Parts needed to assemble the mold positive.
 
+        Keyword Arguments:
+        workers -- number of worker processes to build Parts with (default:
+          the workers attribute). With more than one, make_part calls are
+          spread across a process pool; Parts are returned in the same order
+          & with the same values as when built in this process.
+
         Returns: Dict of Parts needed,indexed by human-readable part name
+
+        Parts are only generated again if the directions or material have
+        changed, since the last call. Then only the Parts of directions
+        entries whose arguments (or the material) changed are built again:
+        the others, & unchanged subtract_parts voids, are reused (see:
+        part_fingerprint).
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> parts = vect.generateParts()
+        >>> vect.generateParts() is parts
+        True
+        >>> vect.material = dict(vect.material, thickness_mm=3)
+        >>> thin_parts = vect.generateParts()
+        >>> thin_parts is parts, len(parts['Left'].sections), len(thin_parts['Left'].sections)
+        (False, 2, 4)
+        >>> vect.directions[0][1]['shrink_edges'] = {'bottom'}
+        >>> left = vect.generateParts()['Left']
+        >>> left is thin_parts['Left']
+        False
+        >>> vect.directions.append(("Right", { "start_edge": ([-1,-1,1],[-1,-1,-1])
+        ...                                  ,"end_edge": ([1,-1,1],[1,-1,-1])
+        ...                                  ,"part_plane": (0,2)}))
+        >>> vect.generateParts()['Left'] is left, vect.rebuilt_part_names
+        (True, ['Right'])
+        >>> vect.directions += [(name + ' copy', args) for name, args in vect.directions]
+        >>> parallel_vect = Calculator('test/cube_flipped.dae')
+        >>> parallel_vect.directions = vect.directions
+        >>> parallel_vect.material = vect.material
+        >>> parallel_parts = parallel_vect.generateParts(workers=2)
+        >>> parallel_vect.parts_to_string() == vect.parts_to_string()
+        True
+        """
+        for name_and_part in self.iterParts(workers):
+            pass # (generated Parts are cached, once all have been made)
+        #TODO: generate top edge, and top face.
+        cached_inputs, dictParts = self._parts_cache
+        return dictParts
+
+    def iter_variants(self, materials, workers=None):
         """
+        Yields each of materials (a list of material dicts, e.g. of different
+        thickness_mm & kerf_mm), after making it this Calculator's material &
+        generating its Parts
+
+        So, while a material is yielded, generateParts, save, save_drawings,
+        etc. use that material's Parts (without generating them again). The
+        mesh & its bounds are loaded only once, for all materials.
+
+        workers -- number of worker processes to generate the materials'
+          Parts in at once (default: the workers attribute)
+
+        >>> vect = Calculator('test/cube_flipped.dae', writable=False)
+        >>> vect.directions = [("Left", { "start_edge": ([-1,1,1],[-1,1,-1])
+        ...                             ,"end_edge": ([1,1,1],[1,1,-1])
+        ...                             ,"part_plane": (0,2)})]
+        >>> materials = [{'thickness_mm': 6, 'kerf_mm': 0.4}, {'thickness_mm': 3, 'kerf_mm': 0.2}]
+        >>> [(material['thickness_mm'], len(vect.generateParts()['Left'].sections))
+        ...  for material in vect.iter_variants(materials, workers=2)]
+        [(6, 2), (3, 4)]
+        """
+        if workers is None:
+            workers = self.workers
+        materials = [dict(material) for material in materials]
+        if workers > 1 and len(materials) > 1:
+            self.bounds() # (index the mesh once, before it is sent to workers)
+            with ProcessPoolExecutor(min(workers, len(materials))
+                                     ,mp_context=self.worker_context
+                                     ,initializer=_init_part_worker
+                                     ,initargs=(self,)) as executor:
+                for material, parts in zip(materials, executor.map(
+                        _make_variant_parts, materials)):
+                    self.material = material
+                    self._parts_cache = (self.get_parts_inputs(), parts)
+                    yield material
+        else:
+            for material in materials:
+                self.material = material
+                self.generateParts(workers=1)
+                yield material
+
+    def iterParts(self, workers=None):
+        """
+        Yields name/Part tuples as each Part is generated, in directions order
+
+        (see: generateParts. When every Part has been yielded, they are cached
+        for the next call, which then yields the cached Parts)
+
+        Making each Part is a call of the profiling span 'generateParts' (so
+        its time is that of making Parts, not of the caller's use of them)
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> profiling.reset(); profiling.enable()
+        >>> names = [name for name, part in vect.iterParts()]
+        >>> profiling.report()['spans']['generateParts']['calls'] == len(names) + 1
+        True
+        >>> profiling.disable(); profiling.reset()
+        """
+        parts_inputs = self.get_parts_inputs()
+        if self._parts_cache is not None:
+            cached_inputs, cached_parts = self._parts_cache
+            if cached_inputs == parts_inputs:
+                yield from cached_parts.items()
+                return
         ## generation strategy: start by determining size of bottom edge,then
         # side edges. Then, assuming the mold positive needs an exhaust on the
         # top edge, determine sizes for the three parts for the top edge.
         # Finally calculate dimensions of the mold positive's top face.
-        parts_generator = ((name, self.make_part(**args)) #name/part tuples
-                           for name,args
-                           in self.directions)
-        dictParts = OrderedDict(parts_generator)
+        self._previous_parts = {**self._previous_parts, **self._built_parts}
+        self._built_parts = {}
+        dictParts = OrderedDict()
+        named_parts = self._make_named_parts(workers)
+        while True:
+            with profiling.span('generateParts'):
+                name, part = next(named_parts, (None, None))
+            if part is None:
+                break
+            dictParts[name] = part
+            yield name, part
+        self._parts_cache = (parts_inputs, dictParts)
+        self._previous_parts = {} # (Parts no longer in the directions)
 
-        #TODO: generate top edge, and top face.
-        return dictParts
+    def _make_named_parts(self, workers=None):
+        """ yields name/Part tuples, built from directions in the same order
+            (or reused, see: _reuse_part) """
+        if workers is None:
+            workers = self.workers
+        named_args = OrderedDict()
+        for name, args in self.directions:
+            named_args[name] = args # (a later entry replaces one of the same name)
+        entries = [(name, args, (name, self.part_fingerprint(args)))
+                   for name,args in named_args.items()]
+        missing = OrderedDict() # entries to build, by fingerprint
+        for name, args, key in entries:
+            if key not in self._previous_parts and key not in self._built_parts:
+                missing.setdefault(key, (name, args))
+        self.rebuilt_part_names = [name for name, args, key in entries if key in missing]
+        profiling.count('parts_rebuilt', len(self.rebuilt_part_names))
+        profiling.count('parts_reused', len(entries) - len(self.rebuilt_part_names))
+        # (a few Parts are built here sooner than a process pool starts)
+        parallel = workers > 1 and len(missing) > workers
+        executor = nullcontext()
+        if parallel:
+            # each worker process receives a copy of this Calculator once,
+            # without its pycollada document (see: __getstate__)
+            executor = ProcessPoolExecutor(workers, mp_context=self.worker_context
+                                           ,initializer=_init_part_worker
+                                           ,initargs=(self,))
+        with executor:
+            if parallel:
+                chunksize = max(1, len(missing) // (4*workers))
+                built_parts = executor.map(_make_named_part, missing.values()
+                                           ,chunksize=chunksize)
+            for name, args, key in entries: #name/part tuples
+                if parallel and key in missing and key not in self._built_parts:
+                    self._built_parts[key] = next(built_parts)[1]
+                yield name, self._reuse_part(args, key)
+
+    def part_fingerprint(self, args):
+        """
+        Returns hashable fingerprint of everything the Part built by
+        make_part(**args) depends on: args, & the material
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> args = {"start_edge": ([-1,1,1],[-1,1,-1]), "shrink_edges": {'left', 'bottom'}}
+        >>> key = vect.part_fingerprint(args)
+        >>> key == vect.part_fingerprint(dict(args, shrink_edges={'bottom', 'left'}))
+        True
+        >>> key == vect.part_fingerprint(dict(args, start_edge=([-1,1,1],[-1,1,1])))
+        False
+        >>> vect.material = dict(vect.material, thickness_mm=3)
+        >>> key == vect.part_fingerprint(args)
+        False
+        """
+        return fingerprint((args, self.material, self.depth_xy_corner_cut))
+
+    def _reuse_part(self, args, key=None):
+        """ returns the Part for make_part arguments args: built before with
+            the same key (default: part_fingerprint(args)), or else now """
+        if key is None:
+            key = self.part_fingerprint(args)
+        part = self._built_parts.get(key)
+        if part is None:
+            part = self._previous_parts.get(key)
+        if part is None:
+            part = self.make_part(**args)
+        self._built_parts[key] = part
+        return part
+
+    def forget_parts(self):
+        """ discards the Parts generated so far, so they are all built again """
+        self._parts_cache = None
+        self._built_parts = {}
+        self._previous_parts = {}
+
+    def get_parts_inputs(self):
+        """
+        Returns a fingerprint of everything generateParts output depends on
+
+        (compiled directions are immutable, so a DirectionsPlan is its own
+        fingerprint & compares by identity. Directions given as a list, which
+        may be edited in place, are fingerprinted entry by entry)
+
+        >>> vect = Calculator('test/cube_flipped.dae')
+        >>> vect.get_parts_inputs()[0] is vect.directions
+        True
+        >>> vect.directions = list(vect.directions)
+        >>> inputs = vect.get_parts_inputs()
+        >>> vect.directions[0][1]['shrink_edges'] = {'top': 1.5}
+        >>> inputs == vect.get_parts_inputs()
+        False
+        """
+        plan = self.directions
+        if not isinstance(plan, directions.DirectionsPlan):
+            plan = fingerprint(plan)
+        return (plan, fingerprint(self.material), self.depth_xy_corner_cut)
 
     def isCompleteBottom(self):
         """ returns True if bottom_parts has been fully populated """
@@ -296,6 +814,7 @@ class Calculator(Mesh):
         """
         return 0.5 * self.material['kerf_mm']
 
+    @profiling.profiled('make_part')
     def make_part(self, start_edge, end_edge, part_plane, shrink_edges=[], shrink_axis=0
             ,thickness_direction_negative=True, subtract_parts=[]):
         """
@@ -311,7 +830,8 @@ class Calculator(Mesh):
          sides (top,right,bottom,left) of the part must be translated in
          toward the center to accommodate a butt joint with another part
          ,on that side. OR a dictionary of string keys with values
-         specifying a number of mm part edge is to be translated.
+         specifying a number of mm part edge is to be translated. (OR
+         directions.ShrinkEdges, used without checking them again)
         shrink_axis -- integer, values 0-2 representing axis part is to shrink
           along
         thickness_direction_negative  -- boolean, indicating if part should be
@@ -366,46 +886,36 @@ class Calculator(Mesh):
         sections_needed = self.sectionsNeededToCompleteXyPlaneCut()
         part_thickness_mm = sections_needed*material_thickness_mm
         # define a rectangle for the left side
-        top_vert, bottom_vert = start_edge
-        corner_top_NW = self.get_corner( top_vert)
-        corner_bot_NW = self.get_corner( bottom_vert)
+        # (look up all four corners of the part at once)
+        corners = self.get_corners((*start_edge, *end_edge))
+        corner_top_NW, corner_bot_NW, corner_top_SW, corner_bot_SW = map(list, corners)
         scale = self.ratio_mm_per_unit() #TODO: use both the unit ratio AND geometry transform matrix
         adjust_direction = kerf.adjustment_direction(start_edge, end_edge, shrink_axis)
         # raise error, if any unrecognized shrink directions are specified
-        supported_shrinks = {'left', 'right', 'bottom', 'top'}
-        unsupported_shrink_keys = set(shrink_edges) - supported_shrinks
-        if any(unsupported_shrink_keys):
-            raise TypeError('Unsupported shrink edges: {}'.format(unsupported_shrink_keys))
+        shrink_edges = directions.shrink_distances(shrink_edges)
+        def shrink_distance_mm(edge):
+            distance_mm = shrink_edges[edge]
+            if distance_mm is None: #default to thickness
+                return part_thickness_mm
+            return distance_mm
         # shrink dimensions
         if 'left' in shrink_edges:
             plane = shrink_axis #FIXME: detect which plane the part is oriented on
-            try:
-                translate_distance_mm = float(shrink_edges['left'])
-            except (TypeError, ValueError) as e: #default to thickness
-                translate_distance_mm = part_thickness_mm
+            translate_distance_mm = shrink_distance_mm('left')
             corner_top_NW[plane] -= translate_distance_mm/scale * adjust_direction
             corner_bot_NW[plane] -= translate_distance_mm/scale * adjust_direction
         if 'bottom' in shrink_edges:
             plane = (set(part_plane)-{shrink_axis}).pop()
             adjust_direction = kerf.adjustment_direction(start_edge, end_edge, plane)
-            try:
-                translate_distance_mm = float(shrink_edges['bottom'])
-            except (TypeError, ValueError) as e: #default to thickness
-                translate_distance_mm = part_thickness_mm
+            translate_distance_mm = shrink_distance_mm('bottom')
             corner_bot_NW[plane] += translate_distance_mm/scale * adjust_direction
         if 'top' in shrink_edges:
             plane = (set(part_plane)-{shrink_axis}).pop()
             adjust_direction = kerf.adjustment_direction(start_edge, end_edge, plane)
-            try:
-                translate_distance_mm = float(shrink_edges['top'])
-            except (TypeError, ValueError) as e: #default to thickness
-                translate_distance_mm = part_thickness_mm
+            translate_distance_mm = shrink_distance_mm('top')
             corner_top_NW[plane] -= translate_distance_mm/scale * adjust_direction
         ''' adjust for half of the cutting tool's kerf (other half of kerf lies
             outside our cut line & for the part dimensions can be ignored)'''
-        top_vert, bottom_vert = end_edge
-        corner_bot_SW = self.get_corner( bottom_vert)
-        corner_top_SW = self.get_corner( top_vert)
 
         part_corners = ((corner, axis) for corner in (corner_top_NW, corner_bot_NW) for axis in part_plane)
         adjust_directions = ((c,a, kerf.adjustment_axis_directions((corner_top_NW, corner_bot_NW), (corner_top_SW, corner_bot_SW), shrink_axis, part_plane, c))
@@ -415,8 +925,6 @@ class Calculator(Mesh):
             corner[axis] += material_half_kerf_mm/scale * adjust_direction[axis]
         list_section_poly_outline.append( corner_top_NW)
         list_section_poly_outline.append( corner_bot_NW)
-        # compute final height of north edge #TODO:refactor this into PartSection
-        length_north_edge = self.get_mm_dist( corner_bot_NW, corner_top_NW)
 
         # line segment2
         #make copies of vertici already used
@@ -424,27 +932,18 @@ class Calculator(Mesh):
         if 'right' in shrink_edges:
             plane = shrink_axis #FIXME: detect which plane the part is oriented on
             adjust_direction = kerf.adjustment_direction(start_edge, end_edge, shrink_axis)#TODO: refactor this terrible, duplicative code
-            try: #TODO: eliminate below code duplication
-                translate_distance_mm = float(shrink_edges['right'])
-            except (TypeError, ValueError) as e: #default to thickness
-                translate_distance_mm = part_thickness_mm
+            translate_distance_mm = shrink_distance_mm('right')
             corner_bot_SW[plane] += translate_distance_mm/scale * adjust_direction
             corner_top_SW[plane] += translate_distance_mm/scale * adjust_direction
         if 'bottom' in shrink_edges:
             plane = (set(part_plane)-{shrink_axis}).pop()
             adjust_direction = kerf.adjustment_direction(start_edge, end_edge, plane)
-            try:
-                translate_distance_mm = float(shrink_edges['bottom'])
-            except (TypeError, ValueError) as e: #default to thickness
-                translate_distance_mm = part_thickness_mm
+            translate_distance_mm = shrink_distance_mm('bottom')
             corner_bot_SW[plane] += translate_distance_mm/scale * adjust_direction
         if 'top' in shrink_edges:
             plane = (set(part_plane)-{shrink_axis}).pop()
             adjust_direction = kerf.adjustment_direction(start_edge, end_edge, plane)
-            try:
-                translate_distance_mm = float(shrink_edges['top'])
-            except (TypeError, ValueError) as e: #default to thickness
-                translate_distance_mm = part_thickness_mm
+            translate_distance_mm = shrink_distance_mm('top')
             corner_top_SW[plane] -= translate_distance_mm/scale * adjust_direction
         # adjust for 1/2 of the cutting tool's kerf width
 
@@ -455,8 +954,10 @@ class Calculator(Mesh):
             corner[axis] += material_half_kerf_mm/scale * adjust_direction[axis]
 
         list_section_poly_outline.append( corner_bot_SW )
-        # compute final length of west face
-        length_west_face = self.get_mm_dist( corner_bot_NW, corner_bot_SW) #TODO:rename variable to West
+        # compute final height of north edge & length of west face, together
+        #TODO:refactor this into PartSection
+        length_north_edge, length_west_face = self.get_mm_dists(
+            (corner_bot_NW, corner_bot_NW), (corner_top_NW, corner_bot_SW)).tolist()
         # save human-readable dimensions of the part section
         set_dimensions_mm_tuple = ( length_north_edge,length_west_face)
 
@@ -464,26 +965,23 @@ class Calculator(Mesh):
         list_section_poly_outline.append( corner_top_SW)
         # line segment4
         # add verts to the list of sections to be cut
-        section = PartSection(list_section_poly_outline, set_dimensions_mm_tuple)
-        part_side.insertFrontSection( section)
-        # build additional sections, until the list is thick enough
+        outline = numpy.array(list_section_poly_outline, dtype=numpy.float64)
+        # define all the sections needed to make the part thick enough at once:
+        # each layer shifted material_thickness_mm further along the axis
+        # perpendicular to the part than the last
         grow_axis = ({0,1,2} - set(part_plane)).pop() # perpendicular axis
-        while not self.isCompleteXyPlane( part_side.sections):
-            # clone the xyz coords from the section we just created, into a new list
-            set_dimensions_mm_new = deepcopy(part_side.sections[0].dimensions_mm)
-            list_vertici_new = deepcopy(part_side.sections[0].vertici)
-            section_new = PartSection(list_vertici_new, set_dimensions_mm_new)
-            # now shift the set of lines material_thickness_mm to the Right
-            for vert in section_new.vertici:
-                if thickness_direction_negative:
-                    vert[grow_axis] -= (material_thickness_mm/scale)
-                else:
-                    vert[grow_axis] += (material_thickness_mm/scale)
-            part_side.insertFrontSection( section_new)
+        layer_offset = numpy.zeros(3)
+        layer_offset[grow_axis] = material_thickness_mm/scale
+        if thickness_direction_negative:
+            layer_offset[grow_axis] *= -1
+        layer_count = max(1, sections_needed)
+        # (layers are only stored as the first section, count & offset)
+        section = PartSection(outline, set_dimensions_mm_tuple)
+        part_side.setStackedSections(section, layer_count, layer_offset)
 
         # build any subtractive voids
         for subtract_part_args in subtract_parts:
-            subtract_part = self.make_part(**subtract_part_args)
+            subtract_part = self._reuse_part(subtract_part_args)
             part_side.insertSubtractPart(subtract_part)
 
         # save input parameters
@@ -519,8 +1017,8 @@ class Calculator(Mesh):
         (129.4, 0.0)
         """
         # get the starting corner, from each shape
-        part_vert1 = part.sections[0].vertici[0]
-        void_vert1 = void.sections[0].vertici[0]
+        part_vert1 = part.getFirstVertex()
+        void_vert1 = void.getFirstVertex()
         # get planar axis that the part is aligned along
         first_dim, second_dim = part.make_args['part_plane']
         # compute offsets
@@ -542,8 +1040,8 @@ class Calculator(Mesh):
         >>> Calculator('test/cube.dae').get_collada_unit_dist( [1,0,0], [0,0,0])
         1.0
         """
-        from scipy.spatial.distance import euclidean
-        return euclidean( list_coord_tuple1, list_coord_tuple2)
+        delta = numpy.subtract(list_coord_tuple1, list_coord_tuple2)
+        return float(numpy.linalg.norm(delta))
 
     def get_unit_dist( self, mm_dist, list_coord_unit_vector):
         """
@@ -556,7 +1054,7 @@ class Calculator(Mesh):
         dist_vector = numpy.array(list_coord_unit_vector).dot( mm_dist)
         dist_vector_4x1 = dist_vector.tolist()[:]
         dist_vector_4x1.append( 1)#extend to 4x1, for scaling
-        scale = self.getFirstTransformOfFirstScene().matrix
+        scale = self.transform_matrix()
         dist_vector_scaled = scale.dot(dist_vector_4x1)[0:3]
         return self.get_collada_unit_dist( [0,0,0], dist_vector_scaled)
 
@@ -564,23 +1062,80 @@ class Calculator(Mesh):
         """
         Computes distance between two 3d coords, measured in millimeters.
 
-        (coordinate units are converted to mm using our hardcoded scale factor.
-        If we were really diligent, we could probably find the XML element from
-        the loaded COLLADA file that defines the per-file scale.)
+        (coordinate units are converted to mm using the per-file scale & the
+        transform of the loaded COLLADA file's scene, see: get_mm_dists)
         >>> d = Calculator('test/cube.dae').get_mm_dist( [120/(0.0254*1000),0,0], [0,0,0])
         >>> round( d, 4)
         120.0
         """
-        scale = self.ratio_mm_per_unit()
-        # transform the 3d coords, as specified by the COLLADA file's scene.
-        transform_matrix = self.getFirstTransformOfFirstScene().matrix
-
-        list_coord_tuple1_4x1 = list_coord_tuple1[:]
-        list_coord_tuple1_4x1.append(1)
-        coord1 = transform_matrix.dot( list_coord_tuple1_4x1)
-        list_coord_tuple2_4x1 = list_coord_tuple2[:]
-        list_coord_tuple2_4x1.append(1)
-        coord2 = transform_matrix.dot(list_coord_tuple2_4x1)
-        length_collada_unit = self.get_collada_unit_dist( coord1[0:3], coord2[0:3])
-        # now convert the COLLADA Unit length into mm
-        return length_collada_unit * scale
+        return float(self.get_mm_dists([list_coord_tuple1], [list_coord_tuple2])[0])
+
+    def get_mm_dists( self, coords1, coords2):
+        """
+        Computes distances between N pairs of 3d coords, measured in millimeters.
+
+        Returns a numpy array of N distances, between each row of coords1 and
+        the same row of coords2 (both (N,3) array-likes).
+
+        >>> d = Calculator('test/cube.dae').get_mm_dists(
+        ...     [[120/(0.0254*1000),0,0], [0,0,1]], [[0,0,0], [0,0,0]])
+        >>> d.round(4).tolist()
+        [120.0, 25.4]
+        """
+        if self._mm_per_unit_matrix is None:
+            # translation cancels out when subtracting two transformed coords,
+            # so only the linear part of the scene transform is needed
+            linear = numpy.asarray(self.transform_matrix(), dtype=numpy.float64)[:3, :3]
+            self._mm_per_unit_matrix = linear.T * self.ratio_mm_per_unit()
+        coords1 = numpy.reshape(numpy.asarray(coords1, dtype=numpy.float64), (-1, 3))
+        coords2 = numpy.reshape(numpy.asarray(coords2, dtype=numpy.float64), (-1, 3))
+        profiling.count('distance_computations', len(coords1))
+        deltas_mm = (coords1 - coords2).dot(self._mm_per_unit_matrix)
+        return numpy.sqrt(numpy.einsum('ij,ij->i', deltas_mm, deltas_mm))
+
+def fingerprint(value):
+    """
+    Returns a hashable copy of value (e.g. make_part arguments), made of
+    nested tuples, equal for equal values
+
+    >>> fingerprint({'b': [1, 2], 'a': {'x'}})
+    ('dict', (('a', ('set', frozenset({'x'}))), ('b', ('list', (1, 2)))))
+    """
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted((key, fingerprint(item)) for key, item in value.items())))
+    if isinstance(value, (set, frozenset)):
+        return ('set', frozenset(fingerprint(item) for item in value))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(fingerprint(item) for item in value))
+    return value
+
+def iter_voids(part):
+    """ yields each void of Part part, & the voids of those voids, in order
+
+    >>> outer, inner, hole = Part(), Part(), Part()
+    >>> inner.insertSubtractPart(hole)
+    >>> outer.insertSubtractPart(inner)
+    >>> [void is hole for void in iter_voids(outer)]
+    [False, True]
+    """
+    for void in part.voids:
+        yield void
+        yield from iter_voids(void)
+
+_worker_calculator = None
+# Calculator used by make_part calls, in a generateParts worker process
+
+def _init_part_worker(calculator):
+    """ stores the Calculator, for this generateParts worker process """
+    global _worker_calculator
+    _worker_calculator = calculator
+
+def _make_variant_parts(material):
+    """ returns Parts generated by this worker's Calculator, for material """
+    _worker_calculator.material = material
+    return _worker_calculator.generateParts(workers=1)
+
+def _make_named_part(name_and_args):
+    """ returns a name/Part tuple, built by this worker's Calculator """
+    name, args = name_and_args
+    return name, _worker_calculator.make_part(**args)
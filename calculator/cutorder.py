@@ -0,0 +1,299 @@
+"""
+Module, defining an optimizer of the order the paths of a drawing are cut in,
+to shorten the rapid travel of a laser cutter or CNC mill between them
+
+Paths are ordered nearest neighbour first, found with a grid index of their
+start points, then improved by 2-opt moves (reversing runs of the order,
+while that shortens the total travel). Each hole is always cut before the
+outline of the piece it is in, so the piece is not loose while it is cut.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import math
+
+import numpy
+
+from . import export
+from . import profiling
+
+MAX_PASSES = 50
+""" most passes of 2-opt moves over the whole order (see: improve_order) """
+
+GAIN_TOLERANCE_MM = 1e-9
+""" least travel a 2-opt move must save, to be made """
+
+class GridIndex:
+    """
+    object representing a set of points, bucketed into square grid cells
+    for finding the nearest one quickly
+
+    >>> grid = GridIndex(numpy.array([[0., 0], [5, 5], [9, 1]]), 2.0)
+    >>> grid.add(0); grid.add(1); grid.add(2)
+    >>> grid.pop_nearest((8, 0)), grid.pop_nearest((8, 0)), len(grid)
+    (2, 1, 1)
+    """
+
+    def __init__(self, points, cell_mm):
+        self.points = points
+        self.cell_mm = cell_mm
+        self.cells = {}
+        self.count = 0
+
+    def cell(self, point):
+        """ returns (column, row) of the grid cell containing point """
+        return (math.floor(point[0] / self.cell_mm), math.floor(point[1] / self.cell_mm))
+
+    def add(self, index):
+        """ adds the point points[index] to the index """
+        self.cells.setdefault(self.cell(self.points[index]), []).append(index)
+        self.count += 1
+
+    def __len__(self):
+        """ returns number of points in the index """
+        return self.count
+
+    def pop_nearest(self, point):
+        """
+        Removes & returns index of the indexed point nearest point (or None)
+
+        Rings of cells around point are searched outwards, until no cell of
+        the next ring can hold a nearer point.
+        """
+        if not self.count:
+            return None
+        column, row = self.cell(point)
+        best, best_mm = None, math.inf
+        radius = 0
+        while best is None or (radius - 1) * self.cell_mm <= best_mm:
+            for cell in ring_cells(column, row, radius):
+                for index in self.cells.get(cell, ()):
+                    distance_mm = math.hypot(self.points[index][0] - point[0]
+                                             ,self.points[index][1] - point[1])
+                    if distance_mm < best_mm or (distance_mm == best_mm and index < best):
+                        best, best_mm = index, distance_mm
+            radius += 1
+        cell = self.cells[self.cell(self.points[best])]
+        cell.remove(best)
+        self.count -= 1
+        return best
+
+def ring_cells(column, row, radius):
+    """
+    Yields (column, row) of the cells on the square ring radius cells around
+    a cell
+
+    >>> list(ring_cells(0, 0, 0)), len(list(ring_cells(0, 0, 2)))
+    ([(0, 0)], 16)
+    """
+    if radius == 0:
+        yield column, row
+        return
+    for offset in range(-radius, radius+1):
+        yield column + offset, row - radius
+        yield column + offset, row + radius
+    for offset in range(-radius+1, radius):
+        yield column - radius, row + offset
+        yield column + radius, row + offset
+
+def path_owners(paths):
+    """
+    Returns list of the index of the outline each path must be cut before
+    (or None, for outlines)
+
+    paths -- list of (layer, (N,2) numpy array) paths (see: export.Drawing),
+      in which each piece's OUTLINE is followed by the HOLEs inside it
+
+    >>> square = numpy.zeros((4, 2))
+    >>> path_owners([(export.OUTLINE, square), (export.HOLE, square)
+    ...              ,(export.OUTLINE, square)])
+    [None, 0, None]
+    """
+    owners = []
+    outline = None
+    for index, (layer, path) in enumerate(paths):
+        if layer == export.HOLE:
+            owners.append(outline)
+        else:
+            outline = index
+            owners.append(None)
+    return owners
+
+def holes_first_order(owners):
+    """
+    Returns list of path indices: the drawn order, with the holes of each
+    outline moved in front of it (see: path_owners)
+
+    >>> holes_first_order([None, 0, 0, None])
+    [1, 2, 0, 3]
+    """
+    holes = {} # hole indices, by the index of their outline
+    for index, owner in enumerate(owners):
+        if owner is not None:
+            holes.setdefault(owner, []).append(index)
+    order = []
+    for index, owner in enumerate(owners):
+        if owner is None:
+            order.extend(holes.get(index, []))
+            order.append(index)
+    return order
+
+def travel_mm(points, order, start=(0.0, 0.0)):
+    """
+    Returns mm of rapid travel, from start through points in order
+
+    (each path is closed, so its cut ends where it starts: at its point)
+
+    >>> travel_mm(numpy.array([[3., 4], [3, 0]]), [0, 1])
+    9.0
+    """
+    route = numpy.concatenate(([start], numpy.asarray(points)[list(order)]))
+    return float(numpy.sum(numpy.hypot(*numpy.diff(route, axis=0).T)))
+
+def nearest_neighbour_order(points, owners, start=(0.0, 0.0)):
+    """
+    Returns list of point indices: each next one the nearest point not yet
+    visited, that is not an outline with holes left to cut (see: path_owners)
+
+    >>> points = numpy.array([[1., 0], [9, 0], [2, 0]])
+    >>> nearest_neighbour_order(points, [None, None, None])
+    [0, 2, 1]
+    >>> nearest_neighbour_order(points, [None, 0, None]) # hole 1 is in outline 0
+    [2, 1, 0]
+    """
+    if not len(points):
+        return []
+    holes_left = [0] * len(points)
+    for owner in owners:
+        if owner is not None:
+            holes_left[owner] += 1
+    extent = numpy.ptp(points, axis=0)
+    cell_mm = max(math.sqrt(float(extent[0] * extent[1]) / len(points))
+                  ,float(max(extent)) / len(points), 1.0)
+    grid = GridIndex(points, cell_mm)
+    for index, count in enumerate(holes_left):
+        if not count:
+            grid.add(index)
+    order = []
+    position = start
+    while len(grid):
+        index = grid.pop_nearest(position)
+        order.append(index)
+        position = points[index]
+        owner = owners[index]
+        if owner is not None:
+            holes_left[owner] -= 1
+            if not holes_left[owner]:
+                grid.add(owner) # (all its holes are cut)
+    return order
+
+def improve_order(points, owners, order, start=(0.0, 0.0), max_passes=MAX_PASSES):
+    """
+    Returns list of point indices: order, shortened by 2-opt moves
+
+    A move reverses a run of the order, when that shortens the travel &
+    still cuts every hole before its outline.
+
+    >>> points = numpy.array([[1., 0], [2, 0], [3, 0], [4, 0]])
+    >>> improve_order(points, [None]*4, [0, 2, 1, 3])
+    [0, 1, 2, 3]
+    >>> improve_order(points, [None, None, 1, None], [0, 2, 1, 3])
+    [0, 2, 1, 3]
+    """
+    count = len(order)
+    # route[0] is the start; route[i+1] the point cut i-th
+    route = numpy.concatenate(([start], numpy.asarray(points, dtype=numpy.float64)[order]))
+    order = numpy.array(order, dtype=numpy.intp)
+    owners = numpy.array([-1 if owner is None else owner for owner in owners]
+                         ,dtype=numpy.intp)
+    for _ in range(max_passes):
+        improved = False
+        for first in range(1, count):
+            # reverse route[first:last+1], for a last in first+1 .. count
+            positions = numpy.empty(len(points) + 1, dtype=numpy.intp)
+            positions[order] = numpy.arange(1, count+1)
+            positions[-1] = count + 1 # (for points without an owner)
+            # a hole's outline after it must stay after it: last < owner position
+            owner_positions = positions[owners[order[first-1:]]]
+            limit = min(count, int(owner_positions.min()) - 1)
+            if limit <= first:
+                continue
+            lasts = numpy.arange(first+1, limit+1)
+            before, after = route[first-1], route[first]
+            ends = route[lasts]
+            nexts = route[numpy.minimum(lasts+1, count)]
+            has_next = lasts < count
+            gains = (numpy.hypot(*(after - before)) - numpy.hypot(*(ends - before).T)
+                     + has_next * (numpy.hypot(*(nexts - ends).T)
+                                   - numpy.hypot(*(nexts - after).T)))
+            best = int(numpy.argmax(gains))
+            if gains[best] > GAIN_TOLERANCE_MM:
+                last = int(lasts[best])
+                route[first:last+1] = route[first:last+1][::-1].copy()
+                order[first-1:last] = order[first-1:last][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order.tolist()
+
+@profiling.profiled('cutorder.optimize_drawing')
+def optimize_drawing(drawing, start=(0.0, 0.0)):
+    """
+    Returns (Drawing, mm of travel before, mm of travel after) tuple: the
+    paths of drawing reordered to shorten the travel between them
+
+    Each path is cut from its first point, which is where the cut ends too.
+    Travel before is that of the drawn order with holes moved in front of
+    their outline (see: holes_first_order), the order cut if none shorter
+    is found.
+
+    >>> square = numpy.array([[0., 0], [10, 0], [10, 10], [0, 10]])
+    >>> drawing = export.Drawing(40, 20, [(export.OUTLINE, square + [20, 0])
+    ...                                   ,(export.HOLE, square / 2 + [22, 2])
+    ...                                   ,(export.OUTLINE, square)])
+    >>> ordered, before, after = optimize_drawing(drawing)
+    >>> [(layer, path[0].tolist()) for layer, path in ordered.paths]
+    [('OUTLINE', [0.0, 0.0]), ('HOLE', [22.0, 2.0]), ('OUTLINE', [20.0, 0.0])]
+    >>> round(before, 2), round(after, 2)
+    (44.92, 24.92)
+
+    Paths already in a shorter order than the one found are kept as they are
+    (but for holes, which are always cut first)
+
+    >>> points = [[4., 0], [-2, 0], [-5, 0], [-5, 3]]
+    >>> drawing = export.Drawing(10, 10, [(export.OUTLINE, numpy.array([point]))
+    ...                                   for point in points])
+    >>> ordered, before, after = optimize_drawing(drawing)
+    >>> ordered.paths == drawing.paths, before, after
+    (True, 16.0, 16.0)
+    >>> drawing = export.Drawing(40, 20, [(export.OUTLINE, square * 4)
+    ...                                   ,(export.HOLE, square + [10, 10])])
+    >>> ordered, before, after = optimize_drawing(drawing)
+    >>> [layer for layer, path in ordered.paths], round(before, 2), round(after, 2)
+    (['HOLE', 'OUTLINE'], 28.28, 28.28)
+    """
+    paths = drawing.paths
+    points = numpy.array([path[0] for layer, path in paths], dtype=numpy.float64).reshape(-1, 2)
+    owners = path_owners(paths)
+    drawn_order = holes_first_order(owners)
+    before_mm = travel_mm(points, drawn_order, start)
+    order = improve_order(points, owners, nearest_neighbour_order(points, owners, start), start)
+    after_mm = travel_mm(points, order, start)
+    if after_mm >= before_mm: # (no shorter order found)
+        order, after_mm = drawn_order, before_mm
+    return (export.Drawing(drawing.width_mm, drawing.height_mm, [paths[index] for index in order])
+            ,before_mm, after_mm)
@@ -0,0 +1,351 @@
+"""
+Module, defining a compiler of mold part directions (the list of (name,
+make_part arguments) tuples a directions .py file defines) into a compact,
+validated DirectionsPlan
+
+Every entry is checked & normalized once, when compiled: shrink_edges
+become ShrinkEdges (distances in mm, already parsed), which make_part uses
+as-is. A plan is stored as typed arrays, so it can be cached (see: load_plan)
+& read again without parsing the directions file's Python source.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from ast import literal_eval
+from collections.abc import Sequence
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy
+
+from . import profiling
+from .cache import file_hash, remove_file
+
+PLAN_VERSION = 1
+""" version of the cached plan format (cached plans of other versions are
+compiled again) """
+
+SHRINK_EDGES = ('left', 'right', 'bottom', 'top')
+""" edges make_part can shrink, in the column order of a plan """
+
+ARGUMENTS = ('start_edge', 'end_edge', 'part_plane', 'shrink_edges', 'shrink_axis'
+             ,'thickness_direction_negative', 'subtract_parts')
+""" make_part arguments a directions entry may give (the first 3 required) """
+
+SHRINK_ABSENT, SHRINK_MM, SHRINK_THICKNESS = 0, 1, 2
+""" plan codes of an edge: not shrunk, shrunk by a distance in mm, or
+shrunk by the part thickness """
+
+class ShrinkEdges(dict):
+    """
+    object representing a make_part shrink_edges argument, validated: a dict
+    of the distance in mm each edge is shrunk by (None: the part thickness)
+    """
+
+def shrink_distances(shrink_edges):
+    """
+    Returns ShrinkEdges for a make_part shrink_edges argument (a collection
+    of edge names, or a dict of distances in mm by edge name)
+
+    Distances that are not numbers (e.g. 'joint-default') mean the part
+    thickness. ShrinkEdges are returned as-is.
+
+    >>> shrink_distances({'left': '148.9', 'bottom': 'joint-default'})
+    {'left': 148.9, 'bottom': None}
+    >>> shrink_distances(['top'])
+    {'top': None}
+    >>> shrink_distances({'middle'})
+    Traceback (most recent call last):
+       ...
+    TypeError: Unsupported shrink edges: {'middle'}
+    """
+    if isinstance(shrink_edges, ShrinkEdges):
+        return shrink_edges
+    unsupported_shrink_keys = set(shrink_edges) - set(SHRINK_EDGES)
+    if unsupported_shrink_keys:
+        raise TypeError('Unsupported shrink edges: {}'.format(unsupported_shrink_keys))
+    distances = ShrinkEdges()
+    for edge in shrink_edges:
+        try:
+            distances[edge] = float(shrink_edges[edge])
+        except (TypeError, ValueError): #default to thickness
+            distances[edge] = None
+    return distances
+
+def read_directions_file(directions_path):
+    """ returns the anonymous list a directions .py file defines """
+    with profiling.span('directions.parse'):
+        with open(directions_path) as parts_file:
+            return literal_eval(parts_file.read())
+
+class DirectionsPlan(Sequence):
+    """
+    object representing compiled directions: a read-only sequence of (name,
+    make_part arguments) tuples, stored as one row of typed arrays per Part
+    & per void (see: compile_directions)
+
+    Entries are built from the arrays when accessed, with every make_part
+    argument given. Plans are immutable, so copies are the plan itself.
+
+    >>> plan = compile_directions([("Left", {"start_edge": ([-1,1,1],[-1,1,-1])
+    ...                                    ,"end_edge": ([1,1,1],[1,1,-1])
+    ...                                    ,"part_plane": (0,2)
+    ...                                    ,"shrink_edges": {"bottom"}})])
+    >>> len(plan), plan[0][0], plan[0][1]['shrink_edges']
+    (1, 'Left', {'bottom': None})
+    >>> plan[0][1]['start_edge'], plan[0][1]['thickness_direction_negative']
+    (([-1, 1, 1], [-1, 1, -1]), True)
+    >>> from copy import deepcopy
+    >>> deepcopy(plan) is plan, plan == compile_directions(list(plan))
+    (True, True)
+    """
+    ARRAYS = ('names', 'start_edges', 'end_edges', 'part_planes', 'shrink_axes'
+              ,'thickness_negative', 'shrink_codes', 'shrink_mm', 'void_starts'
+              ,'void_counts')
+    """ names of the arrays a plan is stored as: names of the entries, then
+    one row per entry, then per void (each row's voids are consecutive rows,
+    void_counts of them from void_starts) """
+
+    def __init__(self, arrays):
+        """ arrays -- dict of numpy arrays, by each of ARRAYS """
+        for name in self.ARRAYS:
+            array = numpy.asarray(arrays[name])
+            array.flags.writeable = False
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[row] for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('directions plan index out of range')
+        return str(self.names[index]), self.arguments(index)
+
+    def arguments(self, row):
+        """ returns dict of make_part arguments, of row (an entry or void) """
+        shrink_edges = ShrinkEdges()
+        for edge, code, distance_mm in zip(SHRINK_EDGES, self.shrink_codes[row].tolist()
+                                           ,self.shrink_mm[row].tolist()):
+            if code == SHRINK_MM:
+                shrink_edges[edge] = distance_mm
+            elif code == SHRINK_THICKNESS:
+                shrink_edges[edge] = None
+        void_start = int(self.void_starts[row])
+        return {'start_edge': tuple(self.start_edges[row].tolist())
+                ,'end_edge': tuple(self.end_edges[row].tolist())
+                ,'part_plane': tuple(self.part_planes[row].tolist())
+                ,'shrink_edges': shrink_edges
+                ,'shrink_axis': int(self.shrink_axes[row])
+                ,'thickness_direction_negative': bool(self.thickness_negative[row])
+                ,'subtract_parts': [self.arguments(void_row) for void_row in range(
+                    void_start, void_start + int(self.void_counts[row]))]}
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, DirectionsPlan):
+            return NotImplemented
+        return all(numpy.array_equal(getattr(self, name), getattr(other, name))
+                   for name in self.ARRAYS)
+
+    __hash__ = None
+
+    def __deepcopy__(self, memo):
+        return self
+
+def compile_directions(directions):
+    """
+    Returns DirectionsPlan of directions (a list of (name, make_part
+    arguments) tuples), validated
+
+    Raises ValueError naming the first invalid entry.
+
+    >>> compile_directions([("Top", {"start_edge": ([1,1,1],[1,1,-1])
+    ...                             ,"end_edge": ([1,-1,1],[1,-1,-1])
+    ...                             ,"part_plane": (1,1)})])
+    Traceback (most recent call last):
+       ...
+    ValueError: Invalid directions entry 1 (Top): part_plane must be 2 different axes 0-2
+    """
+    rows = [] # make_part arguments dicts, of every entry then void
+    names = []
+    void_ranges = []
+    for index, entry in enumerate(directions):
+        try:
+            name, arguments = entry
+            names.append(str(name))
+            rows.append(arguments)
+            check_arguments(arguments)
+        except (TypeError, ValueError) as e:
+            raise ValueError('Invalid directions entry {} ({}): {}'.format(
+                index+1, entry[0] if isinstance(entry, (list, tuple)) else entry, e))
+    # (append each row's voids as consecutive rows, breadth first)
+    for arguments in rows:
+        void_ranges.append((len(rows), len(arguments.get('subtract_parts', []))))
+        rows.extend(arguments.get('subtract_parts', []))
+    shrink_codes = numpy.zeros((len(rows), len(SHRINK_EDGES)), dtype=numpy.int8)
+    shrink_mm = numpy.zeros((len(rows), len(SHRINK_EDGES)))
+    for row, arguments in enumerate(rows):
+        distances = shrink_distances(arguments.get('shrink_edges', []))
+        for column, edge in enumerate(SHRINK_EDGES):
+            if edge not in distances:
+                continue
+            if distances[edge] is None:
+                shrink_codes[row, column] = SHRINK_THICKNESS
+            else:
+                shrink_codes[row, column] = SHRINK_MM
+                shrink_mm[row, column] = distances[edge]
+    return DirectionsPlan({
+        'names': numpy.array(names, dtype=str)
+        ,'start_edges': numpy.array([arguments['start_edge'] for arguments in rows]
+                                    ,dtype=numpy.int8).reshape(-1, 2, 3)
+        ,'end_edges': numpy.array([arguments['end_edge'] for arguments in rows]
+                                  ,dtype=numpy.int8).reshape(-1, 2, 3)
+        ,'part_planes': numpy.array([arguments['part_plane'] for arguments in rows]
+                                    ,dtype=numpy.int8).reshape(-1, 2)
+        ,'shrink_axes': numpy.array([arguments.get('shrink_axis', 0) for arguments in rows]
+                                    ,dtype=numpy.int8)
+        ,'thickness_negative': numpy.array(
+            [arguments.get('thickness_direction_negative', True) for arguments in rows]
+            ,dtype=bool)
+        ,'shrink_codes': shrink_codes
+        ,'shrink_mm': shrink_mm
+        ,'void_starts': numpy.array([start for start, count in void_ranges], dtype=numpy.int32)
+        ,'void_counts': numpy.array([count for start, count in void_ranges], dtype=numpy.int32)})
+
+def check_arguments(arguments):
+    """
+    Raises ValueError (or TypeError) if make_part arguments are invalid,
+    including those of their subtract_parts
+
+    >>> check_arguments({"start_edge": ([1,1,1],[1,1,-1]), "end_edge": ([1,-1,1],[1,-1,2])
+    ...                  ,"part_plane": (1,2)})
+    Traceback (most recent call last):
+       ...
+    ValueError: end_edge must be 2 corners, of 3 directions each -1 or 1
+    >>> check_arguments({"start_edge": ([1,1,1],[1,1,-1]), "end_edge": ([1,-1,1],[1,-1,-1])
+    ...                  ,"part_plane": (1,2), "shrink_edges": {"left": 10}, "depth": 2})
+    Traceback (most recent call last):
+       ...
+    ValueError: unsupported arguments: ['depth']
+    """
+    if not isinstance(arguments, dict):
+        raise TypeError('make_part arguments must be a dict')
+    unsupported = set(arguments) - set(ARGUMENTS)
+    if unsupported:
+        raise ValueError('unsupported arguments: {}'.format(sorted(unsupported)))
+    missing = [name for name in ARGUMENTS[:3] if name not in arguments]
+    if missing:
+        raise ValueError('missing arguments: {}'.format(missing))
+    for name in ('start_edge', 'end_edge'):
+        edge = arguments[name]
+        if len(edge) != 2 or any(len(corner) != 3 or not all(value in (-1, 1) for value in corner)
+                                 for corner in edge):
+            raise ValueError('{} must be 2 corners, of 3 directions each -1 or 1'.format(name))
+    part_plane = tuple(arguments['part_plane'])
+    if len(part_plane) != 2 or len(set(part_plane)) != 2 or not set(part_plane) <= {0, 1, 2}:
+        raise ValueError('part_plane must be 2 different axes 0-2')
+    if arguments.get('shrink_axis', 0) not in (0, 1, 2):
+        raise ValueError('shrink_axis must be an axis 0-2')
+    shrink_distances(arguments.get('shrink_edges', []))
+    for subtract_part in arguments.get('subtract_parts', []):
+        check_arguments(subtract_part)
+
+def plan_path(directions_path, cache):
+    """ returns path of the cached plan, for the directions file at
+        directions_path, in calculator.cache.MeshCache cache's directory """
+    key = hashlib.sha256(os.path.abspath(directions_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache.directory, 'directions-{}-v{}.npz'.format(key, PLAN_VERSION))
+
+def load_plan(directions_path, cache=None):
+    """
+    Returns DirectionsPlan of the directions file at directions_path
+
+    cache -- (optional) calculator.cache.MeshCache, to keep the compiled
+      plan in. It is read from the cache again while the file's modification
+      time & size (or else its contents' hash) are unchanged, without
+      parsing the file. (If the plan can't be cached, e.g. in a read-only
+      cache directory, the compiled plan is returned all the same)
+
+    >>> from tempfile import TemporaryDirectory
+    >>> from calculator.cache import MeshCache
+    >>> with TemporaryDirectory() as directory:
+    ...    cache = MeshCache(directory)
+    ...    plan = load_plan('test/cube_flipped.py', cache)
+    ...    profiling.enable()
+    ...    cached_plan = load_plan('test/cube_flipped.py', cache)
+    ...    profiling.disable()
+    >>> cached_plan == plan, 'directions.parse' in profiling.report()['spans']
+    (True, False)
+    >>> profiling.reset()
+    >>> [name for name, arguments in cached_plan][:3]
+    ['Bottom', 'Top-i', 'Top-ii']
+    >>> load_plan('test/cube_flipped.py', MeshCache('test/cube.dae')) == plan # (not a directory)
+    True
+    """
+    if cache is None:
+        return compile_directions(read_directions_file(directions_path))
+    path = plan_path(directions_path, cache)
+    stat = os.stat(directions_path)
+    stamp = [stat.st_mtime_ns, stat.st_size]
+    try:
+        plan, cached_stamp, cached_hash = read_plan(path)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        plan = None # missing or unreadable: compile it again
+    if plan is not None and cached_stamp == stamp:
+        try:
+            os.utime(path) # mark as recently used
+        except OSError:
+            pass # (e.g. just evicted by another process: the plan is read)
+        return plan
+    source_hash = file_hash(directions_path)
+    if plan is None or cached_hash != source_hash:
+        plan = compile_directions(read_directions_file(directions_path))
+    try:
+        write_plan(path, plan, stamp, source_hash) # (or only update its stamp)
+        cache.evict(keep=path)
+    except OSError:
+        pass # (not cached)
+    return plan
+
+def read_plan(path):
+    """ returns (DirectionsPlan, stamp, hash) tuple: a plan saved to path,
+        with the stamp & hash of its directions file (see: write_plan) """
+    with profiling.span('directions.cache_load'):
+        with numpy.load(path, allow_pickle=False) as arrays:
+            plan = DirectionsPlan({name: arrays[name] for name in DirectionsPlan.ARRAYS})
+            return plan, arrays['stamp'].tolist(), str(arrays['source_hash'])
+
+def write_plan(path, plan, stamp, source_hash):
+    """ saves DirectionsPlan plan to path (atomically, via a temporary file),
+        with the stamp & hash of its directions file """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    arrays = {name: getattr(plan, name) for name in DirectionsPlan.ARRAYS}
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as temp_file:
+        try:
+            numpy.savez(temp_file, stamp=stamp, source_hash=source_hash, **arrays)
+        except OSError:
+            remove_file(temp_file.name)
+            raise
+    os.replace(temp_file.name, path)
@@ -0,0 +1,231 @@
+"""
+Module, defining writers of 2d vector drawings (SVG, DXF & EPS) of the
+PartSections to cut, in millimeters
+
+Drawings are written path by path, straight from numpy arrays of mm coords at
+full float precision, for laser cutters & CNC mills.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from collections import namedtuple
+import math
+import os
+import re
+
+import numpy
+
+from . import profiling
+
+OUTLINE = 'OUTLINE'
+""" layer of paths that outline a PartSection """
+HOLE = 'HOLE'
+""" layer of paths that outline a void (hole) in a PartSection """
+
+PIECE_SPACING_MM = 5.0
+""" default gap between pieces laid out in one drawing, & around them """
+
+LINE_WIDTH_MM = 0.1
+""" stroke width of drawn paths (a hairline, for laser cutters) """
+
+POINTS_PER_MM = 72 / 25.4
+""" PostScript points per millimeter """
+
+Drawing = namedtuple('Drawing', ['width_mm', 'height_mm', 'paths'])
+Drawing.__doc__ = """
+2d vector drawing, of one or more pieces to cut
+
+width_mm, height_mm -- size of the drawing
+paths -- list of (layer, outline) tuples: the OUTLINE or HOLE layer, & an
+  (N,2) numpy array of the mm x,y coords of a closed polygon. (Origin is the
+  bottom left corner of the drawing, with y increasing upwards)
+"""
+
+def layout_pieces(pieces, spacing_mm=PIECE_SPACING_MM):
+    """
+    Returns a Drawing of pieces, laid out left to right in one row
+
+    pieces -- list of pieces, each a list of (layer, (N,2) numpy array) paths
+      (see: Calculator.get_part_pieces_mm)
+
+    >>> square = numpy.array([[0., 0], [10, 0], [10, 10], [0, 10]])
+    >>> drawing = layout_pieces([[(OUTLINE, square)], [(OUTLINE, square + 3)]])
+    >>> drawing.width_mm, drawing.height_mm
+    (35.0, 20.0)
+    >>> [path[0].tolist() for layer, path in drawing.paths]
+    [[5.0, 5.0], [20.0, 5.0]]
+    """
+    paths = []
+    x_mm = spacing_mm
+    height_mm = 0.0
+    for piece in pieces:
+        if not piece:
+            continue
+        coords = numpy.concatenate([path for layer, path in piece])
+        minimum, maximum = coords.min(axis=0), coords.max(axis=0)
+        shift = numpy.array([x_mm, spacing_mm]) - minimum
+        paths.extend((layer, path + shift) for layer, path in piece)
+        x_mm += float(maximum[0] - minimum[0]) + spacing_mm
+        height_mm = max(height_mm, float(maximum[1] - minimum[1]))
+    return Drawing(x_mm, height_mm + 2*spacing_mm, paths)
+
+def write_drawing(file_path, drawing):
+    """
+    Saves drawing to file_path, in the format named by its file extension
+
+    >>> write_drawing('part.png', Drawing(1, 1, []))
+    Traceback (most recent call last):
+       ...
+    ValueError: Unsupported drawing format: .png (expected: .dxf, .eps, .svg)
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError('Unsupported drawing format: {} (expected: {})'.format(
+            extension, ', '.join(sorted(WRITERS))))
+    with profiling.span('drawing.write'), \
+         open(file_path, 'w', encoding='ascii', newline='\n') as out:
+        WRITERS[extension](out, drawing)
+        profiling.count('bytes_written', out.tell())
+
+def write_svg(out, drawing):
+    """
+    Writes drawing to text file-like object out, as an SVG image in mm
+
+    >>> import io
+    >>> svg = io.StringIO()
+    >>> write_svg(svg, Drawing(10, 20, [(HOLE, numpy.array([[1, 2], [3.25, 2], [3, 4]]))]))
+    >>> print(svg.getvalue(), end='')
+    <?xml version="1.0" encoding="utf-8"?>
+    <svg xmlns="http://www.w3.org/2000/svg" width="10mm" height="20mm" viewBox="0 0 10 20">
+    <g fill="none" stroke="black" stroke-width="0.1">
+    <path class="hole" d="M1 18 L3.25 18 L3 16 Z"/>
+    </g>
+    </svg>
+    """
+    out.write('<?xml version="1.0" encoding="utf-8"?>\n'
+              '<svg xmlns="http://www.w3.org/2000/svg" width="{0}mm" height="{1}mm"'
+              ' viewBox="0 0 {0} {1}">\n'
+              '<g fill="none" stroke="black" stroke-width="{2}">\n'.format(
+                  format_number(drawing.width_mm), format_number(drawing.height_mm)
+                  ,format_number(LINE_WIDTH_MM)))
+    for layer, path in drawing.paths:
+        # (SVG y coords increase downwards)
+        points = ['{} {}'.format(format_number(x), format_number(drawing.height_mm - y))
+                  for x, y in path.tolist()]
+        out.write('<path class="{}" d="M{} Z"/>\n'.format(layer.lower(), ' L'.join(points)))
+    out.write('</g>\n</svg>\n')
+
+def write_dxf(out, drawing):
+    """
+    Writes drawing to text file-like object out, as an AutoCAD R12 DXF in mm
+
+    Each path is a closed POLYLINE entity, on the OUTLINE or HOLE layer.
+    (R12 has no header variable for drawing units: coordinates are in mm,
+    to be imported as such)
+
+    >>> import io
+    >>> dxf = io.StringIO()
+    >>> write_dxf(dxf, Drawing(10, 20, [(OUTLINE, numpy.array([[1, 2], [3.25, 2], [3, 4]]))]))
+    >>> dxf.getvalue().count('VERTEX'), dxf.getvalue().splitlines()[-1]
+    (3, 'EOF')
+    >>> [line for line in dxf.getvalue().splitlines() if line.startswith('$')]
+    ['$ACADVER', '$EXTMIN', '$EXTMAX']
+    """
+    tags = ['0', 'SECTION', '2', 'HEADER'
+            ,'9', '$ACADVER', '1', 'AC1009'
+            ,'9', '$EXTMIN', '10', '0', '20', '0'
+            ,'9', '$EXTMAX', '10', format_number(drawing.width_mm)
+            ,'20', format_number(drawing.height_mm)
+            ,'0', 'ENDSEC'
+            ,'0', 'SECTION', '2', 'TABLES'
+            ,'0', 'TABLE', '2', 'LAYER', '70', '2']
+    for layer, color in ((OUTLINE, 7), (HOLE, 1)):
+        tags += ['0', 'LAYER', '2', layer, '70', '0', '62', str(color), '6', 'CONTINUOUS']
+    tags += ['0', 'ENDTAB', '0', 'ENDSEC', '0', 'SECTION', '2', 'ENTITIES']
+    out.write('\n'.join(tags) + '\n')
+    for layer, path in drawing.paths:
+        # closed polyline, followed by its vertices
+        tags = ['0', 'POLYLINE', '8', layer, '66', '1', '70', '1'
+                ,'10', '0', '20', '0', '30', '0']
+        for x, y in path.tolist():
+            tags += ['0', 'VERTEX', '8', layer, '10', format_number(x)
+                     ,'20', format_number(y), '30', '0']
+        tags += ['0', 'SEQEND', '8', layer]
+        out.write('\n'.join(tags) + '\n')
+    out.write('0\nENDSEC\n0\nEOF\n')
+
+def write_eps(out, drawing):
+    """
+    Writes drawing to text file-like object out, as Encapsulated PostScript
+
+    Path coords are written in mm, scaled to PostScript points by the file.
+
+    >>> import io
+    >>> eps = io.StringIO()
+    >>> write_eps(eps, Drawing(10, 20, [(OUTLINE, numpy.array([[1, 2], [3.25, 2], [3, 4]]))]))
+    >>> print(eps.getvalue(), end='') # doctest: +ELLIPSIS
+    %!PS-Adobe-3.0 EPSF-3.0
+    %%BoundingBox: 0 0 29 57
+    %%HiResBoundingBox: 0 0 28.34645669291339 56.69291338582678
+    ...
+    newpath 1 2 moveto 3.25 2 lineto 3 4 lineto closepath stroke
+    grestore
+    showpage
+    %%EOF
+    """
+    width_pt = drawing.width_mm * POINTS_PER_MM
+    height_pt = drawing.height_mm * POINTS_PER_MM
+    out.write('%!PS-Adobe-3.0 EPSF-3.0\n'
+              '%%BoundingBox: 0 0 {} {}\n'
+              '%%HiResBoundingBox: 0 0 {} {}\n'
+              '%%Creator: pymoldmaker\n'
+              '%%EndComments\n'
+              'gsave\n'
+              '72 25.4 div dup scale\n' # draw in mm
+              '{} setlinewidth\n'.format(math.ceil(width_pt), math.ceil(height_pt)
+                                        ,format_number(width_pt), format_number(height_pt)
+                                        ,format_number(LINE_WIDTH_MM)))
+    for layer, path in drawing.paths:
+        points = ['{} {}'.format(format_number(x), format_number(y)) for x, y in path.tolist()]
+        out.write(' '.join(['newpath', points[0], 'moveto'
+                            ,*(point + ' lineto' for point in points[1:])
+                            ,'closepath', 'stroke']) + '\n')
+    out.write('grestore\nshowpage\n%%EOF\n')
+
+WRITERS = {'.svg': write_svg, '.dxf': write_dxf, '.eps': write_eps}
+""" drawing writers, by file extension """
+
+def format_number(value):
+    """
+    Returns shortest text representing float value exactly
+
+    >>> format_number(2.0), format_number(0.1), format_number(-0.0)
+    ('2', '0.1', '0')
+    """
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def file_name(name):
+    """
+    Returns name, with characters unsafe in file names replaced
+
+    >>> file_name('Right-i / 2')
+    'Right-i_2'
+    """
+    return re.sub(r'[^\w.-]+', '_', name).strip('_') or 'part'
@@ -19,7 +19,9 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+from . import profiling
 
+@profiling.profiled('kerf.adjustment_axis_directions')
 def adjustment_axis_directions(edge, opposite, translation_axis, part_plane, corner, adjust_in=False):
     """
     Return 3tuple of 1, 0, -1 representing axis direction to move corner
@@ -81,6 +83,7 @@ def adjustment_axis_directions(edge, opposite, translation_axis, part_plane, cor
             scale[axis] = adjustment_direction(start_edge, end_edge, axis)
     return tuple(scale)
 
+@profiling.profiled('kerf.adjustment_direction')
 def adjustment_direction(edge, opposite_edge, adjust_axis):
     """
     Return 1 or -1 for adjust_axis value opposite_edge greater/less than edge
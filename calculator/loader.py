@@ -0,0 +1,423 @@
+"""
+Module, defining a lightweight COLLADA loader which extracts only the geometry
+data pymoldmaker measures: vertex positions, units & the scene transforms
+
+The XML is parsed incrementally, so unlike pycollada no objects are built for
+materials, effects, scene nodes etc. (and a loaded model cannot be written
+back out)
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from collections import namedtuple
+from contextlib import nullcontext
+from functools import reduce
+from xml.etree.ElementTree import TreeBuilder, XMLParser
+import tempfile
+
+import numpy
+from collada.scene import (MatrixTransform, TranslateTransform, RotateTransform
+                           ,ScaleTransform, LookAtTransform)
+
+LOADER_VERSION = 5
+""" revision of the data extracted by load (for invalidating saved copies) """
+
+MeshData = namedtuple('MeshData', ['geometries', 'unitmeter', 'transform_matrix'
+                                   ,'instances', 'up_axis', 'reference_nodes'])
+MeshData.__doc__ = """
+geometry data of a COLLADA model, as returned by load
+
+geometries -- list of (geometry id, list of primitives) tuples, in document
+  order. Each primitive is a (vertex positions, vertex indices) tuple of
+  numpy arrays: (N,3) float32 positions of the primitive's VERTEX source (as
+  pycollada's Primitive.vertex, but memory-mapped, see: load) & the indices
+  of the <p> elements into them.
+unitmeter -- SI meters per COLLADA unit
+transform_matrix -- 4x4 numpy array, the first transform of the first node
+  of the scene (see: Mesh.getFirstTransformOfFirstScene)
+instances -- list of (geometry id, world matrix) tuples, one for each
+  <instance_geometry/> reached from the scene (as pycollada's
+  Scene.objects('geometry')). The world matrix is a 4x4 numpy array: the
+  product of the transforms of every enclosing node.
+up_axis -- COLLADA <up_axis/> of the model, e.g. 'Z_UP'
+reference_nodes -- list of (node id, parent matrix) tuples: nodes which
+  together hold the whole scene, for referring to from other files (see:
+  scene_reference_nodes)
+"""
+
+PRIMITIVE_TAGS = {'lines', 'linestrips', 'polygons', 'polylist', 'triangles'
+                  ,'trifans', 'tristrips'}
+""" elements in a COLLADA <mesh/>, which define a set of primitives """
+
+TRANSFORMS = {'matrix': MatrixTransform, 'translate': TranslateTransform
+              ,'rotate': RotateTransform, 'scale': ScaleTransform
+              ,'lookat': LookAtTransform}
+""" pycollada transform classes, by the COLLADA element each one loads """
+
+MAX_NODE_DEPTH = 256
+""" deepest node nesting that geometry instances are looked for in """
+
+SCENE_NODE_TAGS = {'node', 'instance_geometry', 'instance_camera'
+                   ,'instance_light', 'instance_controller', 'instance_node'
+                   ,'extra'}
+""" elements loaded as children of a scene node (by pycollada) """
+
+READ_CHUNK_BYTES = 1024**2
+""" number of bytes of a COLLADA file parsed at once """
+
+def load(file_path):
+    """
+    Returns MeshData, parsed from the COLLADA file at file_path (a path or
+    binary file-like object)
+
+    The numbers of each <float_array/> are parsed as they are read, a chunk
+    at a time, into an anonymous temporary file: the vertex positions
+    returned are memory-mapped from it, so they are never all in memory at
+    once (see: FloatArrayBuilder). Vertex indices are read into memory.
+
+    >>> from collada import Collada
+    >>> data = load('test/cube_flipped.dae')
+    >>> collada = Collada('test/cube_flipped.dae')
+    >>> [geometry_id for geometry_id, primitives in data.geometries] == [
+    ...     geometry.id for geometry in collada.geometries]
+    True
+    >>> positions, indices = data.geometries[0][1][0]
+    >>> bool((positions == collada.geometries[0].primitives[0].vertex).all())
+    True
+    >>> indices.tolist() == collada.geometries[0].primitives[0].vertex_index.ravel().tolist()
+    True
+    >>> data.unitmeter
+    0.0254
+    >>> bool((data.transform_matrix == collada.scene.nodes[0].children[0].transforms[0].matrix).all())
+    True
+    >>> load('test/cube.dae').transform_matrix.tolist() == numpy.identity(4).tolist()
+    True
+    >>> [(geometry_id, bool((matrix == bound.matrix).all())) for (geometry_id, matrix)
+    ...  , bound in zip(data.instances, collada.scene.objects('geometry'))][:2]
+    [('ID4', True), ('ID12', True)]
+    >>> len(data.instances)
+    13
+    >>> data.up_axis, [node_id for node_id, matrix in data.reference_nodes]
+    ('Z_UP', ['ID2'])
+
+    Geometries other than a <mesh/> (e.g. a <spline/>) are skipped
+
+    >>> import io
+    >>> spline = b'''<geometry id="curve"><spline><source id="s">
+    ...     <float_array>0 0 0 1 1 1</float_array></source></spline></geometry>'''
+    >>> mesh = b'''<geometry id="edge"><mesh><source id="p">
+    ...     <float_array>0 0 0 1 0 0</float_array><technique_common>
+    ...     <accessor stride="3"/></technique_common></source>
+    ...     <vertices id="v"><input semantic="POSITION" source="#p"/></vertices>
+    ...     <lines><input semantic="VERTEX" source="#v" offset="0"/><p>0 1</p></lines>
+    ...     </mesh></geometry>'''
+    >>> data = load(io.BytesIO(b'<COLLADA><library_geometries>' + spline + mesh
+    ...                        + spline + b'</library_geometries></COLLADA>'))
+    >>> [(geometry_id, len(primitives)) for geometry_id, primitives in data.geometries]
+    [('edge', 1)]
+    """
+    geometries = []
+    unitmeter = 1.0
+    up_axis = 'Y_UP' # (COLLADA default)
+    scene_transforms = {} # 4x4 matrix of each visual_scene, by id
+    scene_url = None
+    root_node = first_child = None # of the visual_scene being parsed
+    first_transform = None
+    scene_nodes = {} # root node records of each visual_scene, by id
+    library_nodes = {} # node records of <library_nodes/>, by id
+    nodes = [] # records of the nodes enclosing the current element
+    elements = [] # elements enclosing the current one
+    float_file = tempfile.TemporaryFile()
+    builder = FloatArrayBuilder(float_file)
+    for event, element in iter_events(file_path, builder):
+        tag = local_name(element)
+        if event == 'start':
+            parent = local_name(elements[-1]) if elements else None
+            elements.append(element)
+            if tag == 'geometry':
+                sources, vertices, primitives = {}, {}, []
+                has_mesh = False
+            elif tag == 'mesh':
+                has_mesh = True
+            elif tag in PRIMITIVE_TAGS and parent == 'mesh':
+                vertex_input, input_count, index_lists = None, 1, []
+            elif tag == 'visual_scene':
+                scene_id = element.get('id')
+                scene_transforms[scene_id] = numpy.identity(4)
+                scene_nodes[scene_id] = []
+                root_node = first_child = first_transform = None
+            if tag == 'node':
+                node = NodeRecord(element.get('id'), [], [])
+                if parent == 'node':
+                    nodes[-1].children.append(('node', node))
+                elif parent == 'visual_scene':
+                    scene_nodes[scene_id].append(node)
+                elif parent == 'library_nodes':
+                    library_nodes[element.get('id')] = node
+                nodes.append(node)
+            if tag == 'node' and parent == 'visual_scene' and root_node is None:
+                root_node = element
+            elif tag in SCENE_NODE_TAGS and elements[-2] is root_node:
+                if first_child is None:
+                    first_child = element
+            continue
+        elements.pop()
+        parent = local_name(elements[-1]) if elements else None
+        if tag == 'float_array' and parent == 'source':
+            float_array = builder.ranges.pop(element)
+        elif tag == 'accessor':
+            stride = int(element.get('stride', 1))
+        elif tag == 'source' and parent == 'mesh':
+            sources[element.get('id')] = float_array + (stride,) # (mapped below)
+            element.clear()
+        elif tag == 'input' and parent == 'vertices':
+            if element.get('semantic') == 'POSITION':
+                vertices[elements[-1].get('id')] = element.get('source')[1:]
+        elif tag == 'input' and parent in PRIMITIVE_TAGS:
+            offset = int(element.get('offset', 0))
+            input_count = max(input_count, offset+1)
+            if element.get('semantic') == 'VERTEX':
+                vertex_input = (element.get('source')[1:], offset)
+        elif tag == 'p' and parent in PRIMITIVE_TAGS:
+            index_lists.append(numpy.fromstring(element.text or '', dtype=numpy.int64, sep=' '))
+            element.clear()
+        elif tag in PRIMITIVE_TAGS and parent == 'mesh':
+            if vertex_input is not None:
+                vertices_id, offset = vertex_input
+                indices = numpy.concatenate(index_lists or [numpy.empty(0, numpy.int64)])
+                primitives.append((vertices_id, indices[offset::input_count]))
+        elif tag == 'geometry' and not has_mesh:
+            element.clear() # (e.g. a <spline/>: not loaded, as by pycollada)
+        elif tag == 'geometry':
+            geometry_primitives = [(sources[vertices[vertices_id]], indices)
+                                   for vertices_id, indices in primitives]
+            geometries.append((element.get('id'), geometry_primitives))
+            element.clear()
+        elif tag == 'unit' and parent == 'asset' and len(elements) == 2:
+            unitmeter = float(element.get('meter', 1.0))
+        elif tag == 'up_axis' and parent == 'asset' and len(elements) == 2:
+            up_axis = (element.text or up_axis).strip()
+        elif tag in TRANSFORMS and parent == 'node':
+            transform = TRANSFORMS[tag].load(None, element)
+            nodes[-1].transforms.append(transform.matrix)
+            if elements[-1] is first_child and first_transform is None:
+                first_transform = transform
+                scene_transforms[scene_id] = first_transform.matrix
+        elif tag == 'node':
+            nodes.pop()
+        elif tag in ('instance_geometry', 'instance_node') and parent == 'node':
+            nodes[-1].children.append((tag, element.get('url')[1:]))
+        elif tag == 'instance_visual_scene' and parent == 'scene':
+            scene_url = element.get('url')
+    builder.close()
+    values = numpy.empty(0, dtype=numpy.float32)
+    if builder.value_count: # (an empty file cannot be mapped)
+        values = numpy.memmap(float_file, dtype=numpy.float32, mode='r')
+    float_file.close() # (the mapping stays valid)
+    geometries = [(geometry_id, [(source_positions(values, *source), indices)
+                                 for source, indices in primitives])
+                  for geometry_id, primitives in geometries]
+    if scene_url and scene_url[1:] in scene_transforms:
+        scene_id = scene_url[1:]
+    else: # no <scene/>: use the first visual_scene
+        scene_id = next(iter(scene_transforms), None)
+    transform_matrix = scene_transforms.get(scene_id, numpy.identity(4))
+    instances = []
+    for node in scene_nodes.get(scene_id, []):
+        instances.extend(node_instances(node, numpy.identity(4), library_nodes))
+    reference_nodes = scene_reference_nodes(
+        [(node.id, reduce(numpy.dot, node.transforms, numpy.identity(4))
+          ,[(child.id, None, None) for kind, child in node.children if kind == 'node'])
+         for node in scene_nodes.get(scene_id, [])])
+    return MeshData(geometries, unitmeter, transform_matrix, instances, up_axis
+                    ,reference_nodes)
+
+def iter_events(file_path, builder):
+    """
+    Yields ('start' or 'end', Element) tuples, as ElementTree's iterparse,
+    for the COLLADA file at file_path (a path or binary file-like object)
+
+    builder -- FloatArrayBuilder, building the elements (the text of each
+      <float_array/> is only given to it, & not kept in the element)
+    """
+    parser = XMLParser(target=builder)
+    with open_binary(file_path) as collada_file:
+        for chunk in iter(lambda: collada_file.read(READ_CHUNK_BYTES), b''):
+            parser.feed(chunk)
+            yield from builder.events
+            builder.events.clear()
+    parser.close()
+    yield from builder.events
+    builder.events.clear()
+
+def open_binary(file_path):
+    """ returns file_path opened for binary reading (or, if it is already a
+        binary file-like object, a context manager giving it unclosed) """
+    if hasattr(file_path, 'read'):
+        return nullcontext(file_path)
+    return open(file_path, 'rb')
+
+class FloatArrayBuilder:
+    """
+    object representing an XML parser target (see: xml.etree.ElementTree.
+    XMLParser), building elements as TreeBuilder does, except the numbers in
+    each <float_array/>: these are parsed as they arrive & written to a file
+    of float32 values, instead of kept as the element's text
+
+    >>> import io
+    >>> float_file = io.BytesIO()
+    >>> builder = FloatArrayBuilder(float_file)
+    >>> parser = XMLParser(target=builder)
+    >>> for chunk in [b'<source><float_array>1 2.', b'5 na', b'n 4</float_array></source>']:
+    ...    parser.feed(chunk)
+    >>> root = parser.close()
+    >>> [(event, local_name(element)) for event, element in builder.events][:3]
+    [('start', 'source'), ('start', 'float_array'), ('end', 'float_array')]
+    >>> float_array = root[0]
+    >>> builder.ranges[float_array], float_array.text
+    ((0, 4), None)
+    >>> numpy.frombuffer(float_file.getvalue(), dtype=numpy.float32).tolist()
+    [1.0, 2.5, 0.0, 4.0]
+    """
+    def __init__(self, float_file):
+        """ float_file -- binary file-like object to write float32 values to """
+        self.float_file = float_file
+        self.tree_builder = TreeBuilder()
+        self.events = []
+        # ('start' or 'end', Element) tuples, built since last cleared
+        self.ranges = {}
+        # (first value, value count) in float_file, by <float_array/> Element
+        self.value_count = 0
+        # number of values written to float_file
+        self._array_start = None
+        # first value of the <float_array/> being parsed (or None)
+        self._partial_number = ''
+
+    def start(self, tag, attributes):
+        element = self.tree_builder.start(tag, attributes)
+        if tag.rpartition('}')[2] == 'float_array':
+            self._array_start = self.value_count
+        self.events.append(('start', element))
+        return element
+
+    def data(self, text):
+        if self._array_start is None:
+            self.tree_builder.data(text)
+            return
+        text = self._partial_number + text
+        # (a number may continue in the next text: parse up to the last space)
+        split = max(text.rfind(space) for space in ' \t\r\n') + 1
+        self._partial_number = text[split:]
+        self.write_numbers(text[:split])
+
+    def end(self, tag):
+        if self._array_start is not None:
+            self.write_numbers(self._partial_number)
+            self._partial_number = ''
+        element = self.tree_builder.end(tag)
+        if self._array_start is not None:
+            self.ranges[element] = (self._array_start, self.value_count - self._array_start)
+            self._array_start = None
+        self.events.append(('end', element))
+        return element
+
+    def write_numbers(self, text):
+        """ writes the numbers in text to float_file, as float32 values """
+        values = numpy.fromstring(text, dtype=numpy.float32, sep=' ')
+        values[numpy.isnan(values)] = 0 # (as pycollada)
+        self.float_file.write(values.tobytes())
+        self.value_count += len(values)
+
+    def close(self):
+        self.float_file.flush()
+        return self.tree_builder.close()
+
+def source_positions(values, start, count, stride):
+    """
+    Returns (N,3) numpy array of the x,y,z positions of a <source/>: count
+    of the float32 values (from start) with stride values per vertex
+
+    >>> source_positions(numpy.arange(10, dtype=numpy.float32), 1, 8, 4).tolist()
+    [[1.0, 2.0, 3.0], [5.0, 6.0, 7.0]]
+    """
+    return values[start:start+count].reshape(-1, stride)[:, :3]
+
+def scene_reference_nodes(root_nodes):
+    """
+    Returns list of (node id, parent matrix) tuples: the nodes another COLLADA
+    file can instance (by id) to show the whole scene, & the 4x4 numpy world
+    matrix each must be placed at.
+
+    root_nodes -- list of (id, matrix, children) tuples for each root node of
+      the scene: the node id (or None), its 4x4 numpy matrix & a list of the
+      same tuples for its child nodes
+
+    A root node without an id is referred to through its child nodes (as in
+    SketchUp exports), except for children which lack an id too.
+
+    >>> matrix = numpy.identity(4)
+    >>> [node_id for node_id, parent_matrix in scene_reference_nodes(
+    ...      [('a', matrix, []), (None, matrix, [('b', None, None), (None, None, None)])])]
+    ['a', 'b']
+    """
+    reference_nodes = []
+    for node_id, matrix, children in root_nodes:
+        if node_id is not None:
+            reference_nodes.append((node_id, numpy.identity(4)))
+            continue
+        for child_id, child_matrix, grandchildren in children:
+            if child_id is not None:
+                reference_nodes.append((child_id, matrix))
+    return reference_nodes
+
+NodeRecord = namedtuple('NodeRecord', ['id', 'transforms', 'children'])
+NodeRecord.__doc__ = """
+scene node, as recorded by load
+
+id -- the node's id attribute (or None)
+transforms -- list of 4x4 numpy arrays, the node's transforms in order
+children -- list of ('node', NodeRecord), ('instance_node', node id) and
+  ('instance_geometry', geometry id) tuples
+"""
+
+def node_instances(node, parent_matrix, library_nodes, depth=0):
+    """
+    Yields (geometry id, world matrix) of each geometry instanced under node
+
+    parent_matrix -- 4x4 numpy array, the world matrix of node's parent
+    library_nodes -- dict of NodeRecords, that <instance_node/> urls refer to
+
+    >>> shift = numpy.identity(4); shift[0,3] = 2
+    >>> inner = NodeRecord('n', [shift], [('instance_geometry', 'g1')])
+    >>> outer = NodeRecord(None, [shift], [('instance_node', 'n'), ('instance_geometry', 'g0')])
+    >>> [(geometry_id, float(matrix[0,3])) for geometry_id, matrix in node_instances(
+    ...      outer, numpy.identity(4), {'n': inner})]
+    [('g1', 4.0), ('g0', 2.0)]
+    """
+    matrix = reduce(numpy.dot, node.transforms, parent_matrix)
+    for kind, child in node.children:
+        if kind == 'instance_geometry':
+            yield child, matrix
+        elif depth < MAX_NODE_DEPTH: # (guard against self-instancing nodes)
+            if kind == 'instance_node':
+                child = library_nodes.get(child)
+            if child is not None:
+                yield from node_instances(child, matrix, library_nodes, depth+1)
+
+def local_name(element):
+    """ returns the tag of an XML element, without any namespace """
+    return element.tag.rpartition('}')[2]
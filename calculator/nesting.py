@@ -0,0 +1,265 @@
+"""
+Module, defining a nesting engine which packs the rectangular bounds of the
+PartSections to cut onto stock sheets of material
+
+Rectangles are placed by the skyline bottom-left heuristic: each sheet keeps
+the outline of the top edges of the rectangles already placed (its skyline),
+and each rectangle goes in the lowest (then leftmost) position on the
+skyline it fits. Rectangles are placed largest first, on the first sheet
+they fit; a new sheet is only started when no open sheet (one of the last few
+started) has room.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+import numpy
+
+from . import export
+from . import profiling
+
+TOLERANCE_MM = 1e-9
+""" slack allowed when comparing positions & sizes (for float rounding) """
+
+OPEN_SHEETS = 8
+""" default number of sheets nest keeps trying to fill (see: nest) """
+
+Placement = namedtuple('Placement', ['sheet', 'x_mm', 'y_mm', 'rotated'])
+Placement.__doc__ = """
+position of one rectangle, as placed by nest
+
+sheet -- index of the sheet (into Nesting.sheets)
+x_mm, y_mm -- position of the lower left corner of the rectangle on the sheet
+rotated -- True, if the rectangle is turned 90 degrees counter-clockwise
+"""
+
+Nesting = namedtuple('Nesting', ['sheets', 'placements'])
+Nesting.__doc__ = """
+result of nest
+
+sheets -- list of (width mm, height mm) tuples: size of each sheet used
+placements -- list of Placements, one for each rectangle nested (in order)
+"""
+
+class Skyline:
+    """
+    object representing the free space of one sheet, above a skyline
+
+    The skyline is a list of segments, from left to right: segment i starts
+    at x coord xs[i] (ending where the next one starts, or at the sheet edge)
+    and lies ys[i] above the bottom of the sheet.
+
+    >>> sheet = Skyline(10, 5)
+    >>> sheet.place(0, 0, 4, 2)
+    >>> sheet.place(4, 0, 3, 1)
+    >>> sheet.xs, sheet.ys
+    ([0, 4, 7], [2, 1, 0])
+    >>> sheet.find(5, 1) # lowest position is at x=7, but 5mm does not fit there
+    (4.0, 1.0)
+    >>> sheet.find(4, 5) is None
+    True
+    """
+
+    def __init__(self, width_mm, height_mm):
+        self.width_mm = width_mm
+        self.height_mm = height_mm
+        self.xs = [0]
+        self.ys = [0]
+
+    def find(self, width_mm, height_mm):
+        """
+        Returns (x, y) mm of the lowest, then leftmost position on the
+        skyline a rectangle of width_mm x height_mm fits at (or None)
+        """
+        if min(self.ys) + height_mm > self.height_mm + TOLERANCE_MM:
+            return None # (no room above even the lowest segment)
+        xs = numpy.array(self.xs, dtype=numpy.float64)
+        ys = numpy.array(self.ys + [0], dtype=numpy.float64)
+        # rectangle starting at segment i spans segments i up to ends[i]
+        ends = numpy.searchsorted(xs, xs + width_mm - TOLERANCE_MM)
+        spans = numpy.empty(2*len(xs), dtype=numpy.intp)
+        spans[0::2] = numpy.arange(len(xs))
+        spans[1::2] = ends
+        tops = numpy.maximum.reduceat(ys, spans)[0::2] # skyline height, under each
+        fits = ((xs + width_mm <= self.width_mm + TOLERANCE_MM)
+                & (tops + height_mm <= self.height_mm + TOLERANCE_MM))
+        if not fits.any():
+            return None
+        candidates = numpy.flatnonzero(fits)
+        best = candidates[numpy.lexsort((xs[candidates], tops[candidates]))[0]]
+        return float(xs[best]), float(tops[best])
+
+    def place(self, x_mm, y_mm, width_mm, height_mm):
+        """ raises the skyline, over a rectangle placed at x_mm, y_mm """
+        end_mm = x_mm + width_mm
+        start = bisect_left(self.xs, x_mm)
+        stop = bisect_right(self.xs, end_mm)
+        xs, ys = [x_mm], [y_mm + height_mm]
+        if self.xs[stop-1] != end_mm and end_mm < self.width_mm:
+            # keep what remains of the segment, that the rectangle ends over
+            xs.append(end_mm)
+            ys.append(self.ys[stop-1])
+        self.xs[start:stop] = xs
+        self.ys[start:stop] = ys
+        # merge neighbouring segments, of equal height
+        for index in range(min(start+len(xs), len(self.xs)-1), max(start, 1)-1, -1):
+            if self.ys[index] == self.ys[index-1]:
+                del self.xs[index], self.ys[index]
+
+@profiling.profiled('nesting.nest')
+def nest(sizes, sheet_sizes, spacing_mm=0.0, margin_mm=0.0, allow_rotation=True
+         ,open_sheets=None):
+    """
+    Returns Nesting: sheets & positions for packing rectangles onto them
+
+    Keyword arguments:
+    sizes -- list of (width mm, height mm) of each rectangle to place
+    sheet_sizes -- list of (width mm, height mm) stock sheet sizes. A new
+      sheet is the first of these the next rectangle fits on.
+    spacing_mm -- gap to leave between rectangles (e.g. the cutting kerf)
+    margin_mm -- gap to leave along the sheet edges
+    allow_rotation -- if True, rectangles may be turned 90 degrees
+    open_sheets -- (optional) number of most recently started sheets to try
+      placing each rectangle on (default: OPEN_SHEETS). Earlier sheets are
+      considered full.
+
+    >>> nesting = nest([(6, 2), (4, 4), (3, 2), (8, 3)], [(10, 5)])
+    >>> nesting.sheets
+    [(10, 5), (10, 5)]
+    >>> [tuple(placement) for placement in nesting.placements]
+    [(0, 0.0, 3.0, False), (1, 0.0, 0.0, False), (0, 8.0, 0.0, True), (0, 0.0, 0.0, False)]
+    >>> len(nest([(6, 2), (4, 4), (3, 2), (8, 3)], [(10, 5)], spacing_mm=1).sheets)
+    3
+    >>> nest([(11, 1)], [(10, 5)])
+    Traceback (most recent call last):
+       ...
+    ValueError: 11 x 1 mm does not fit on any stock sheet
+    """
+    if open_sheets is None:
+        open_sheets = OPEN_SHEETS
+    skylines = []
+    sheets = []
+    placements = [None] * len(sizes)
+    # place largest rectangles first: they are the hardest to fit
+    order = sorted(range(len(sizes)), key=lambda index: (-max(sizes[index]), -min(sizes[index])))
+    for index in order:
+        width_mm, height_mm = sizes[index]
+        # (each rectangle is padded by spacing on its top & right sides)
+        orientations = [(width_mm + spacing_mm, height_mm + spacing_mm, False)]
+        if allow_rotation and width_mm != height_mm:
+            orientations.append((height_mm + spacing_mm, width_mm + spacing_mm, True))
+        for sheet_index in range(max(0, len(skylines)-open_sheets), len(skylines)):
+            skyline = skylines[sheet_index]
+            position = find_position(skyline, orientations)
+            if position is not None:
+                break
+        else: # start a new sheet
+            for sheet_size in sheet_sizes:
+                skyline = Skyline(sheet_size[0] - 2*margin_mm + spacing_mm
+                                  ,sheet_size[1] - 2*margin_mm + spacing_mm)
+                position = find_position(skyline, orientations)
+                if position is not None:
+                    break
+            else:
+                raise ValueError('{:g} x {:g} mm does not fit on any stock sheet'.format(
+                    width_mm, height_mm))
+            sheet_index = len(skylines)
+            skylines.append(skyline)
+            sheets.append(tuple(sheet_size))
+        x_mm, y_mm, (padded_width, padded_height, rotated) = position
+        skyline.place(x_mm, y_mm, padded_width, padded_height)
+        placements[index] = Placement(sheet_index, x_mm + margin_mm, y_mm + margin_mm, rotated)
+    return Nesting(sheets, placements)
+
+def find_position(skyline, orientations):
+    """
+    Returns (x mm, y mm, orientation) of the best position on skyline, for
+    any of the (width mm, height mm, rotated) orientations (or None)
+    """
+    best = None
+    for orientation in orientations:
+        position = skyline.find(orientation[0], orientation[1])
+        if position is None:
+            continue
+        x_mm, y_mm = position
+        top = y_mm + orientation[1]
+        if best is None or (top, x_mm) < best[0]:
+            best = ((top, x_mm), (x_mm, y_mm, orientation))
+    return best[1] if best else None
+
+def piece_size(piece):
+    """
+    Returns (width mm, height mm) of the bounds of a piece's paths
+
+    (piece -- list of (layer, (N,2) numpy array) paths, see: export.Drawing)
+
+    >>> piece_size([(export.OUTLINE, numpy.array([[1., 1], [4, 3]]))])
+    (3.0, 2.0)
+    """
+    coords = numpy.concatenate([path for layer, path in piece])
+    width_mm, height_mm = numpy.ptp(coords, axis=0).tolist()
+    return width_mm, height_mm
+
+def sheet_drawings(pieces, nesting):
+    """
+    Returns list of export.Drawings: one for each sheet of nesting, with each
+    of pieces drawn where its rectangle was placed (see: nest)
+
+    >>> square = numpy.array([[1., 1], [4, 1], [4, 3], [1, 3]])
+    >>> drawings = sheet_drawings([[(export.OUTLINE, square)]]
+    ...                           ,Nesting([(10, 5)], [Placement(0, 5, 0, True)]))
+    >>> drawings[0].width_mm, drawings[0].paths[0][1].tolist()
+    (10, [[7.0, 0.0], [7.0, 3.0], [5.0, 3.0], [5.0, 0.0]])
+    """
+    drawings = [export.Drawing(width_mm, height_mm, [])
+                for width_mm, height_mm in nesting.sheets]
+    for piece, placement in zip(pieces, nesting.placements):
+        coords = numpy.concatenate([path for layer, path in piece])
+        minimum = coords.min(axis=0)
+        height_mm = float(numpy.ptp(coords[:, 1]))
+        for layer, path in piece:
+            path = path - minimum
+            if placement.rotated: # 90 degrees counter-clockwise
+                path = numpy.column_stack((height_mm - path[:, 1], path[:, 0]))
+            path = path + (placement.x_mm, placement.y_mm)
+            drawings[placement.sheet].paths.append((layer, path))
+    return drawings
+
+def nesting_lines(labels, sizes, nesting):
+    """
+    Yields lines of a human-readable summary of nesting, listing each sheet
+    & the labels of the rectangles (of sizes) placed on it
+
+    >>> nesting = nest([(6, 2), (4, 4)], [(10, 5)])
+    >>> print('\\n'.join(nesting_lines(['a', 'b'], [(6, 2), (4, 4)], nesting)))
+    ## Sheet 1 (10 x 5 mm, 56% used)
+     * a at (0.0 mm, 0.0 mm)
+     * b at (6.0 mm, 0.0 mm)
+    """
+    for sheet_index, (width_mm, height_mm) in enumerate(nesting.sheets):
+        placed = [(placement, label, size) for placement, label, size
+                  in zip(nesting.placements, labels, sizes)
+                  if placement.sheet == sheet_index]
+        area_used = sum(w*h for placement, label, (w, h) in placed)
+        yield '## Sheet {} ({:g} x {:g} mm, {:.0f}% used)'.format(
+            sheet_index+1, width_mm, height_mm, 100*area_used/(width_mm*height_mm))
+        for placement, label, size in sorted(placed, key=lambda p: (p[0].y_mm, p[0].x_mm)):
+            yield ' * {} at ({:.1f} mm, {:.1f} mm){}'.format(
+                label, placement.x_mm, placement.y_mm
+                ,', rotated' if placement.rotated else '')
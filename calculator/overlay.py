@@ -0,0 +1,167 @@
+"""
+Module, defining a writer for small standalone COLLADA files holding only
+generated line segments (e.g. outlines of the parts to cut), to overlay on a
+model without re-saving the whole model.
+
+The file is written incrementally, straight from the array of line segment
+endpoints, so writing time & size depend only on the number of segments. The
+original model can be shown with the lines, by an external reference to it.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from datetime import datetime, timezone
+from xml.sax.saxutils import quoteattr
+
+import numpy
+
+from . import profiling
+from .vertexstore import iter_chunks
+
+CHUNK_ROWS = 64 * 1024
+""" number of line segment endpoints formatted at once """
+
+HEADER = '''<?xml version="1.0" encoding="utf-8"?>
+<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">
+  <asset>
+    <contributor><authoring_tool>pymoldmaker</authoring_tool></contributor>
+    <created>{created}</created>
+    <modified>{created}</modified>
+    <unit meter="{unitmeter!r}" name="unit"/>
+    <up_axis>{up_axis}</up_axis>
+  </asset>
+  <library_geometries>
+    <geometry id="geometry0" name="line">
+      <mesh>
+        <source id="lines-array">
+          <float_array id="lines-array-array" count="{float_count}">'''
+
+SOURCE_END = '''</float_array>
+          <technique_common>
+            <accessor source="#lines-array-array" count="{vertex_count}" stride="3">
+              <param name="X" type="float"/>
+              <param name="Y" type="float"/>
+              <param name="Z" type="float"/>
+            </accessor>
+          </technique_common>
+        </source>
+        <vertices id="lines-vertices">
+          <input semantic="POSITION" source="#lines-array"/>
+        </vertices>
+        <lines count="{line_count}">
+          <input offset="0" semantic="VERTEX" source="#lines-vertices"/>
+          <p>'''
+
+LINES_END = '''</p>
+        </lines>
+      </mesh>
+    </geometry>
+  </library_geometries>
+  <library_visual_scenes>
+    <visual_scene id="scene0">
+      <node id="node0" name="node0">
+        <matrix>{matrix}</matrix>
+        <instance_geometry url="#geometry0"/>
+      </node>
+'''
+
+REFERENCE_NODE = '''      <node id="reference{index}" name="reference">
+        <matrix>{matrix}</matrix>
+        <instance_node url={url}/>
+      </node>
+'''
+
+FOOTER = '''    </visual_scene>
+  </library_visual_scenes>
+  <scene>
+    <instance_visual_scene url="#scene0"/>
+  </scene>
+</COLLADA>
+'''
+
+def write_overlay(file_path, line_segment_endpoints, unitmeter=1.0, up_axis='Z_UP'
+                  ,matrix=None, reference_url=None, reference_nodes=()):
+    """
+    Saves a COLLADA file with one <lines/> set, & nothing else of a model
+
+    Keyword arguments:
+    line_segment_endpoints -- (M,3) array-like of line segment endpoint coords
+    unitmeter, up_axis -- units & up axis of the coordinates (the model's)
+    matrix -- (optional) 4x4 numpy array, to place the lines at in the scene
+      (e.g. the model's first scene transform, see: Mesh.transform_matrix)
+    reference_url -- (optional) URL of the model, relative to file_path: if
+      given, the model's reference_nodes are instanced from it too (see:
+      calculator.loader.MeshData)
+    reference_nodes -- list of (node id, 4x4 numpy matrix) tuples
+
+    >>> from tempfile import TemporaryDirectory
+    >>> from collada import Collada
+    >>> from calculator import loader
+    >>> segments = [[0,0,0], [1,0,0], [1,0,0], [1,2.5,0]]
+    >>> with TemporaryDirectory() as directory:
+    ...    path = directory + '/lines.dae'
+    ...    write_overlay(path, segments, 0.0254, matrix=numpy.diag([1,-1,-1,1]))
+    ...    lines = Collada(path)
+    ...    write_overlay(path, segments, reference_url='model.dae'
+    ...                  ,reference_nodes=[('ID2', numpy.identity(4))])
+    ...    data = loader.load(path)
+    >>> lines.assetInfo.unitmeter, lines.assetInfo.upaxis
+    (0.0254, 'Z_UP')
+    >>> bound_lines = list(lines.scene.objects('geometry'))[0].primitives()
+    >>> next(bound_lines).vertex.tolist()
+    [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, 0.0, 0.0], [1.0, -2.5, 0.0]]
+    >>> positions, indices = data.geometries[0][1][0]
+    >>> indices.tolist()
+    [0, 1, 2, 3]
+    """
+    endpoints = numpy.reshape(numpy.asarray(line_segment_endpoints, dtype=numpy.float64), (-1, 3))
+    if matrix is None:
+        matrix = numpy.identity(4)
+    created = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+    with profiling.span('overlay.write'), open(file_path, 'w', encoding='utf-8') as out:
+        out.write(HEADER.format(created=created, unitmeter=float(unitmeter)
+                                ,up_axis=up_axis, float_count=endpoints.size))
+        separator = ''
+        for chunk in iter_chunks(endpoints, CHUNK_ROWS):
+            out.write(separator + ' '.join(map(repr, chunk.ravel().tolist())))
+            separator = ' '
+        out.write(SOURCE_END.format(vertex_count=len(endpoints)
+                                    ,line_count=len(endpoints)//2))
+        for start in range(0, len(endpoints), CHUNK_ROWS):
+            stop = min(start+CHUNK_ROWS, len(endpoints))
+            out.write((' ' if start else '') + ' '.join(map(str, range(start, stop))))
+        out.write(LINES_END.format(matrix=format_matrix(matrix)))
+        if reference_url is not None:
+            for index, (node_id, node_matrix) in enumerate(reference_nodes):
+                out.write(REFERENCE_NODE.format(
+                    index=index, matrix=format_matrix(node_matrix)
+                    ,url=quoteattr('{}#{}'.format(reference_url, node_id))))
+        out.write(FOOTER)
+        profiling.count('bytes_written', out.tell())
+
+def format_matrix(matrix):
+    """
+    Returns text of a COLLADA <matrix/>: 16 values of 4x4 matrix in row order
+
+    (values are written at the precision of the matrix's numpy data type)
+
+    >>> format_matrix(numpy.identity(4))[:16]
+    '1.0 0.0 0.0 0.0 '
+    >>> format_matrix(numpy.full((4,4), 0.1, dtype=numpy.float32))[:8]
+    '0.1 0.1 '
+    """
+    return ' '.join(str(value) for value in numpy.ravel(matrix))
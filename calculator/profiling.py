@@ -0,0 +1,197 @@
+"""
+Module, defining an instrumentation layer: timing spans around the stages
+of a run (parsing, corner lookups, making parts, writing files) & counters
+of the work done in them, exported as JSON
+
+Profiling is off by default & then costs nothing: span & count are no-ops
+(call them as profiling.span & profiling.count: enable rebinds them),
+& functions decorated with profiled are left unwrapped (enable swaps timing
+wrappers in, on their module or class; disable swaps the originals back).
+Only this process is profiled, not worker processes (see: merge).
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import json
+import sys
+import time
+
+enabled = False
+""" True, while spans & counters are being recorded """
+
+spans = {}
+# [call count, total seconds] of each span, by name
+counters = {}
+# total of each counter, by name
+profiled_functions = []
+# (span name, function) of each function decorated with profiled
+
+NULL_SPAN = nullcontext()
+""" span returned while profiling is off """
+
+def _null_span(name):
+    return NULL_SPAN
+
+def _null_count(name, amount=1):
+    pass
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = spans.setdefault(name, [0, 0.0])
+        record[0] += 1
+        record[1] += time.perf_counter() - start
+
+def _count(name, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+span = _null_span
+""" span(name): returns a context manager, timing the code it encloses as a
+call of the span name (while profiling is on) """
+
+count = _null_count
+""" count(name, amount=1): adds amount to the counter name (while profiling
+is on) """
+
+def profiled(name):
+    """
+    Returns decorator, making each call of a function a call of span name
+    while profiling is on
+
+    The function is only wrapped while profiling is on, by replacing it on
+    the module (or class) it is defined in: so only calls looking it up
+    there (e.g. module.function(), self.method()) are timed.
+
+    >>> @profiled('example.double')
+    ... def double(value):
+    ...    return 2*value
+    >>> sys.modules[__name__].double = double
+    >>> enable()
+    >>> double(2), sys.modules[__name__].double(3)
+    (4, 6)
+    >>> report()['spans']['example.double']['calls']
+    1
+    >>> disable(); reset(); del sys.modules[__name__].double
+    >>> profiled_functions.pop() == ('example.double', double)
+    True
+    """
+    def decorator(function):
+        profiled_functions.append((name, function))
+        return function
+    return decorator
+
+def _function_owner(function):
+    """ returns (object, attribute name) function is found at, or None """
+    owner = sys.modules.get(function.__module__)
+    *path, attribute = function.__qualname__.split('.')
+    for part in path:
+        owner = getattr(owner, part, None)
+    if owner is None or '<locals>' in path:
+        return None
+    return owner, attribute
+
+def _timed(name, function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with _span(name):
+            return function(*args, **kwargs)
+    wrapper.__wrapped_for_profiling__ = function
+    return wrapper
+
+def enable():
+    """
+    Starts recording spans & counters (until disable)
+
+    >>> from calculator import profiling
+    >>> enable()
+    >>> with profiling.span('example'):
+    ...    profiling.count('things', 3)
+    >>> report() # doctest: +ELLIPSIS
+    {'spans': {'example': {'calls': 1, 'total_s': ...}}, 'counters': {'things': 3}}
+    >>> disable(); reset()
+    >>> with profiling.span('example'):
+    ...    profiling.count('things', 3)
+    >>> report()
+    {'spans': {}, 'counters': {}}
+    """
+    global enabled, span, count
+    if enabled:
+        return
+    enabled = True
+    span, count = _span, _count
+    for name, function in profiled_functions:
+        location = _function_owner(function)
+        if location is not None and getattr(*location, None) is function:
+            setattr(*location, _timed(name, function))
+
+def disable():
+    """ stops recording spans & counters, keeping those recorded so far """
+    global enabled, span, count
+    if not enabled:
+        return
+    enabled = False
+    span, count = _null_span, _null_count
+    for name, function in profiled_functions:
+        location = _function_owner(function)
+        if location is None:
+            continue
+        current = getattr(*location, None)
+        if getattr(current, '__wrapped_for_profiling__', None) is function:
+            setattr(*location, function)
+
+def reset():
+    """ discards all spans & counters recorded so far """
+    spans.clear()
+    counters.clear()
+
+def report():
+    """
+    Returns dict of the spans ({name: {calls, total_s}}) & counters
+    ({name: total}) recorded so far, ready to be saved as JSON
+    """
+    return {'spans': {name: {'calls': calls, 'total_s': seconds}
+                      for name, (calls, seconds) in sorted(spans.items())}
+            ,'counters': dict(sorted(counters.items()))}
+
+def merge(other_report):
+    """
+    Adds the spans & counters of other_report (e.g. a worker process's) to
+    those recorded so far
+
+    >>> merge({'spans': {'a': {'calls': 2, 'total_s': 1.5}}, 'counters': {'b': 4}})
+    >>> merge({'spans': {'a': {'calls': 1, 'total_s': 0.5}}, 'counters': {'b': 1}})
+    >>> report()
+    {'spans': {'a': {'calls': 3, 'total_s': 2.0}}, 'counters': {'b': 5}}
+    >>> reset()
+    """
+    for name, span_report in other_report['spans'].items():
+        record = spans.setdefault(name, [0, 0.0])
+        record[0] += span_report['calls']
+        record[1] += span_report['total_s']
+    for name, total in other_report['counters'].items():
+        counters[name] = counters.get(name, 0) + total
+
+def write_json(file_path):
+    """ saves report() to file_path, as JSON """
+    with open(file_path, 'w') as out:
+        json.dump(report(), out, indent=2)
+        out.write('\n')
@@ -0,0 +1,430 @@
+"""
+Module, defining a long-running cutlist service: a daemon that keeps the
+most recently used models loaded, & runs jobs sent to it as JSON over a
+local (Unix) socket
+
+Each line a client sends is one job, a JSON object:
+  mesh -- file path to the COLLADA model (relative paths are relative to
+    the daemon's working directory)
+  id -- (optional) any JSON value, echoed in each of the job's events
+    (default: the job's number, on its connection)
+  out -- (optional) file path to save the model with part outlines to
+  directions -- (optional) list of [name, make_part arguments] parts
+    (default: read from the .py file next to the model, on every job)
+  material -- (optional) dict of material values to change, e.g.
+    {"thickness_mm": 3} (see: Calculator.material)
+  overlay, reference -- (optional) save only the outlines, referring to the
+    model (see: Calculator.save)
+  drawings_dir, drawing_formats -- (optional) directory to save each Part's
+    vector drawing to, & list of formats (see: Calculator.save_drawings)
+  workers -- (optional) number of worker processes to make Parts with
+    (started by a fork server, not forked from the daemon's threads)
+
+The daemon streams back JSON lines of events, as the job runs: "started"
+(with "warm": true if the model was already loaded), one "cutlist" per
+line of the cutlist, one "output" per saved file, then "done" (with
+"seconds") or "error" (with "message"). Jobs run concurrently in a thread
+pool, so one job never waits for another, except for a job on the same
+model, which waits its turn for the loaded model.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from . import profiling
+from .calculator import Calculator
+from .directions import compile_directions
+
+DEFAULT_CAPACITY = 4
+""" default number of models kept loaded """
+
+DEFAULT_THREADS = 4
+""" default number of jobs run at once """
+
+LINE_LIMIT_BYTES = 16 * 1024**2
+""" maximum length of one job (line) a client sends """
+
+WORKER_START_METHOD = 'forkserver'
+""" multiprocessing start method of a job's worker processes (forking the
+multi-threaded daemon itself could copy locks other threads hold) """
+
+def default_socket_path():
+    """ returns the per-user path the daemon listens on, by default """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir())
+    return os.path.join(runtime_dir, 'pymoldmaker.sock')
+
+def file_stamp(file_path):
+    """ returns (modification time ns, size) of file_path, which change
+        whenever the file is saved again """
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+class WarmModel:
+    """
+    object representing a loaded model, kept for the next job on it
+    """
+    def __init__(self):
+        self.calculator = None
+        self.stamp = None
+        # file_stamp of the model file, when calculator was loaded
+        self.lock = threading.Lock()
+        # held by the job using calculator
+
+class CalculatorPool:
+    """
+    object representing the recently used models, kept loaded in a
+    least-recently-used list of up to capacity models
+
+    >>> pool = CalculatorPool(capacity=1)
+    >>> with pool.use('test/cube_flipped.dae') as (calculator, warm):
+    ...    warm
+    False
+    >>> with pool.use('test/cube_flipped.dae') as (same_calculator, warm):
+    ...    warm, same_calculator is calculator
+    (True, True)
+    >>> with pool.use('test/cube.dae', writable=False) as (other, warm):
+    ...    warm, len(pool)
+    (False, 1)
+    >>> with pool.use('test/cube_flipped.dae') as (reloaded, warm):
+    ...    warm, reloaded is calculator
+    (False, False)
+    >>> with pool.use('missing.dae') as (missing, warm): # doctest: +ELLIPSIS
+    ...    pass
+    Traceback (most recent call last):
+       ...
+    FileNotFoundError: [Errno 2] No such file or directory: ...
+    >>> with pool.use('test/cube_flipped.dae') as (same_calculator, warm):
+    ...    warm, same_calculator is reloaded
+    (True, True)
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY, cache=None):
+        """
+        cache -- (optional) calculator.cache.MeshCache, to load read-only
+          models & compiled directions from
+        """
+        self.capacity = capacity
+        self.cache = cache
+        self._models = OrderedDict()
+        # WarmModels by (absolute model path, writable), least recent first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._models)
+
+    def _checkout(self, key):
+        """ returns WarmModel for key, now the most recently used """
+        with self._lock:
+            model = self._models.pop(key, None) or WarmModel()
+            self._models[key] = model
+            while len(self._models) > self.capacity:
+                # (a job still using an evicted model keeps it until done)
+                self._models.popitem(last=False)
+            return model
+
+    def _discard(self, key, model):
+        """ removes WarmModel model, if it is still kept for key """
+        with self._lock:
+            if self._models.get(key) is model:
+                del self._models[key]
+
+    @contextmanager
+    def use(self, mesh_path, writable=True):
+        """
+        Returns context manager, giving a (Calculator, warm) tuple for the
+        model at mesh_path while no other job uses it
+
+        The Calculator is loaded again if the model file changed since it
+        was last loaded; warm is True if it did not need to be.
+        """
+        mesh_path = os.path.abspath(mesh_path)
+        file_stamp(mesh_path) # (a missing model raises before evicting a loaded one)
+        key = (mesh_path, writable)
+        model = self._checkout(key)
+        with model.lock:
+            try:
+                stamp = file_stamp(mesh_path)
+                warm = model.calculator is not None and model.stamp == stamp
+                if not warm:
+                    model.calculator = Calculator(mesh_path, writable, self.cache)
+                    model.stamp = stamp
+            except Exception:
+                self._discard(key, model) # (e.g. the model file is invalid)
+                raise
+            yield model.calculator, warm
+
+class LineStream:
+    """
+    object representing a text file-like object, calling a function with
+    each line written to it
+
+    >>> lines = []
+    >>> stream = LineStream(lines.append)
+    >>> stream.write('# Cutlist\\n## Left'); stream.write(' Part\\n')
+    >>> lines
+    ['# Cutlist', '## Left Part']
+    """
+    def __init__(self, function):
+        self.function = function
+        self._partial_line = ''
+
+    def write(self, text):
+        *lines, self._partial_line = (self._partial_line + text).split('\n')
+        for line in lines:
+            self.function(line)
+
+    def flush(self):
+        pass
+
+TUPLE_ARGUMENTS = ('start_edge', 'end_edge', 'part_plane')
+""" make_part arguments that a directions file gives as tuples """
+
+def job_directions(directions):
+    """
+    Returns directions, from a job's JSON list of [name, arguments] parts
+
+    (JSON has no tuples: the TUPLE_ARGUMENTS are made tuples again, as in a
+    directions file)
+
+    >>> job_directions([["Left", {"start_edge": [[-1,1,1],[-1,1,-1]]
+    ...                          ,"part_plane": [0,2], "shrink_edges": ["bottom"]}]])
+    [('Left', {'start_edge': ([-1, 1, 1], [-1, 1, -1]), 'part_plane': (0, 2), 'shrink_edges': ['bottom']})]
+    """
+    def make_part_arguments(arguments):
+        arguments = dict(arguments)
+        for key in TUPLE_ARGUMENTS:
+            if key in arguments:
+                arguments[key] = tuple(arguments[key])
+        if 'subtract_parts' in arguments:
+            arguments['subtract_parts'] = [make_part_arguments(part)
+                                           for part in arguments['subtract_parts']]
+        return arguments
+    return [(name, make_part_arguments(arguments)) for name, arguments in directions]
+
+def run_job(pool, job, emit):
+    """
+    Runs one job (a dict, see: module docstring) with a model from
+    CalculatorPool pool, calling emit with each of its event dicts
+
+    >>> events = []
+    >>> run_job(CalculatorPool(), {'id': 1, 'mesh': 'test/cube_flipped.dae'
+    ...                            ,'material': {'thickness_mm': 3}}, events.append)
+    >>> [event['event'] for event in events][:3], events[-1]['event']
+    (['started', 'cutlist', 'cutlist'], 'done')
+    >>> events[2]['line']
+    '## Bottom Part'
+    >>> events = []
+    >>> run_job(CalculatorPool(), {'id': 2, 'mesh': 'missing.dae'}, events.append)
+    >>> [event['event'] for event in events], events[0]['message'].split(':')[0]
+    (['error'], 'FileNotFoundError')
+    """
+    def send(event, **values):
+        emit(dict(id=job.get('id'), event=event, **values))
+    start = time.perf_counter()
+    try:
+        with profiling.span('service.job'):
+            overlay = bool(job.get('overlay'))
+            with pool.use(job['mesh'], writable=not overlay) as (calculator, warm):
+                send('started', warm=warm)
+                run_calculator_job(calculator, job, send)
+    except Exception as e:
+        send('error', message='{}: {}'.format(type(e).__name__, e))
+        return
+    send('done', seconds=time.perf_counter() - start)
+
+def run_calculator_job(calculator, job, send):
+    """ runs job with the loaded Calculator calculator (see: run_job) """
+    unknown_keys = set(job.get('material', {})) - set(Calculator.material)
+    if unknown_keys:
+        raise ValueError('Unsupported material values: {}'.format(sorted(unknown_keys)))
+    calculator.material = dict(Calculator.material, **job.get('material', {}))
+    calculator.workers = job.get('workers', 1)
+    calculator.worker_context = multiprocessing.get_context(WORKER_START_METHOD)
+    if 'directions' in job:
+        calculator.directions = compile_directions(job_directions(job['directions']))
+    else:
+        calculator.reload_directions()
+    cutlist = LineStream(lambda line: send('cutlist', line=line))
+    out_file = job.get('out')
+    if out_file:
+        reference_url = None
+        if job.get('overlay') and job.get('reference'):
+            out_directory = os.path.dirname(os.path.abspath(out_file))
+            reference_url = os.path.relpath(os.path.abspath(job['mesh']), out_directory)
+        # (outlines are removed again once saved, for the next job's)
+        calculator.save(out_file, job.get('overlay', False), reference_url
+                        ,keep_lines=False, stream=cutlist)
+        send('output', path=out_file)
+    else:
+        calculator.write_cutlist(cutlist)
+    if job.get('drawings_dir'):
+        extensions = ['.' + name for name in job.get('drawing_formats', ['svg'])]
+        for path in calculator.save_drawings(job['drawings_dir'], extensions):
+            send('output', path=path)
+
+class CutlistService:
+    """
+    object representing the daemon: a CalculatorPool, & the threads jobs
+    are run in
+
+    >>> from tempfile import TemporaryDirectory
+    >>> async def two_jobs(socket_path):
+    ...    service = CutlistService()
+    ...    server = await service.start(socket_path)
+    ...    reader, writer = await asyncio.open_unix_connection(socket_path)
+    ...    events = []
+    ...    for thickness_mm in (6, 3):
+    ...        writer.write(json.dumps({'mesh': 'test/cube_flipped.dae'
+    ...            ,'material': {'thickness_mm': thickness_mm}}).encode() + b'\\n')
+    ...        await writer.drain()
+    ...        event = None
+    ...        while event is None or event['event'] != 'done':
+    ...            event = json.loads(await reader.readline())
+    ...            events.append(event)
+    ...    writer.write_eof()
+    ...    await reader.read() # (until the daemon closes the connection)
+    ...    writer.close()
+    ...    server.close()
+    ...    service.close()
+    ...    return events
+    >>> with TemporaryDirectory() as directory:
+    ...    events = asyncio.run(two_jobs(directory + '/service.sock'))
+    >>> [(event['id'], event['warm']) for event in events if event['event'] == 'started']
+    [(1, False), (2, True)]
+    >>> [event['line'] for event in events if event.get('line', '').startswith('## Left')]
+    ['## Left Part', '## Left Part']
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY, threads=DEFAULT_THREADS, cache=None
+                 ,line_limit_bytes=LINE_LIMIT_BYTES):
+        """ (capacity, cache: see CalculatorPool)
+
+        line_limit_bytes -- maximum length of one job (line) a client sends:
+          a longer one is answered with an "error" event, & ends reading
+          from that client (its jobs already started still run)
+
+        >>> from tempfile import TemporaryDirectory
+        >>> async def long_job(socket_path):
+        ...    service = CutlistService(line_limit_bytes=200)
+        ...    server = await service.start(socket_path)
+        ...    reader, writer = await asyncio.open_unix_connection(socket_path)
+        ...    writer.write(b'{"mesh": "test/cube_flipped.dae"}\\n' + b' ' * 400 + b'\\n')
+        ...    writer.write_eof()
+        ...    events = [json.loads(line) async for line in reader]
+        ...    writer.close()
+        ...    server.close()
+        ...    service.close()
+        ...    return events
+        >>> with TemporaryDirectory() as directory:
+        ...    events = asyncio.run(long_job(directory + '/service.sock'))
+        >>> sorted((event['id'], event['event']) for event in events
+        ...        if event['event'] in ('done', 'error'))
+        [(1, 'done'), (2, 'error')]
+        """
+        self.pool = CalculatorPool(capacity, cache)
+        self.executor = ThreadPoolExecutor(threads)
+        self.line_limit_bytes = line_limit_bytes
+
+    def close(self):
+        """ waits for running jobs, then stops the job threads """
+        self.executor.shutdown()
+
+    async def start(self, socket_path):
+        """ returns asyncio Server, accepting jobs on socket_path """
+        return await asyncio.start_unix_server(self.handle_connection, socket_path
+                                               ,limit=self.line_limit_bytes)
+
+    async def serve_forever(self, socket_path):
+        """ accepts jobs on socket_path, until cancelled """
+        server = await self.start(socket_path)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    async def run(self, job, emit):
+        """ runs job in a job thread, calling emit with each event dict """
+        loop = asyncio.get_running_loop()
+        def emit_threadsafe(event):
+            loop.call_soon_threadsafe(emit, event)
+        await loop.run_in_executor(self.executor, run_job, self.pool, job, emit_threadsafe)
+
+    async def handle_connection(self, reader, writer):
+        """ runs each job read from a client, streaming back their events
+            (interleaved, as jobs run at once) """
+        events = asyncio.Queue()
+        sender = asyncio.create_task(send_events(events, writer))
+        jobs = []
+        job_numbers = itertools.count(1)
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                number = next(job_numbers)
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict) or 'mesh' not in job:
+                        raise ValueError('a job is a JSON object, with a "mesh" path')
+                except ValueError as e:
+                    events.put_nowait({'id': number, 'event': 'error'
+                                       ,'message': '{}: {}'.format(type(e).__name__, e)})
+                    continue
+                job.setdefault('id', number)
+                jobs.append(asyncio.create_task(self.run(job, events.put_nowait)))
+        except ValueError: # (a line over the limit: the rest can't be split into lines)
+            events.put_nowait({'id': next(job_numbers), 'event': 'error'
+                               ,'message': 'ValueError: a job is longer than {} bytes'.format(
+                                   self.line_limit_bytes)})
+        finally:
+            await asyncio.gather(*jobs)
+            events.put_nowait(None)
+            await sender
+            writer.close()
+
+async def send_events(events, writer):
+    """ writes each event dict from asyncio Queue events as a JSON line,
+        until it yields None """
+    while True:
+        event = await events.get()
+        if event is None:
+            return
+        writer.write(json.dumps(event).encode('utf-8') + b'\n')
+        await writer.drain()
+
+def submit(socket_path, jobs):
+    """
+    Sends jobs (a list of job dicts) to the daemon at socket_path, & yields
+    their event dicts as they arrive, until all jobs are done
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(b''.join(json.dumps(job).encode('utf-8') + b'\n' for job in jobs))
+        connection.shutdown(socket.SHUT_WR)
+        with connection.makefile('rb') as lines:
+            for line in lines:
+                yield json.loads(line)
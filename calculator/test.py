@@ -5,10 +5,20 @@ import doctest
 
 from . import (
      Mesh
+    ,cache
+    ,export
     ,Part
     ,PartSection
     ,calculator
+    ,cutorder
+    ,directions
     ,kerf
+    ,loader as geometry_loader
+    ,nesting
+    ,overlay
+    ,profiling
+    ,service
+    ,vertexstore
 )
 
 def load_tests(loader, tests, ignore):
@@ -20,4 +30,14 @@ def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(calculator))
     tests.addTests(doctest.DocTestSuite(Mesh))
     tests.addTests(doctest.DocTestSuite(kerf))
+    tests.addTests(doctest.DocTestSuite(geometry_loader))
+    tests.addTests(doctest.DocTestSuite(cache))
+    tests.addTests(doctest.DocTestSuite(export))
+    tests.addTests(doctest.DocTestSuite(vertexstore))
+    tests.addTests(doctest.DocTestSuite(overlay))
+    tests.addTests(doctest.DocTestSuite(nesting))
+    tests.addTests(doctest.DocTestSuite(cutorder))
+    tests.addTests(doctest.DocTestSuite(directions))
+    tests.addTests(doctest.DocTestSuite(profiling))
+    tests.addTests(doctest.DocTestSuite(service))
     return tests
@@ -0,0 +1,154 @@
+"""
+Module, defining a memory-mapped backing store for mesh vertex coordinates
+
+Vertices are kept in a raw file of float64 x,y,z triplets & opened with
+numpy.memmap, so only the pages being read are held in memory. Bounds are
+computed over fixed-size chunks of rows, so models with more vertices than
+fit in RAM can still be measured.
+
+this file is a part of pymoldmaker
+
+Copyright (C) 2015-2016 Brandon J. Van Vaerenbergh
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+
+import numpy
+
+DTYPE = numpy.float64
+""" numpy data type of the stored coordinates """
+
+DEFAULT_CHUNK_ROWS = 1024**2
+""" default number of vertices read at once (24 MiB of float64 x,y,z) """
+
+class VertexStore:
+    """
+    object representing a raw file of float64 x,y,z vertex coordinates
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as directory:
+    ...    path = os.path.join(directory, 'vertices.f64')
+    ...    VertexStore.write(path, [[[0,5,1], [2,-1,0]], numpy.empty((0,3)), [[1,1,9]]])
+    ...    store = VertexStore(path)
+    ...    len(store), store[1:].tolist()
+    ...    store.bounds(chunk_rows=2).tolist()
+    ...    del store # (release the mapped file, before its directory is removed)
+    [(0, 2), (2, 2), (2, 3)]
+    (3, [[2.0, -1.0, 0.0], [1.0, 1.0, 9.0]])
+    [[0.0, -1.0, 0.0], [2.0, 5.0, 9.0]]
+    """
+
+    def __init__(self, path):
+        """
+        Open the vertex file at path (read-only)
+        """
+        self.path = path
+        if os.path.getsize(path):
+            self.vertices = numpy.memmap(path, dtype=DTYPE, mode='r').reshape(-1, 3)
+        else: # (an empty file cannot be mapped)
+            self.vertices = numpy.empty((0, 3), dtype=DTYPE)
+        """ (N,3) numpy array of the stored coordinates, backed by the file """
+
+    @staticmethod
+    def write(path, vertex_arrays, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Saves vertex_arrays to a new vertex file at path, one chunk at a time
+
+        Returns list of (start, stop) row ranges: where each of vertex_arrays
+        (a list of (N,3) array-likes) is found in the stored vertices.
+        """
+        row_ranges = []
+        row_count = 0
+        with open(path, 'wb') as vertex_file:
+            for vertices in vertex_arrays:
+                vertices = numpy.reshape(vertices, (-1, 3))
+                for chunk in iter_chunks(vertices, chunk_rows):
+                    numpy.asarray(chunk, dtype=DTYPE).tofile(vertex_file)
+                row_ranges.append((row_count, row_count+len(vertices)))
+                row_count += len(vertices)
+        return row_ranges
+
+    def __len__(self):
+        """ returns number of stored vertices """
+        return len(self.vertices)
+
+    def __getitem__(self, index):
+        """ returns stored vertices, selected by index (as a numpy array) """
+        return self.vertices[index]
+
+    def bounds(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """ returns 2x3 numpy array, the minimum & maximum stored x,y,z coords
+        (see: array_bounds)"""
+        return array_bounds([self.vertices], chunk_rows)
+
+def iter_chunks(vertices, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Yields consecutive slices of at most chunk_rows rows, of vertices
+
+    >>> [chunk.tolist() for chunk in iter_chunks(numpy.arange(3), 2)]
+    [[0, 1], [2]]
+    """
+    for start in range(0, len(vertices), chunk_rows):
+        yield vertices[start:start+chunk_rows]
+
+def array_bounds(vertex_arrays, chunk_rows=DEFAULT_CHUNK_ROWS, matrix=None):
+    """
+    Returns 2x3 numpy array of the minimum (row 0) & maximum (row 1) x,y,z
+    coordinates, among all (N,3) numpy arrays in vertex_arrays
+
+    matrix -- (optional) 4x4 numpy array: bound the vertices transformed by it
+
+    Each array is reduced chunk_rows rows at a time, so a memory-mapped array
+    is never read into memory all at once. Returns None, if there are no
+    vertices.
+
+    >>> array_bounds([numpy.array([[0,5,1], [2,-1,0]]), numpy.empty((0,3))]).tolist()
+    [[0, -1, 0], [2, 5, 1]]
+    >>> array_bounds([numpy.empty((0,3))]) is None
+    True
+    >>> rotate_z = numpy.array([[0,-1,0,0], [1,0,0,0], [0,0,1,0], [0,0,0,1]])
+    >>> array_bounds([numpy.array([[1,0,0], [1,1,0]])], matrix=rotate_z).tolist()
+    [[-1, 1, 0], [0, 1, 0]]
+    """
+    minimum = maximum = None
+    for vertices in vertex_arrays:
+        for chunk in iter_chunks(vertices, chunk_rows):
+            if matrix is not None:
+                chunk = numpy.dot(chunk, numpy.transpose(matrix[:3, :3])) + matrix[:3, 3]
+            chunk_minimum, chunk_maximum = chunk.min(axis=0), chunk.max(axis=0)
+            if minimum is None:
+                minimum, maximum = chunk_minimum, chunk_maximum
+            else:
+                minimum = numpy.minimum(minimum, chunk_minimum)
+                maximum = numpy.maximum(maximum, chunk_maximum)
+    if minimum is None:
+        return None
+    return numpy.array([minimum, maximum])
+
+def transform_bounds(bounds, matrix):
+    """
+    Returns 2x3 numpy array, the bounds of the box corners of 2x3 bounds
+    transformed by the 4x4 numpy array matrix
+
+    (exactly the bounds of the transformed vertices, when matrix keeps boxes
+    aligned to the axes)
+
+    >>> flip_x = numpy.diag([-1., 1, 1, 1]); flip_x[0,3] = 5
+    >>> transform_bounds(numpy.array([[1,2,3], [4,5,6]]), flip_x).tolist()
+    [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]]
+    """
+    corners = numpy.array(numpy.meshgrid(*numpy.transpose(bounds))).reshape(3, -1).T
+    corners = numpy.dot(corners, numpy.transpose(matrix[:3, :3])) + matrix[:3, 3]
+    return numpy.array([corners.min(axis=0), corners.max(axis=0)])
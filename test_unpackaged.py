@@ -2,12 +2,14 @@
 Simple module defining unittest2 testcases for project doctests
 """
 import doctest
-import vector, image
+import vector
+from benchmark import synthetic, suite
 
 def load_tests(loader, tests, ignore):
     """
     add doctests for this package
     """
     tests.addTests(doctest.DocTestSuite(vector))
-    tests.addTests(doctest.DocTestSuite(image))
+    tests.addTests(doctest.DocTestSuite(synthetic))
+    tests.addTests(doctest.DocTestSuite(suite))
     return tests
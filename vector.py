@@ -17,9 +17,378 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-from image import Canvas
 from calculator.calculator import Calculator
+from calculator.cache import MeshCache
+from calculator import profiling, service
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
 import argparse
+import asyncio
+import glob
+import io
+import os
+import sys
+import time
+from urllib.request import pathname2url
+
+BATCH_OUTPUT_SUFFIX = '.out.dae'
+""" file name ending of outputs written by batch mode, next to each input """
+
+DRAWING_FORMATS = ('svg', 'dxf', 'eps')
+""" file formats parts can be drawn in (see: calculator.export) """
+
+WATCH_INTERVAL_S = 0.05
+""" seconds between checks of the watched files, in watch mode """
+
+def generate(input_file, out_file, thickness_mm, workers=1, overlay=False
+             ,reference=False, cache_dir=None, drawings_dir=None
+             ,drawing_formats=('svg',), sheet_sizes=None, sheet_margin_mm=0.0):
+    """ prints cutlist for a COLLADA model & saves it, with part outlines, to
+        out_file.
+
+    overlay -- if True, save only the part outlines (see: Calculator.save).
+      The model is then loaded read-only, from cache_dir if given (see:
+      calculator.cache.MeshCache)
+    cache_dir -- (optional) directory to cache the compiled directions (&
+      the model, if overlay) in (see: calculator.directions)
+    reference -- if True, the overlay file refers to input_file, to show the
+      model with the outlines
+    drawings_dir -- (optional) directory to save a vector drawing of each
+      part to, in each of drawing_formats (see: Calculator.save_drawings)
+    sheet_sizes -- (optional, with drawings_dir) list of (width mm, height mm)
+      stock sheet sizes: the parts' sections are also nested onto sheets, &
+      a drawing of each sheet saved (see: Calculator.save_sheet_drawings)
+    """
+    ## import a simple Sketchup COLLADA file
+    mold_generator = load_calculator(input_file, overlay, cache_dir)
+    ## set the thickness
+    mold_generator.material = dict(mold_generator.material
+                                   ,thickness_mm=thickness_mm)
+    mold_generator.workers = workers
+    save_outputs(mold_generator, input_file, out_file, overlay, reference
+                 ,drawings_dir, drawing_formats, sheet_sizes, sheet_margin_mm)
+
+def generate_sweep(input_file, out_file, thicknesses_mm, kerfs_mm, workers=1
+                   ,overlay=False, reference=False, cache_dir=None, drawings_dir=None
+                   ,**options):
+    """ prints cutlists for a COLLADA model cut from materials of each of
+        thicknesses_mm & kerfs_mm, & saves each with part outlines.
+
+    The model is loaded & measured once, for all the variants. Each variant's
+    parts are generated by a pool of workers processes, & its outputs saved
+    next to out_file (see: variant_output_path), & to a subdirectory of
+    drawings_dir named after the variant.
+
+    options -- keyword arguments for generate (drawing_formats, sheet_sizes,
+      sheet_margin_mm)
+
+    Returns: list of the variants' output file paths
+
+    >>> from tempfile import TemporaryDirectory
+    >>> from contextlib import redirect_stdout
+    >>> cutlists = io.StringIO()
+    >>> with TemporaryDirectory() as directory, redirect_stdout(cutlists):
+    ...    paths = generate_sweep('test/cube_flipped.dae', directory + '/out.dae'
+    ...                           ,[6, 3], [0.4], workers=2)
+    ...    saved = sorted(os.listdir(directory))
+    >>> saved
+    ['out.3mm-kerf0.4mm.dae', 'out.6mm-kerf0.4mm.dae']
+    >>> [line for line in cutlists.getvalue().splitlines() if line.startswith('# Variant')]
+    ['# Variant: 6 mm thick, 0.4 mm kerf', '# Variant: 3 mm thick, 0.4 mm kerf']
+    """
+    mold_generator = load_calculator(input_file, overlay, cache_dir)
+    materials = [dict(mold_generator.material, thickness_mm=thickness_mm, kerf_mm=kerf_mm)
+                 for thickness_mm in thicknesses_mm for kerf_mm in kerfs_mm]
+    paths = []
+    for material in mold_generator.iter_variants(materials, workers):
+        print('# Variant: {:g} mm thick, {:g} mm kerf'.format(
+            material['thickness_mm'], material['kerf_mm']))
+        variant_out = variant_output_path(out_file, material)
+        variant_drawings_dir = None
+        if drawings_dir:
+            variant_drawings_dir = os.path.join(drawings_dir, variant_name(material))
+        # (outlines are removed once saved, so the next variant's are saved
+        # with the model alone)
+        save_outputs(mold_generator, input_file, variant_out, overlay, reference
+                     ,variant_drawings_dir, keep_lines=False, **options)
+        paths.append(variant_out)
+    return paths
+
+class Watcher:
+    """
+    object representing a model & its directions file, whose outputs are
+    generated again whenever either is saved (see: watch)
+
+    Only a changed model is loaded again; after a change to the directions
+    file, only the Parts of changed entries are built again (see:
+    Calculator.generateParts).
+
+    >>> from tempfile import TemporaryDirectory
+    >>> import shutil
+    >>> with TemporaryDirectory() as directory, redirect_stdout(io.StringIO()) as log:
+    ...    for name in ('cube_flipped.dae', 'cube_flipped.py'):
+    ...        _ = shutil.copy('test/' + name, directory)
+    ...    watcher = Watcher(directory + '/cube_flipped.dae', directory + '/out.dae', 6)
+    ...    polls = [watcher.poll(), watcher.poll()]
+    ...    with open(directory + '/cube_flipped.py', 'a') as directions:
+    ...        _ = directions.write('# edited')
+    ...    polls.append(watcher.poll())
+    >>> polls
+    [True, False, True]
+    >>> [line.split(' in ')[0] for line in log.getvalue().splitlines() if line.startswith('# Regenerated')]
+    ['# Regenerated', '# Regenerated']
+    >>> watcher.mold_generator.rebuilt_part_names
+    []
+    """
+    def __init__(self, input_file, out_file, thickness_mm, workers=1, overlay=False
+                 ,cache_dir=None, **options):
+        """ (arguments: see generate) """
+        self.input_file = input_file
+        self.out_file = out_file
+        self.thickness_mm = thickness_mm
+        self.workers = workers
+        self.overlay = overlay
+        self.cache_dir = cache_dir
+        self.options = options
+        self.mold_generator = None
+        self.stamps = None
+        # (model, directions file) stamps, when outputs were last generated
+
+    def poll(self):
+        """ generates outputs again, if the model or directions file changed
+            since they were last generated. Returns True if it did """
+        stamps = (watched_stamp(self.input_file)
+                  ,watched_stamp(os.path.splitext(self.input_file)[0] + '.py'))
+        if stamps == self.stamps:
+            return False
+        model_changed = self.stamps is None or stamps[0] != self.stamps[0]
+        self.stamps = stamps
+        start = time.perf_counter()
+        try:
+            if model_changed or self.mold_generator is None:
+                self.mold_generator = load_calculator(self.input_file, self.overlay
+                                                      ,self.cache_dir)
+                self.mold_generator.material = dict(self.mold_generator.material
+                                                    ,thickness_mm=self.thickness_mm)
+                self.mold_generator.workers = self.workers
+            else:
+                self.mold_generator.reload_directions()
+            self.mold_generator.rebuilt_part_names = [] # (if nothing changed)
+            # (outlines are removed once saved, so the next outputs are saved
+            # with the model alone)
+            save_outputs(self.mold_generator, self.input_file, self.out_file
+                         ,self.overlay, keep_lines=False, **self.options)
+        except Exception as e:
+            # (e.g. a directions file saved mid-edit: report, & keep watching)
+            print('# Error: {}: {}'.format(type(e).__name__, e), flush=True)
+            return True
+        print('# Regenerated in {:.0f} ms ({} of {} parts built)'.format(
+            1000*(time.perf_counter() - start)
+            ,len(self.mold_generator.rebuilt_part_names)
+            ,len(self.mold_generator.directions)), flush=True)
+        return True
+
+def watch(input_file, out_file, thickness_mm, workers=1, interval_s=WATCH_INTERVAL_S
+          ,**options):
+    """ generates outputs like generate, then again each time the model or
+        its directions file is saved, until interrupted (see: Watcher) """
+    watcher = Watcher(input_file, out_file, thickness_mm, workers, **options)
+    while True:
+        watcher.poll()
+        time.sleep(interval_s)
+
+def watched_stamp(file_path):
+    """ returns calculator.service.file_stamp of file_path, or None if there
+        is no such file """
+    try:
+        return service.file_stamp(file_path)
+    except FileNotFoundError:
+        return None
+
+def load_calculator(input_file, overlay=False, cache_dir=None):
+    """ returns Calculator for a COLLADA model: read-only if overlay. Its
+        compiled directions (& the model, if overlay) are loaded from
+        cache_dir if given (see: calculator.cache.MeshCache) """
+    cache = MeshCache(cache_dir) if cache_dir else None
+    return Calculator(input_file, writable=not overlay, cache=cache)
+
+def save_outputs(mold_generator, input_file, out_file, overlay=False, reference=False
+                 ,drawings_dir=None, drawing_formats=('svg',), sheet_sizes=None
+                 ,sheet_margin_mm=0.0, keep_lines=True):
+    """ prints the cutlist of Calculator mold_generator & saves its outputs
+        (see: generate. keep_lines: see Calculator.save) """
+    reference_url = None
+    if overlay and reference:
+        reference_url = model_reference_url(input_file, out_file)
+    mold_generator.save(out_file, overlay, reference_url, keep_lines)
+    if drawings_dir:
+        extensions = ['.' + name for name in drawing_formats]
+        mold_generator.save_drawings(drawings_dir, extensions)
+        if sheet_sizes:
+            mold_generator.save_sheet_drawings(drawings_dir, sheet_sizes, extensions
+                                               ,sheet_margin_mm)
+
+def sheet_size(text):
+    """
+    Returns (width mm, height mm) of a stock sheet, from text "<W>x<H>"
+
+    >>> sheet_size('1220x2440'), sheet_size('600.5 X 300')
+    ((1220.0, 2440.0), (600.5, 300.0))
+    >>> sheet_size('1220')
+    Traceback (most recent call last):
+       ...
+    argparse.ArgumentTypeError: expected <width>x<height> in mm, not: 1220
+    """
+    try:
+        width_mm, height_mm = (float(value) for value in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected <width>x<height> in mm, not: {}'.format(text))
+    return width_mm, height_mm
+
+def variant_name(material):
+    """
+    Returns name of a sweep variant, for material
+
+    >>> variant_name({'thickness_mm': 6, 'kerf_mm': 0.25})
+    '6mm-kerf0.25mm'
+    """
+    return '{:g}mm-kerf{:g}mm'.format(material['thickness_mm'], material['kerf_mm'])
+
+def variant_output_path(out_file, material):
+    """
+    Returns path a sweep saves the output for material to, next to out_file
+
+    >>> variant_output_path('models/out.dae', {'thickness_mm': 3, 'kerf_mm': 0.4})
+    'models/out.3mm-kerf0.4mm.dae'
+    """
+    base, extension = os.path.splitext(out_file)
+    return '{}.{}{}'.format(base, variant_name(material), extension)
+
+def mm_list(text):
+    """
+    Returns list of mm values, from comma-separated text
+
+    >>> mm_list('3,6.5')
+    [3.0, 6.5]
+    >>> mm_list('3,six')
+    Traceback (most recent call last):
+       ...
+    argparse.ArgumentTypeError: expected comma-separated mm values, not: 3,six
+    """
+    try:
+        return [float(value) for value in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected comma-separated mm values, not: {}'.format(text))
+
+def model_reference_url(input_file, out_file):
+    """
+    Returns URL of input_file, relative to the directory of out_file
+
+    >>> model_reference_url('models/positive_for_mold.dae', 'models/out.dae')
+    'positive_for_mold.dae'
+    >>> model_reference_url('my models/a.dae', 'out.dae')
+    'my%20models/a.dae'
+    """
+    out_directory = os.path.dirname(os.path.abspath(out_file))
+    return pathname2url(os.path.relpath(os.path.abspath(input_file), out_directory))
+
+def find_batch_inputs(pattern):
+    """
+    Returns sorted list of COLLADA model paths, for a directory or glob
+
+    Outputs of a previous batch run are excluded.
+
+    >>> find_batch_inputs('test')
+    ['test/cube.dae', 'test/cube_flipped.dae']
+    >>> find_batch_inputs('test/*flipped.dae')
+    ['test/cube_flipped.dae']
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.[dD][aA][eE]')
+    return sorted(path for path in glob.glob(pattern)
+                  if not path.endswith(BATCH_OUTPUT_SUFFIX))
+
+def batch_output_path(input_file):
+    """
+    Returns path batch mode saves a model's output to, next to the input
+
+    >>> batch_output_path('models/positive_for_mold.dae')
+    'models/positive_for_mold.out.dae'
+    """
+    extension_length = 4 # ".dae", ".DAE", etc.
+    return input_file[:-1*extension_length] + BATCH_OUTPUT_SUFFIX
+
+def generate_batch_job(input_file, thickness_mm, profile=False, **options):
+    """ runs generate for one model of a batch, in a worker process.
+
+    profile -- if True, profile the job (see: calculator.profiling)
+    options -- keyword arguments for generate (overlay, reference, cache_dir,
+      drawings_dir, drawing_formats). Drawings are saved to a subdirectory
+      of drawings_dir, named after the model.
+
+    Returns: (cutlist text, seconds taken, error message or None, profiling
+      report or None) tuple
+    """
+    if profile:
+        profiling.reset()
+        profiling.enable()
+    start = time.perf_counter()
+    if options.get('drawings_dir'):
+        model_name = os.path.splitext(os.path.basename(input_file))[0]
+        options = dict(options
+                       ,drawings_dir=os.path.join(options['drawings_dir'], model_name))
+    cutlist = io.StringIO()
+    error = None
+    try:
+        with redirect_stdout(cutlist):
+            generate(input_file, batch_output_path(input_file), thickness_mm
+                     ,**options)
+    except Exception as e:
+        error = '{}: {}'.format(type(e).__name__, e)
+    seconds = time.perf_counter() - start
+    report = None
+    if profile:
+        profiling.disable()
+        report = profiling.report()
+    return cutlist.getvalue(), seconds, error, report
+
+def generate_batch(pattern, thickness_mm, workers=1, **options):
+    """ generates outputs for every COLLADA model in a directory or glob.
+
+    Models are processed by a pool of worker processes; each model's cutlist
+    is printed in input order, followed by a summary of timings & failures.
+
+    options -- keyword arguments for generate_batch_job. (If profile is
+      True, each job's profiling report is merged into this process's, see:
+      calculator.profiling.merge)
+
+    Returns: number of models that failed
+    """
+    input_files = find_batch_inputs(pattern)
+    start = time.perf_counter()
+    job = partial(generate_batch_job, thickness_mm=thickness_mm, **options)
+    with ProcessPoolExecutor(max(1, workers)) as executor:
+        results = []
+        for input_file, result in zip(input_files, executor.map(job, input_files)):
+            cutlist, seconds, error, report = result
+            if report is not None:
+                profiling.merge(report)
+            print(cutlist, end='')
+            results.append((input_file, seconds, error))
+    failures = [input_file for input_file, seconds, error in results if error]
+    print('# Batch summary')
+    for input_file, seconds, error in results:
+        if error:
+            outcome = 'FAILED ({})'.format(error)
+        else:
+            outcome = batch_output_path(input_file)
+        print(' * {} ({:.2f} s): {}'.format(input_file, seconds, outcome))
+    print('{} models, {} failed, {:.2f} s total'.format(
+        len(results), len(failures), time.perf_counter() - start))
+    return len(failures)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -29,21 +398,104 @@ if __name__ == '__main__':
         material positive will be cut from.", type=int, default=6)
     parser.add_argument("--out", help="file path to output"
         , default='out.dae')
+    parser.add_argument("--workers", help="(optional) number of processes to \
+        generate parts (or, in batch mode, models) with.", type=int, default=1)
+    parser.add_argument("--batch", help="(optional) directory or glob of \
+        COLLADA input models, to process instead of --input. Each output is \
+        saved next to its input, as <name>{}".format(BATCH_OUTPUT_SUFFIX))
+    parser.add_argument("--sweep-thickness-mm", help="(optional) comma-separated \
+        material thicknesses, e.g. 3,6: save a cutlist & output for each, \
+        loading the model only once. Outputs are saved next to --out, as \
+        <name>.<thickness>mm-kerf<kerf>mm.dae", type=mm_list)
+    parser.add_argument("--sweep-kerf-mm", help="(optional) comma-separated \
+        cutting kerfs to sweep, e.g. 0.2,0.4 (with each thickness)", type=mm_list)
+    parser.add_argument("--serve", help="(optional) run as a daemon instead, \
+        keeping recently used models loaded & running JSON jobs sent to the \
+        Unix socket SERVE (see: calculator.service). Use - for: {}".format(
+        service.default_socket_path()))
+    parser.add_argument("--warm-models", help="(optional, with --serve) number \
+        of models to keep loaded (default: {})".format(service.DEFAULT_CAPACITY)
+        , type=int, default=service.DEFAULT_CAPACITY)
+    parser.add_argument("--watch", help="(optional) keep running, & generate \
+        the outputs again each time the input model or its directions .py \
+        file is saved (only the changed parts are built again)."
+        , action='store_true')
+    parser.add_argument("--overlay", help="(optional) save only the part \
+        outlines to the output, instead of the input model with outlines \
+        added.", action='store_true')
+    parser.add_argument("--reference", help="(optional, with --overlay) \
+        make the output refer to the input model file, to show the model with \
+        the outlines.", action='store_true')
+    parser.add_argument("--profile-json", help="(optional) file path to save \
+        timings of each stage of the run & counts of the work done in them \
+        to, as JSON. (Parts generated by other --workers are not profiled)")
+    parser.add_argument("--cache-dir", help="(optional) directory to cache \
+        compiled parts descriptions (& with --overlay, parsed input models) \
+        in, for faster reruns.")
+    parser.add_argument("--drawings", help="(optional) directory to save a \
+        vector drawing of each part's sections to, in mm.")
+    parser.add_argument("--drawing-formats", help="(optional) comma-separated \
+        file formats of the --drawings, from: {} (default: svg)".format(
+        ', '.join(DRAWING_FORMATS)), default='svg')
+    parser.add_argument("--sheet", help="(optional, with --drawings) \
+        <width>x<height> in mm of a stock sheet to nest the parts' sections \
+        onto, e.g. 1220x2440. Repeat for more sizes: new sheets are the \
+        first size the next section fits on.", type=sheet_size
+        , action='append', dest='sheets')
+    parser.add_argument("--sheet-margin-mm", help="(optional) gap to leave \
+        along the edges of each --sheet.", type=float, default=0.0)
     args = parser.parse_args()
-    input_file = args.input
-    ## import a simple Sketchup COLLADA file
-    mold_generator = Calculator(input_file)
-    ## set the thickness
-    mold_generator.material['thickness_mm'] = args.thickness_mm
-    ## test a modification to the file & resave
-    file_new = args.out
-    mold_generator.save(file_new)
-    ## test exporting to EPS
-    img = Canvas()
-    poly_line_mm = (  (80,80),(320,80)
-                             ,(320,90)
-                     ,(80,120)
-                     ,(80,80)
-                             )
-    img.draw_line( poly_line_mm)
-    img.save('vector_mm_box.eps')
+    if args.sheets and not args.drawings:
+        parser.error('--sheet requires --drawings')
+    drawing_formats = args.drawing_formats.lower().split(',')
+    for name in drawing_formats:
+        if name not in DRAWING_FORMATS:
+            parser.error('unsupported drawing format: {}'.format(name))
+    options = dict(overlay=args.overlay, reference=args.reference
+                   ,cache_dir=args.cache_dir, drawings_dir=args.drawings
+                   ,drawing_formats=drawing_formats, sheet_sizes=args.sheets
+                   ,sheet_margin_mm=args.sheet_margin_mm)
+    if args.serve:
+        socket_path = args.serve
+        if socket_path == '-':
+            socket_path = service.default_socket_path()
+        cache = MeshCache(args.cache_dir) if args.cache_dir else None
+        daemon = service.CutlistService(args.warm_models, cache=cache)
+        print('Serving on: {}'.format(socket_path), flush=True)
+        try:
+            asyncio.run(daemon.serve_forever(socket_path))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+        sys.exit(0)
+    sweep = args.sweep_thickness_mm or args.sweep_kerf_mm
+    if sweep and args.batch:
+        parser.error('--sweep-thickness-mm & --sweep-kerf-mm cannot be used with --batch')
+    if args.watch and (sweep or args.batch):
+        parser.error('--watch cannot be used with --batch or a sweep')
+    if args.watch:
+        try:
+            watch(args.input, args.out, args.thickness_mm, args.workers, **options)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+    if args.batch:
+        failures = generate_batch(args.batch, args.thickness_mm, args.workers
+                                  ,profile=bool(args.profile_json), **options)
+        if args.profile_json:
+            profiling.write_json(args.profile_json)
+        sys.exit(1 if failures else 0)
+    if args.profile_json:
+        profiling.enable()
+    if sweep:
+        generate_sweep(args.input, args.out
+                       ,args.sweep_thickness_mm or [args.thickness_mm]
+                       ,args.sweep_kerf_mm or [Calculator.material['kerf_mm']]
+                       ,args.workers, **options)
+    else:
+        ## test a modification to the file & resave
+        generate(args.input, args.out, args.thickness_mm, args.workers, **options)
+    if args.profile_json:
+        profiling.write_json(args.profile_json)